@@ -0,0 +1,179 @@
+"""
+HTTP API for POS terminals and batch integrations, over the same databases as the app.
+
+    python api.py --port 8080 [--store ID | --db PATH]
+
+    GET  /health
+    GET  /stock?product=NAME&product=NAME    stock levels of these products
+    GET  /stock?search=TERM&limit=N          ... of products matching TERM (or the first N)
+    POST /stock/lookup                       {"products": [NAME, ...]}
+    GET  /low-stock                          products at or below their reorder point
+    POST /restocks                           {"restocks": [{"product", "quantity", "unit_cost", "price"}, ...],
+                                              "update_prices": false}
+    POST /sales                              {"orders": [{"lines": [{"product", "quantity"}, ...],
+                                                          "customer_name", "customer_mobile", "date_of_sale"}, ...]}
+
+Every endpoint also takes ?store=ID. Restocks are all-or-nothing; every order in a sales
+batch is recorded or refused on its own and gets its own result. Bad requests answer 400
+with {"error": ...}.
+"""
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from db_manager import get_pool
+from sale_queue import WRITE_BEHIND, get_sale_queue
+from services import ShopService
+from stores import DEFAULT_STORE, list_stores, store_db
+
+# Requests wait for SQLite on these threads, so the event loop keeps accepting connections.
+# Writes queue for a single thread of their own: SQLite takes one writer at a time anyway,
+# and a writer waiting in busy_timeout backs off in sleeps far longer than a write takes.
+WORKERS = 8
+MAX_ITEMS = 1000
+MAX_LIMIT = 1000
+
+
+def _run(db_name, work):
+    pool = get_pool(db_name)
+    conn = pool.acquire()
+    try:
+        return work(ShopService(conn.cursor()))
+    finally:
+        pool.release(conn)
+
+
+def _items(body, key):
+    items = body.get(key) if isinstance(body, dict) else None
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError(f"Expected {{\"{key}\": [...]}} with an object per item")
+    if len(items) > MAX_ITEMS:
+        raise ValueError(f"At most {MAX_ITEMS} {key} per request, got {len(items)}")
+    return items
+
+
+def _field(item, name):
+    if name not in item:
+        raise ValueError(f"Missing field {name!r} in {item}")
+    return item[name]
+
+
+@web.middleware
+async def bad_requests(request, handler):
+    try:
+        return await handler(request)
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+
+
+class ShopAPI:
+    def __init__(self, db_name, workers=WORKERS):
+        self.db_name = db_name
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="api-writer")
+
+    def app(self):
+        app = web.Application(middlewares=[bad_requests])
+        app.add_routes([web.get("/health", self.health),
+                        web.get("/stock", self.stock),
+                        web.post("/stock/lookup", self.lookup),
+                        web.get("/low-stock", self.low_stock),
+                        web.post("/restocks", self.restocks),
+                        web.post("/sales", self.sales)])
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        return app
+
+    async def start(self, app):
+        if WRITE_BEHIND:
+            # Replays sales journaled before a crash straight away. Only opened if no other process (e.g. the
+            # Streamlit app) holds the journal; otherwise API sales are committed directly.
+            await asyncio.get_running_loop().run_in_executor(self._executor, get_sale_queue, self.db_name)
+
+    async def stop(self, app):
+        self._executor.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+
+    def _db_name(self, request):
+        store_id = request.query.get("store")
+        if store_id is None:
+            return self.db_name
+        if store_id not in list_stores():
+            raise web.HTTPNotFound(text=f"No store {store_id!r}")
+        return store_db(store_id)
+
+    async def call(self, request, work, write=False):
+        return await asyncio.get_running_loop().run_in_executor(self._writer if write else self._executor, _run,
+                                                                self._db_name(request), work)
+
+    async def health(self, request):
+        return web.json_response({"status": "ok"})
+
+    async def _stock_response(self, request, product_names):
+        products = await self.call(request, lambda service: service.stock(product_names=product_names))
+        found = {product["product_name"] for product in products}
+        return web.json_response({"products": products,
+                                  "missing": [name for name in product_names if name not in found]})
+
+    async def stock(self, request):
+        product_names = request.query.getall("product", [])
+        if product_names:
+            return await self._stock_response(request, product_names)
+        try:
+            limit = min(int(request.query.get("limit", 100)), MAX_LIMIT)
+        except ValueError:
+            raise ValueError("limit must be a whole number") from None
+        search = request.query.get("search")
+        return web.json_response({"products": await self.call(request, lambda service: service.stock(
+            search=search, limit=limit))})
+
+    async def lookup(self, request):
+        body = await request.json()
+        product_names = body.get("products") if isinstance(body, dict) else None
+        if (not isinstance(product_names, list) or len(product_names) > MAX_ITEMS
+                or not all(isinstance(name, str) for name in product_names)):
+            raise ValueError(f"Expected {{\"products\": [...]}} with at most {MAX_ITEMS} names")
+        return await self._stock_response(request, product_names)
+
+    async def low_stock(self, request):
+        return web.json_response({"products": await self.call(request, lambda service: service.low_stock())})
+
+    async def restocks(self, request):
+        body = await request.json()
+        items = [(_field(item, "product"), _field(item, "quantity"), item.get("unit_cost"), item.get("price"))
+                 for item in _items(body, "restocks")]
+        update_prices = bool(body.get("update_prices"))
+        product_ids = await self.call(request, lambda service: service.restock(items, update_prices), write=True)
+        return web.json_response({"product_ids": product_ids}, status=201)
+
+    async def sales(self, request):
+        orders = []
+        for order in _items(await request.json(), "orders"):
+            lines = _field(order, "lines")
+            if not isinstance(lines, list) or not all(isinstance(line, dict) for line in lines):
+                raise ValueError("An order's lines must be a list of objects")
+            orders.append(([(_field(line, "product"), _field(line, "quantity")) for line in lines],
+                           order.get("customer_name"), order.get("customer_mobile"), order.get("date_of_sale")))
+        results = await self.call(request, lambda service: service.record_sales(orders), write=True)
+        refused = sum("error" in result for result in results)
+        return web.json_response({"recorded": len(results) - refused, "refused": refused, "results": results})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--store", help="the store to serve when a request names none")
+    parser.add_argument("--db", help="serve this database file instead of a store")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    db_name = args.db or store_db(args.store or DEFAULT_STORE)
+    get_pool(db_name)
+    web.run_app(ShopAPI(db_name, args.workers).app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
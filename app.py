@@ -15,54 +15,190 @@ Dashboard: Get insightful visualizations of your sales data with interactive gra
 
 
 """
+import os
+
 import streamlit as st
 
-from data_importer import DataImporter
 from db_manager import DBManager
-from sales_manager import SalesManager
-from stock_manager import StockManager
+from jobs import ACTIVE, get_runner
+from managers import get_manager
+from query_cache import query_cache
+from query_stats import query_stats
+from sale_queue import WRITE_BEHIND, get_sale_queue
+from stores import DEFAULT_STORE, create_store, list_stores, store_db
+
+
+def choose_store():
+    # Each store works on its own database; SHOP_STORE picks the store selected at first
+    stores = list_stores()
+    default = os.environ.get("SHOP_STORE", DEFAULT_STORE)
+    store_id = st.sidebar.selectbox("Store", stores, index=stores.index(default) if default in stores else 0)
+    with st.sidebar.expander("New store"):
+        new_store = st.text_input("Store id")
+        if st.button("Create store"):
+            try:
+                create_store(new_store.strip())
+            except ValueError as e:
+                st.error(f"An error occurred while creating the store: {e}")
+            else:
+                st.rerun()
+    return store_id
+
+
+def show_diagnostics():
+    with st.sidebar.expander("Diagnostics"):
+        stats = query_cache.stats()
+        st.write(f"**Query cache:** {stats['hits']:,} hits / {stats['misses']:,} misses "
+                 f"({stats['hit_ratio']:.0%} hit ratio)")
+        st.write(f"**Entries:** {stats['entries']:,} using {stats['bytes'] / 1024 / 1024:.1f} MB "
+                 f"of {stats['max_bytes'] / 1024 / 1024:.0f} MB, {stats['evictions']:,} evicted")
+        st.write("**Table generations:**", stats["generations"])
+        if st.button("Clear query cache"):
+            query_cache.clear()
+
+
+def show_performance(db):
+    import pandas as pd
+
+    st.header("Query Performance")
+    query_stats.slow_query_ms = st.number_input("Slow query threshold (ms)", min_value=0.0,
+                                                value=float(query_stats.slow_query_ms), step=10.0)
+
+    stats = query_stats.snapshot()
+    if stats:
+        df = pd.DataFrame([(sql, entry["calls"], entry["rows"], entry["total_ms"],
+                            entry["total_ms"] / entry["calls"], query_stats.percentile(entry, 0.5),
+                            query_stats.percentile(entry, 0.95), entry["max_ms"])
+                           for sql, entry in stats.items()],
+                          columns=["Statement", "Calls", "Rows", "Total ms", "Mean ms", "p50 ms <=", "p95 ms <=",
+                                   "Max ms"])
+        st.dataframe(df.sort_values("Total ms", ascending=False), hide_index=True, width="stretch")
+    else:
+        st.write("No statements recorded yet.")
+
+    st.subheader("Slow Queries")
+    if query_stats.slow_log:
+        for entry in reversed(query_stats.slow_log):
+            with st.expander(f"{entry['time']} | {entry['ms']:.1f} ms | {entry['rows']:,} rows | {entry['sql'][:80]}"):
+                st.code(entry["sql"], language="sql")
+                st.code("\n".join(entry["plan"]) or "(no plan)")
+    else:
+        st.write("No statements over the threshold.")
+
+    dump_col, reset_col = st.columns(2)
+    if dump_col.button("Write metrics files"):
+        json_path, prom_path = query_stats.dump()
+        dump_col.success(f"Wrote {json_path} and {prom_path}")
+    if reset_col.button("Reset statistics"):
+        query_stats.reset()
+        st.rerun()
+
+
+def show_jobs(db):
+    st.header("Background Jobs")
+    runner = get_runner(db.pool.db_name)
+    active = any(job[3] in ACTIVE for job in runner.jobs())
+
+    # Re-runs on its own every two seconds while any job is still queued or running
+    @st.fragment(run_every=2 if active else None)
+    def job_list():
+        jobs = runner.jobs()
+        if not jobs:
+            st.write("No jobs yet.")
+            return
+        for (job_id, kind, label, status, progress, message, result_path, result_name, result_mime, error,
+             created_at, started_at, finished_at) in jobs:
+            with st.container(border=True):
+                st.write(f"**#{job_id} {label}** ({kind}) | {status} | created {created_at}"
+                         + (f", finished {finished_at}" if finished_at else ""))
+                if status in ACTIVE:
+                    st.progress(progress, text=message or status.capitalize())
+                elif status == "failed":
+                    st.error(error)
+                else:
+                    if message:
+                        st.caption(message)
+                    if result_path and os.path.exists(result_path):
+                        with open(result_path, "rb") as f:
+                            st.download_button(f"Download {result_name}", data=f.read(), file_name=result_name,
+                                               mime=result_mime, key=f"job_{job_id}_download")
+
+    job_list()
+    if st.button("Clear finished jobs"):
+        runner.clear_finished()
+        st.rerun()
+
+
+def view_stock(db):
+    get_manager("stock", db.conn).view_stock()
+
+
+def add_stock(db):
+    get_manager("stock", db.conn).add_stock()
+
+
+def low_stock(db):
+    get_manager("stock", db.conn).low_stock()
+
+
+def shopping(db):
+    get_manager("sales", db.conn).display()
+
+
+def all_stores(db):
+    get_manager("sales", db.conn).show_chain_dashboard()
+
+
+def import_data(db):
+    uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
+    streaming = st.checkbox("Streaming import (commit per chunk, resume if interrupted)")
+    background = st.checkbox("Run in background (follow it on the Jobs page)")
+    if uploaded_file is not None:
+        if not background:
+            get_manager("importer", db.conn).import_from_csv(uploaded_file, streaming=streaming)
+        elif st.button("Start import"):
+            from data_importer import import_job
+
+            runner = get_runner(db.pool.db_name)
+            job_id = runner.submit("import", uploaded_file.name, import_job, runner.save_upload(uploaded_file))
+            st.success(f"Started job {job_id}.")
+
+    with st.expander("Remove duplicate rows"):
+        get_manager("importer", db.conn).clean_duplicates()
+
+
+# Each page only imports what it needs, the first time it is opened
+PAGES = {
+    "📦 View Stock": view_stock,
+    "➕ Add Stock": add_stock,
+    "🚨 Low Stock": low_stock,
+    # "💸 Record Sale": lambda db: get_manager("sales", db.conn).record_sale(),
+    "🛒 Shopping": shopping,
+    "🏬 All Stores": all_stores,
+    "📈 Import Data": import_data,
+    "🧰 Jobs": show_jobs,
+    "⏱️ Performance": show_performance,
+}
 
 
 def main():
-    db = DBManager()
-    stock_manager = StockManager(db.c)
-    sales_manager = SalesManager(db.c)
-    data_importer = DataImporter(db.c)
-
-    st.title("Shop Management App")
-    st.sidebar.title("Navigation")
-
-    # option = st.sidebar.selectbox(
-    #     "Choose an option",
-    #     ["📦 View Stock", "➕ Add Stock", "💸 Record Sale", "🛒 Shopping", "📈 Import Data"]
-    # )
-
-    option = st.sidebar.selectbox(
-        "Choose an option",
-        ["📦 View Stock", "➕ Add Stock", "🛒 Shopping", "📈 Import Data"]
-    )
-
-    # USER INTERACTION
-    if option == "📦 View Stock":
-
-        stock_manager.view_stock()
-    elif option == "➕ Add Stock":
-
-        stock_manager.add_stock()
-
-    # elif option == "💸 Record Sale":
-    #
-    #     sales_manager.record_sale()
-
-    elif option == "🛒 Shopping":
-        sales_manager.display()
-    elif option == "📈 Import Data":
-
-        uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
-        if uploaded_file is not None:
-            data_importer.import_from_csv(uploaded_file)
-
-    db.close()
+    db = DBManager(store_db(choose_store()))
+    if WRITE_BEHIND:
+        # Started with the app, so sales journaled before a crash are replayed straight away
+        get_sale_queue(db.pool.db_name)
+
+    try:
+        st.title("Shop Management App")
+        st.sidebar.title("Navigation")
+
+        # USER INTERACTION
+        option = st.sidebar.selectbox("Choose an option", list(PAGES))
+        PAGES[option](db)
+
+        show_diagnostics()
+    finally:
+        # Hand the pooled connection back for the next rerun
+        db.close()
 
 
 if __name__ == "__main__":
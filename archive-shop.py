@@ -5,23 +5,17 @@ from datetime import datetime
 import pandas as pd
 import streamlit as st
 
+from data_importer import DataImporter
+from db_manager import migrate
+
 
 # Initialize database connection with normalized schema
 def init_db():
     conn = sqlite3.connect('shop_data.db')
     c = conn.cursor()
 
-    # Create tables
-    c.execute('''CREATE TABLE IF NOT EXISTS products
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, product_name TEXT UNIQUE, price REAL)''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS stock
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER, date_added DATE, quantity INTEGER,
-                 FOREIGN KEY (product_id) REFERENCES products(id))''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS sales
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER, date_of_sale DATE, quantity INTEGER, total REAL,
-                 FOREIGN KEY (product_id) REFERENCES products(id))''')
+    # The importer writes to the app's current schema, so apply the same migrations
+    migrate(conn)
 
     return conn, c
 
@@ -37,40 +31,9 @@ def export_to_csv(df, filename):
     return buffer.getvalue()
 
 
-# Import Data from CSV
+# Import Data from CSV (streamed in chunks, resumable)
 def import_from_csv(file):
-    try:
-        df = pd.read_csv(file)
-
-        if all(col in df.columns for col in ["date_added", "product_name", "price", "quantity"]):
-            # Import stock data
-            for _, row in df.iterrows():
-                c.execute("INSERT OR IGNORE INTO products (product_name, price) VALUES (?, ?)",
-                          (row['product_name'], row['price']))
-                product_id = \
-                c.execute("SELECT id FROM products WHERE product_name=?", (row['product_name'],)).fetchone()[0]
-                c.execute("INSERT INTO stock (product_id, date_added, quantity) VALUES (?, ?, ?)",
-                          (product_id, row['date_added'], row['quantity']))
-            conn.commit()
-            st.success("Stock data imported successfully!")
-
-        elif all(col in df.columns for col in ["date_of_sale", "product_name", "price", "quantity", "total"]):
-            # Import sales data
-            for _, row in df.iterrows():
-                c.execute("INSERT OR IGNORE INTO products (product_name, price) VALUES (?, ?)",
-                          (row['product_name'], row['price']))
-                product_id = \
-                c.execute("SELECT id FROM products WHERE product_name=?", (row['product_name'],)).fetchone()[0]
-                c.execute("INSERT INTO sales (product_id, date_of_sale, quantity, total) VALUES (?, ?, ?, ?)",
-                          (product_id, row['date_of_sale'], row['quantity'], row['total']))
-            conn.commit()
-            st.success("Sales data imported successfully!")
-
-        else:
-            st.error("CSV file does not match expected format.")
-
-    except Exception as e:
-        st.error(f"An error occurred while importing data: {e}")
+    DataImporter(c).import_from_csv(file, streaming=True)
 
 
 # Function to view stock with search, filter, and export
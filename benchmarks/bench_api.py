@@ -0,0 +1,135 @@
+"""
+Load test of the HTTP API (api.py) against a local instance.
+
+Builds a synthetic database with plenty of stock, starts `python api.py` on it, and
+keeps --concurrency clients busy with one scenario at a time for --seconds each:
+
+    lookup      GET /stock for one product, as a barcode scan does
+    sale        POST /sales with one single-line order
+    bulk-sales  POST /sales with --batch orders
+    restock     POST /restocks with --batch items
+    mixed       80% lookups, 15% sales, 5% restocks
+
+Reports requests per second, p50 / p99 latency and errors per scenario.
+
+    python -m benchmarks.bench_api --concurrency 16 --seconds 10 --json api.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+from benchmarks.bench_write_behind import percentile, prepare
+from benchmarks.datagen import SCALES
+
+SCENARIOS = ["lookup", "sale", "bulk-sales", "restock", "mixed"]
+
+
+def make_request(scenario, names, batch, rng):
+    # (method, path, JSON body)
+    if scenario == "mixed":
+        scenario = rng.choices(["lookup", "sale", "restock"], weights=[80, 15, 5])[0]
+        batch = 1
+    if scenario == "lookup":
+        return "GET", f"/stock?product={quote(rng.choice(names))}", None
+    if scenario in ("sale", "bulk-sales"):
+        return "POST", "/sales", {"orders": [{"lines": [{"product": rng.choice(names), "quantity": rng.randint(1, 3)}],
+                                              "customer_name": "Load Test"}
+                                             for _ in range(1 if scenario == "sale" else batch)]}
+    return "POST", "/restocks", {"restocks": [{"product": rng.choice(names), "quantity": rng.randint(10, 100),
+                                               "unit_cost": 1.0} for _ in range(batch)]}
+
+
+async def run_scenario(base_url, scenario, names, args):
+    import aiohttp
+
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + args.seconds
+
+    async def client(session, seed):
+        nonlocal errors
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            method, path, body = make_request(scenario, names, args.batch, rng)
+            start = time.perf_counter()
+            async with session.request(method, base_url + path, json=body) as response:
+                await response.read()
+                if response.status >= 400:
+                    errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(session, seed) for seed in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    return {"scenario": scenario, "requests": len(latencies), "requests_per_s": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 0.5) * 1000, "p99_ms": percentile(latencies, 0.99) * 1000,
+            "errors": errors}
+
+
+async def wait_until_up(base_url, server, timeout=30):
+    import aiohttp
+
+    deadline = time.perf_counter() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(base_url + "/health") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientConnectionError:
+                pass
+            if server.poll() is not None or time.perf_counter() > deadline:
+                raise SystemExit("The API server did not start")
+            await asyncio.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=list(SCALES), default="10k")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--batch", type=int, default=50, help="orders or items per bulk request")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "api.db")
+    names = prepare(db_path, args.scale)
+    base_url = f"http://127.0.0.1:{args.port}"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    server = subprocess.Popen([sys.executable, "api.py", "--db", db_path, "--port", str(args.port)], cwd=root,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = []
+    try:
+        asyncio.run(wait_until_up(base_url, server))
+        print(f"{'scenario':<12} {'requests':>9} {'req/s':>8} {'p50':>9} {'p99':>9}  errors")
+        for scenario in args.scenarios:
+            result = asyncio.run(run_scenario(base_url, scenario, names, args))
+            results.append(result)
+            print(f"{scenario:<12} {result['requests']:9,} {result['requests_per_s']:8.0f} {result['p50_ms']:7.1f}ms "
+                  f"{result['p99_ms']:7.1f}ms  {result['errors']}")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"concurrency": args.concurrency, "seconds": args.seconds, "batch": args.batch,
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
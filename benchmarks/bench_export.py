@@ -0,0 +1,97 @@
+"""
+Peak-memory benchmark for sales exports.
+
+For each row count, builds a synthetic database and runs every export path in a
+fresh subprocess, reporting wall time, output size and the worker's peak RSS:
+
+    dataframe   fetchall() -> DataFrame -> DataExporter.export_to_csv (the old path)
+    csv         DataExporter.export_sales streaming CSV
+    csv-gzip    streaming gzip-compressed CSV
+    parquet     streaming Parquet row groups (needs pyarrow)
+
+    python -m benchmarks.bench_export --rows 10000 100000 1000000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.datagen import build_database
+
+MODES = ["dataframe", "csv", "csv-gzip", "parquet"]
+
+
+def peak_rss_mb():
+    # VmHWM starts afresh at exec; ru_maxrss would carry over the parent's peak from building the database
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_worker(mode, db_path):
+    import sqlite3
+
+    from data_exporter import SALES_EXPORT_QUERY, DataExporter
+
+    cursor = sqlite3.connect(db_path).cursor()
+    start = time.perf_counter()
+    if mode == "dataframe":
+        import pandas as pd
+
+        df = pd.DataFrame(cursor.execute(SALES_EXPORT_QUERY).fetchall(),
+                          columns=["ID", "Date of Sale", "Product", "Price", "Quantity", "Total"])
+        size = len(DataExporter.export_to_csv(df, "sales_data.csv").encode("utf-8"))
+    else:
+        export_format = {"csv": "CSV", "csv-gzip": "CSV (gzip)", "parquet": "Parquet"}[mode]
+        out, _ = DataExporter.export_sales(cursor, export_format)
+        size = out.seek(0, os.SEEK_END)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"seconds": elapsed, "bytes": size, "peak_rss_mb": peak_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--worker", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.db)
+        return
+
+    results = []
+    workdir = tempfile.mkdtemp()
+    for rows in args.rows:
+        db_path = os.path.join(workdir, f"export_{rows}.db")
+        build_database(db_path, products=1000, stock_rows=1000, sales_rows=rows).close()
+        for mode in args.modes:
+            proc = subprocess.run([sys.executable, "-m", "benchmarks.bench_export", "--worker", mode, "--db", db_path],
+                                  capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"{rows:>10,} {mode:<10} failed: {proc.stderr.strip().splitlines()[-1]}")
+                continue
+            result = dict(json.loads(proc.stdout.strip().splitlines()[-1]), rows=rows, mode=mode)
+            results.append(result)
+            print(f"{rows:>10,} {mode:<10} {result['seconds']:8.2f}s {result['bytes'] / 1e6:9.1f} MB out "
+                  f"{result['peak_rss_mb']:9.1f} MB peak RSS")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
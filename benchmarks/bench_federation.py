@@ -0,0 +1,72 @@
+"""
+Chain-wide dashboard over per-store databases.
+
+Builds one synthetic database per store, then times federation.federated_dashboard
+with one worker (the stores answered one after another) and with one worker per
+store, each with a cold query cache, and checks that both merge to the same figures.
+
+    python -m benchmarks.bench_federation --stores 4 --scale 1m --json federation.json
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import stores
+from benchmarks.datagen import SCALES, build_database
+from query_cache import query_cache
+
+
+def timed_dashboard(store_ids, window, workers, repeat):
+    from federation import federated_dashboard
+
+    best, data = None, None
+    for _ in range(repeat):
+        query_cache.clear()
+        start = time.perf_counter()
+        data = federated_dashboard(*window, "Day", stores=store_ids, workers=workers)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stores", type=int, default=4)
+    parser.add_argument("--scale", choices=list(SCALES), default="10k", help="size of every store")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    from federation import federated_date_range
+
+    workdir = tempfile.mkdtemp()
+    stores.STORES_DIR = workdir
+    store_ids = [f"store{i + 1}" for i in range(args.stores)]
+    start = time.perf_counter()
+    for i, store_id in enumerate(store_ids):
+        build_database(stores.store_db(store_id), *SCALES[args.scale], seed=7 + i).close()
+    print(f"built {args.stores} stores of {args.scale} sales in {time.perf_counter() - start:.1f}s "
+          f"({os.cpu_count()} CPUs)")
+
+    window = federated_date_range(store_ids)
+    results = []
+    serial_data = None
+    for workers in sorted({1, args.stores}):
+        seconds, data = timed_dashboard(store_ids, window, workers, args.repeat)
+        serial_data = serial_data or data
+        results.append({"workers": workers, "seconds": seconds, "matches_serial": data == serial_data})
+        print(f"{workers:>3} workers  {seconds * 1000:8.1f} ms  "
+              f"{'same figures' if data == serial_data else 'FIGURES DIFFER'}")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"stores": args.stores, "scale": args.scale, "cpus": os.cpu_count(), "runs": results}, f,
+                      indent=2)
+
+
+if __name__ == "__main__":
+    main()
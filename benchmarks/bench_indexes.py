@@ -0,0 +1,89 @@
+"""
+Before/after benchmark for the secondary indexes added by schema migration 3.
+
+Builds a synthetic database at migration 2 (tables without indexes), times the
+stock, sales and dashboard queries and prints their query plans, then applies the
+remaining migrations and repeats the run.
+
+    python -m benchmarks.bench_indexes --sales 2000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.datagen import build_database
+from db_manager import migrate
+
+QUERIES = {
+    "view_stock": """SELECT s.date_added, p.product_name, p.price, s.quantity
+                     FROM stock s
+                     JOIN products p ON s.product_id = p.id""",
+    "view_sales": """SELECT s.id, s.date_of_sale, p.product_name, p.price, s.quantity, s.total
+                     FROM sales s
+                     JOIN products p ON s.product_id = p.id""",
+    "total_sales": "SELECT SUM(total) FROM sales",
+    "num_sales": "SELECT COUNT(*) FROM sales",
+    "most_sold_product": """SELECT p.product_name, SUM(s.quantity) as total_quantity
+                            FROM sales s
+                            JOIN products p ON s.product_id = p.id
+                            GROUP BY p.product_name
+                            ORDER BY total_quantity DESC
+                            LIMIT 1""",
+    "sales_over_time": """SELECT date_of_sale, SUM(total) as total_sales
+                          FROM sales
+                          GROUP BY date_of_sale
+                          ORDER BY date_of_sale""",
+    "sales_by_product": """SELECT p.product_name, SUM(s.total) as total_sales
+                           FROM sales s
+                           JOIN products p ON s.product_id = p.id
+                           GROUP BY p.product_name""",
+    "sales_last_30_days": """SELECT SUM(total) FROM sales
+                             WHERE date_of_sale >= date((SELECT MAX(date_of_sale) FROM sales), '-30 days')""",
+    "stock_for_product": "SELECT SUM(quantity) FROM stock WHERE product_id = 42",
+}
+
+
+def run_queries(conn, repeat):
+    results = {}
+    for name, query in QUERIES.items():
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query)]
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(query).fetchall()
+            best = min(best, time.perf_counter() - start)
+        results[name] = (best, plan)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--stock", type=int, default=200000)
+    parser.add_argument("--sales", type=int, default=2000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--db", help="database path (default: a temporary file)")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "bench_indexes.db")
+    print(f"Building {path}: {args.products:,} products, {args.stock:,} stock rows, {args.sales:,} sales")
+    conn = build_database(path, args.products, args.stock, args.sales, target_version=2)
+
+    before = run_queries(conn, args.repeat)
+    start = time.perf_counter()
+    migrate(conn)
+    conn.execute("ANALYZE")
+    print(f"Migrations applied in {time.perf_counter() - start:.2f}s\n")
+    after = run_queries(conn, args.repeat)
+
+    for name in QUERIES:
+        (t_before, plan_before), (t_after, plan_after) = before[name], after[name]
+        print(f"{name}: {t_before * 1000:.1f} ms -> {t_after * 1000:.1f} ms ({t_before / max(t_after, 1e-9):.1f}x)")
+        print(f"  before: {' | '.join(plan_before)}")
+        print(f"  after:  {' | '.join(plan_after)}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
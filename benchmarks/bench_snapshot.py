@@ -0,0 +1,115 @@
+"""
+Scan time and peak memory of the dashboard analytics, by source.
+
+For each row count, builds a synthetic database, then runs every mode in a fresh
+subprocess and reports wall time and the worker's peak RSS:
+
+    dataframe   sales fetched as tuples into a DataFrame, grouped with pandas (the old path)
+    rollup      SalesManager.rollup_dashboard, SQL over the sales_daily rollup
+    snapshot    SalesManager.snapshot_dashboard, vectorized scans of the memory-mapped snapshot
+
+Also reports how long the snapshot takes to build and to pick up 1,000 new sales.
+
+    python -m benchmarks.bench_snapshot --rows 100000 1000000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_export import peak_rss_mb
+from benchmarks.datagen import build_database
+
+MODES = ["dataframe", "rollup", "snapshot"]
+
+
+def run_worker(mode, db_path):
+    from db_manager import DBManager
+    from sales_manager import SalesManager
+
+    db = DBManager(db_path)
+    manager = SalesManager(db.c)
+    start_date, end_date = manager.dashboard_query("date_range")[0]
+    start = time.perf_counter()
+    if mode == "dataframe":
+        import pandas as pd
+
+        df = pd.DataFrame(db.c.execute("SELECT product_id, date_of_sale, quantity, total FROM sales").fetchall(),
+                          columns=["product_id", "date_of_sale", "quantity", "total"])
+        by_product = df.groupby("product_id").agg(quantity=("quantity", "sum"), total=("total", "sum"))
+        df.groupby("date_of_sale")["total"].sum()
+        by_product["quantity"].idxmax()
+        by_product["total"].nlargest(10)
+    elif mode == "rollup":
+        manager.rollup_dashboard(start_date, end_date)
+    else:
+        manager.snapshot_dashboard(start_date, end_date)
+    elapsed = time.perf_counter() - start
+    db.close()
+    print(json.dumps({"seconds": elapsed, "peak_rss_mb": peak_rss_mb()}))
+
+
+def time_snapshot(db_path):
+    from db_manager import DBManager, get_pool
+    from snapshot import get_snapshot
+
+    db = DBManager(db_path)
+    snapshot = get_snapshot(db_path)
+    start = time.perf_counter()
+    rows = snapshot.rebuild(db.c)
+    build = time.perf_counter() - start
+    db.c.execute("""INSERT INTO sales (product_id, date_of_sale, quantity, total)
+                    SELECT product_id, date_of_sale, quantity, total FROM sales ORDER BY id LIMIT 1000""")
+    db.conn.commit()
+    start = time.perf_counter()
+    snapshot.refresh(db.c)
+    refresh = time.perf_counter() - start
+    mismatches = snapshot.check(db.c)
+    # Checkpoint now, so no worker pays for folding the WAL back into the database
+    db.c.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db.close()
+    get_pool(db_path).close_all()
+    return rows, build, refresh, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--worker", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.db)
+        return
+
+    results = []
+    workdir = tempfile.mkdtemp()
+    for rows in args.rows:
+        db_path = os.path.join(workdir, f"snapshot_{rows}.db")
+        build_database(db_path, products=5000, stock_rows=1000, sales_rows=rows).close()
+        snapshot_rows, build, refresh, mismatches = time_snapshot(db_path)
+        print(f"{rows:>10,} snapshot built in {build:.2f}s, 1,000 new sales picked up in {refresh * 1000:.1f} ms, "
+              f"{len(mismatches)} mismatches against SQLite")
+        for mode in args.modes:
+            proc = subprocess.run([sys.executable, "-m", "benchmarks.bench_snapshot", "--worker", mode, "--db", db_path],
+                                  capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"{rows:>10,} {mode:<10} failed: {proc.stderr.strip().splitlines()[-1]}")
+                continue
+            result = dict(json.loads(proc.stdout.strip().splitlines()[-1]), rows=rows, mode=mode)
+            results.append(result)
+            print(f"{rows:>10,} {mode:<10} {result['seconds']:8.3f}s {result['peak_rss_mb']:9.1f} MB peak RSS")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Cold-start profile of the Streamlit entry point.
+
+Summarises `python -X importtime -c "import app"` by top-level package, then opens
+every page once in a fresh interpreter (Streamlit bare mode) against a synthetic
+database and reports the import time, the first render time and which heavy
+dependencies that page pulled in.
+
+    python -m benchmarks.bench_startup --json startup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "plotly.graph_objects", "fpdf"]
+EXTRA_PAGES = ["🛒 Shopping / View Sales", "🛒 Shopping / Sales Dashboard", "🛒 Shopping / Reprint Bills"]
+
+
+def import_profile(top):
+    # Self time per top-level package, and the cumulative time of importing app
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], capture_output=True, text=True,
+                          check=True)
+    packages = defaultdict(int)
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us)
+        if name.strip() == "app":
+            total_us = int(cumulative_us)
+    return total_us / 1e6, sorted(((us / 1e6, package) for package, us in packages.items()), reverse=True)[:top]
+
+
+def run_worker(page, db_path):
+    start = time.perf_counter()
+    import app
+    from db_manager import DBManager
+    from managers import get_manager
+
+    imported = time.perf_counter()
+    db = DBManager(db_path)
+    connected = time.perf_counter()
+    if page in app.PAGES:
+        app.PAGES[page](db)
+    else:
+        sales = get_manager("sales", db.conn)
+        {"View Sales": sales.view_sales, "Sales Dashboard": sales.show_sales_dashboard,
+         "Reprint Bills": sales.reprint_bills}[page.split(" / ")[1]]()
+    rendered = time.perf_counter()
+    db.close()
+    print(json.dumps({"import_s": imported - start, "connect_s": connected - imported,
+                      "render_s": rendered - connected, "modules": len(sys.modules),
+                      "heavy": [name for name in HEAVY_MODULES if name in sys.modules]}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=["10k", "1m", "10m"], default="10k")
+    parser.add_argument("--db", help="copy this database instead of building a synthetic one")
+    parser.add_argument("--top", type=int, default=15, help="packages listed in the import profile")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.db)
+        return
+
+    # Imported here, so a worker measures importing the app from a clean interpreter
+    from benchmarks.datagen import SCALES, build_database
+
+    total, packages = import_profile(args.top)
+    print(f"import app: {total * 1000:.0f} ms cumulative; self time by package:")
+    for seconds, package in packages:
+        print(f"  {package:<24} {seconds * 1000:8.1f} ms")
+
+    import app
+
+    workdir = tempfile.mkdtemp()
+    template = os.path.join(workdir, "template.db")
+    if args.db:
+        shutil.copy(args.db, template)
+    else:
+        build_database(template, *SCALES[args.scale]).close()
+
+    pages = []
+    print(f"\n{'page':<32} {'process':>9} {'import':>9} {'render':>9}  heavy modules loaded")
+    for page in list(app.PAGES) + EXTRA_PAGES:
+        # A fresh copy per page, so no page benefits from another's WAL or snapshot files
+        db_path = os.path.join(workdir, f"page_{len(pages)}.db")
+        shutil.copy(template, db_path)
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-m", "benchmarks.bench_startup", "--worker", page, "--db", db_path],
+                              capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if proc.returncode != 0:
+            print(f"{page:<32} failed: {proc.stderr.strip().splitlines()[-1]}")
+            continue
+        result = dict(json.loads(proc.stdout.strip().splitlines()[-1]), page=page, process_s=wall)
+        pages.append(result)
+        print(f"{page:<32} {wall * 1000:7.0f}ms {result['import_s'] * 1000:7.0f}ms {result['render_s'] * 1000:7.0f}ms  "
+              f"{', '.join(result['heavy']) or '-'}")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"import_app_s": total, "packages": [{"package": package, "self_s": seconds}
+                                                           for seconds, package in packages],
+                       "pages": pages}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
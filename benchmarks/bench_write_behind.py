@@ -0,0 +1,127 @@
+"""
+Checkout throughput with a commit per sale and with the write-behind sale queue.
+
+Builds a synthetic database with enough stock that no sale is refused, then has
+--tills threads check out --sales single-line sales between them: first with
+Checkout.place_order (one transaction per sale), then through SaleQueue at each
+--batch-sizes, every mode on a fresh copy of the database. Reports sales per second
+until everything is committed, how long a till waits for its acknowledgement, and
+checks that every mode ends up with the same units sold.
+
+    python -m benchmarks.bench_write_behind --sales 5000 --tills 4 --batch-sizes 1 16 64 256
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from benchmarks.datagen import SCALES, build_database
+from checkout import Checkout
+from db_manager import DBManager, run_in_transaction
+from inventory import Inventory
+from sale_queue import SaleQueue
+
+
+def prepare(path, scale):
+    build_database(path, *SCALES[scale]).close()
+    db = DBManager(path)
+
+    def restock():
+        last_stock_id = db.c.execute("SELECT COALESCE(MAX(id), 0) FROM stock").fetchone()[0]
+        db.c.execute("""INSERT INTO stock (product_id, date_added, quantity, unit_cost, remaining)
+                        SELECT id, '2020-01-01', 1000000, price / 2, 1000000 FROM products""")
+        Inventory(db.c).apply_stock_since(last_stock_id)
+
+    run_in_transaction(db.conn, restock)
+    names = [name for (name,) in db.c.execute("SELECT product_name FROM products ORDER BY id").fetchall()]
+    # Copies of the file must not depend on its WAL
+    db.c.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db.close()
+    return names
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def run_mode(db_path, sales, tills, batch_size=None, durable=True):
+    # batch_size None places every sale in its own transaction
+    latencies = []
+    queue = SaleQueue(db_path, batch_size=batch_size, durable=durable) if batch_size else None
+
+    def till(chunk):
+        db = None if queue else DBManager(db_path)
+        checkout = None if queue else Checkout(db.c)
+        for product_name, quantity in chunk:
+            start = time.perf_counter()
+            if queue:
+                queue.submit([(product_name, quantity)], "Bench Customer")
+            else:
+                checkout.place_order([(product_name, quantity)], "Bench Customer")
+            latencies.append(time.perf_counter() - start)
+        if db:
+            db.close()
+
+    threads = [threading.Thread(target=till, args=(sales[i::tills],)) for i in range(tills)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if queue:
+        queue.flush()
+    elapsed = time.perf_counter() - start
+    if queue:
+        queue.close()
+
+    db = DBManager(db_path)
+    units = db.c.execute("SELECT COALESCE(SUM(quantity), 0) FROM sales WHERE order_id IS NOT NULL").fetchone()[0]
+    db.close()
+    return {"sales_per_s": len(sales) / elapsed, "seconds": elapsed, "ack_p50_ms": percentile(latencies, 0.5) * 1000,
+            "ack_p99_ms": percentile(latencies, 0.99) * 1000, "units_sold": units}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sales", type=int, default=5000)
+    parser.add_argument("--tills", type=int, default=4)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 64, 256])
+    parser.add_argument("--scale", choices=list(SCALES), default="10k")
+    parser.add_argument("--no-fsync", action="store_true", help="do not fsync the journal before acknowledging")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    template = os.path.join(workdir, "template.db")
+    names = prepare(template, args.scale)
+    rng = random.Random(7)
+    sales = [(rng.choice(names), rng.randint(1, 3)) for _ in range(args.sales)]
+    expected_units = sum(quantity for _, quantity in sales)
+
+    results = []
+    print(f"{'mode':<22} {'sales/s':>9} {'ack p50':>9} {'ack p99':>9}  units sold")
+    for batch_size in [None] + args.batch_sizes:
+        db_path = os.path.join(workdir, f"run_{len(results)}.db")
+        shutil.copy(template, db_path)
+        result = dict(run_mode(db_path, sales, args.tills, batch_size, not args.no_fsync),
+                      mode="per-sale commit" if batch_size is None else f"queue, batch {batch_size}",
+                      batch_size=batch_size)
+        results.append(result)
+        print(f"{result['mode']:<22} {result['sales_per_s']:9.0f} {result['ack_p50_ms']:7.2f}ms "
+              f"{result['ack_p99_ms']:7.2f}ms  {result['units_sold']:,}"
+              + ("" if result["units_sold"] == expected_units else f"  (expected {expected_units:,})"))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"sales": args.sales, "tills": args.tills, "fsync": not args.no_fsync, "runs": results}, f,
+                      indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Compare two benchmark result files written by benchmarks.suite.
+
+Prints the best time of every benchmark in both runs and flags those that got
+slower by more than the threshold (and by at least --min-ms, so sub-millisecond
+noise is not reported); exits non-zero when any did.
+
+    python -m benchmarks.compare results/before.json results/after.json --threshold 0.10
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown (default: 0.10 = 10%%)")
+    parser.add_argument("--min-ms", type=float, default=0.5, help="ignore slowdowns smaller than this (default: 0.5)")
+    args = parser.parse_args()
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    for key in ("scale", "seed", "sqlite", "python"):
+        if baseline["meta"].get(key) != candidate["meta"].get(key):
+            print(f"warning: {key} differs ({baseline['meta'].get(key)} vs {candidate['meta'].get(key)})")
+
+    regressions = []
+    print(f"{'benchmark':<32} {'baseline ms':>12} {'candidate ms':>12} {'change':>8}")
+    for name in sorted(set(baseline["results"]) | set(candidate["results"])):
+        before, after = baseline["results"].get(name), candidate["results"].get(name)
+        if before is None or after is None:
+            print(f"{name:<32} {'-' if before is None else format(before['best_s'] * 1000, '.2f'):>12} "
+                  f"{'-' if after is None else format(after['best_s'] * 1000, '.2f'):>12}")
+            continue
+        change = after["best_s"] / before["best_s"] - 1 if before["best_s"] else 0.0
+        flag = ""
+        if change > args.threshold and (after["best_s"] - before["best_s"]) * 1000 >= args.min_ms:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<32} {before['best_s'] * 1000:12.2f} {after['best_s'] * 1000:12.2f} {change:+8.1%}{flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than the {args.threshold:.0%} threshold")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
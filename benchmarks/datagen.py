@@ -0,0 +1,164 @@
+"""
+Seeded synthetic shop data for benchmarks.
+
+Generates a product catalogue with brand/model names and long-tailed prices,
+restocks spread over three years, and sales whose product popularity follows a
+Zipf-like curve, with weekend peaks, year-on-year growth and mostly single-unit
+quantities. The same seed always produces the same data.
+
+Build a database (fully migrated, rollups backfilled):
+
+    python -m benchmarks.datagen --scale 1m --db /tmp/shop_1m.db
+
+or write import-format CSV files:
+
+    python -m benchmarks.datagen --scale 10k --csv-dir /tmp/shop_csv
+"""
+import argparse
+import csv
+import os
+import random
+import sqlite3
+import time
+from datetime import date, timedelta
+from itertools import accumulate
+
+from data_importer import SALES_COLUMNS, STOCK_COLUMNS
+from db_manager import PRAGMAS, migrate
+
+# products, stock rows, sales rows
+SCALES = {
+    "10k": (500, 2000, 10000),
+    "1m": (5000, 100000, 1000000),
+    "10m": (20000, 500000, 10000000),
+}
+
+START_DATE = date(2021, 1, 1)
+DAYS = 3 * 365
+BATCH = 10000
+
+BRANDS = ["Acme", "Apex", "Nova", "Zenith", "Orion", "Vertex", "Lumen", "Polar", "Summit", "Echo", "Atlas", "Pixel"]
+CATEGORIES = [
+    # (product type, typical price)
+    ("Phone", 650.0), ("Laptop", 1100.0), ("Tablet", 450.0), ("Headphones", 120.0), ("Smartwatch", 250.0),
+    ("Charger", 25.0), ("Cable", 12.0), ("Keyboard", 60.0), ("Mouse", 30.0), ("Monitor", 280.0),
+    ("Speaker", 90.0), ("Camera", 700.0), ("Router", 110.0), ("Power Bank", 40.0), ("Phone Case", 18.0),
+]
+VARIANTS = ["", "Pro", "Max", "Lite", "Mini", "Plus", "Ultra", "SE"]
+
+
+def make_products(count, seed=7):
+    # [(name, price, popularity weight)], most popular first
+    rng = random.Random(seed)
+    products = []
+    for i in range(count):
+        category, typical_price = rng.choice(CATEGORIES)
+        variant = rng.choice(VARIANTS)
+        name = " ".join(part for part in (rng.choice(BRANDS), category, variant, f"{i + 1:05d}") if part)
+        price = round(max(1.0, rng.lognormvariate(0, 0.35) * typical_price), 2)
+        products.append((name, price, 1.0 / (i + 1) ** 0.9))
+    return products
+
+
+def _day_weights():
+    # Weekend peaks and steady growth across the three years
+    weights = []
+    for offset in range(DAYS):
+        day = START_DATE + timedelta(days=offset)
+        weights.append((1.6 if day.weekday() >= 5 else 1.0) * (1 + offset / DAYS))
+    return weights
+
+
+def _batches(rows):
+    while rows > 0:
+        yield min(rows, BATCH)
+        rows -= BATCH
+
+
+def iter_stock(products, rows, seed=7):
+    # (product index, date added, quantity); restocks are spread evenly over the catalogue
+    rng = random.Random(seed + 1)
+    for size in _batches(rows):
+        for _ in range(size):
+            yield (rng.randrange(len(products)), (START_DATE + timedelta(days=rng.randrange(DAYS))).isoformat(),
+                   rng.randint(10, 200))
+
+
+def iter_sales(products, rows, seed=7):
+    # (product index, date of sale, quantity, total)
+    rng = random.Random(seed + 2)
+    product_weights = list(accumulate(weight for _, _, weight in products))
+    day_weights = list(accumulate(_day_weights()))
+    dates = [(START_DATE + timedelta(days=offset)).isoformat() for offset in range(DAYS)]
+    indexes = range(len(products))
+    for size in _batches(rows):
+        picks = rng.choices(indexes, cum_weights=product_weights, k=size)
+        days = rng.choices(dates, cum_weights=day_weights, k=size)
+        quantities = rng.choices((1, 2, 3, 4, 5), weights=(60, 25, 8, 4, 3), k=size)
+        for index, day, quantity in zip(picks, days, quantities):
+            yield index, day, quantity, round(products[index][1] * quantity, 2)
+
+
+def build_database(path, products, stock_rows, sales_rows, seed=7, target_version=None):
+    # Load the raw tables at schema version 2, then migrate to target_version (default: latest),
+    # which backfills inventory, the sales_daily rollup and the search index from them.
+    catalogue = make_products(products, seed)
+    conn = sqlite3.connect(path)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    migrate(conn, target_version=2)
+
+    conn.executemany("INSERT INTO products (id, product_name, price) VALUES (?, ?, ?)",
+                     ((i + 1, name, price) for i, (name, price, _) in enumerate(catalogue)))
+    conn.executemany("INSERT INTO stock (product_id, date_added, quantity) VALUES (?, ?, ?)",
+                     ((index + 1, day, quantity) for index, day, quantity in iter_stock(catalogue, stock_rows, seed)))
+    conn.executemany("INSERT INTO sales (product_id, date_of_sale, quantity, total) VALUES (?, ?, ?, ?)",
+                     ((index + 1, day, quantity, total)
+                      for index, day, quantity, total in iter_sales(catalogue, sales_rows, seed)))
+    conn.commit()
+    if target_version != 2:
+        migrate(conn, target_version)
+        conn.execute("ANALYZE")
+    return conn
+
+
+def write_csv(path, kind, products, rows, seed=7):
+    # Write stock or sales rows in the format DataImporter.import_from_csv expects
+    catalogue = make_products(products, seed)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        if kind == "Stock":
+            writer.writerow(STOCK_COLUMNS)
+            writer.writerows((day, catalogue[index][0], catalogue[index][1], quantity)
+                             for index, day, quantity in iter_stock(catalogue, rows, seed))
+        else:
+            writer.writerow(SALES_COLUMNS)
+            writer.writerows((day, catalogue[index][0], catalogue[index][1], quantity, total)
+                             for index, day, quantity, total in iter_sales(catalogue, rows, seed))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES, default="10k")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--db", help="build a database at this path")
+    parser.add_argument("--csv-dir", help="write stock.csv and sales.csv to this directory")
+    args = parser.parse_args()
+    if not args.db and not args.csv_dir:
+        parser.error("give --db and/or --csv-dir")
+
+    products, stock_rows, sales_rows = SCALES[args.scale]
+    start = time.perf_counter()
+    if args.db:
+        build_database(args.db, products, stock_rows, sales_rows, args.seed).close()
+        print(f"Built {args.db} in {time.perf_counter() - start:.1f}s")
+    if args.csv_dir:
+        os.makedirs(args.csv_dir, exist_ok=True)
+        write_csv(os.path.join(args.csv_dir, "stock.csv"), "Stock", products, stock_rows, args.seed)
+        write_csv(os.path.join(args.csv_dir, "sales.csv"), "Sales", products, sales_rows, args.seed)
+        print(f"Wrote {args.csv_dir}/stock.csv and sales.csv in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Concurrency stress test for stock reservation.
+
+N writer threads, each with its own pooled connection, keep checking out random
+quantities of a single product until it is sold out. Afterwards the run asserts
+that nothing was oversold (on_hand never below zero, units sold + units left ==
+starting stock, order_lines agree with sales) and reports checkout throughput.
+
+    python -m benchmarks.stress_oversell --writers 8 --stock 2000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from checkout import Checkout
+from db_manager import DBManager
+from inventory import InsufficientStock, Inventory
+from services import ShopService
+
+PRODUCT = "Stress Test Widget"
+
+
+def writer(db_path, seed, results, lock):
+    rng = random.Random(seed)
+    db = DBManager(db_path)
+    checkout = Checkout(db.c)
+    orders = units = refused = 0
+    try:
+        while True:
+            quantity = rng.randint(1, 3)
+            try:
+                checkout.place_order([(PRODUCT, quantity)])
+                orders += 1
+                units += quantity
+            except InsufficientStock as e:
+                refused += 1
+                if e.available == 0:
+                    break
+    finally:
+        db.close()
+        with lock:
+            results.append((orders, units, refused))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--stock", type=int, default=2000)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "stress.db")
+    db = DBManager(db_path)
+    product_id, = ShopService(db.c).restock([(PRODUCT, args.stock, None, 9.99)])
+    db.close()
+
+    results, lock = [], threading.Lock()
+    threads = [threading.Thread(target=writer, args=(db_path, seed, results, lock)) for seed in range(args.writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    db = DBManager(db_path)
+    on_hand = Inventory(db.c).on_hand(product_id)
+    sold = db.c.execute("SELECT COALESCE(SUM(quantity), 0) FROM sales WHERE product_id=?", (product_id,)).fetchone()[0]
+    lined = db.c.execute("SELECT COALESCE(SUM(quantity), 0) FROM order_lines WHERE product_id=?",
+                         (product_id,)).fetchone()[0]
+    db.close()
+
+    orders = sum(r[0] for r in results)
+    units = sum(r[1] for r in results)
+    refused = sum(r[2] for r in results)
+    print(f"{args.writers} writers: {orders:,} orders ({units:,} units) in {elapsed:.2f}s "
+          f"= {orders / elapsed:,.0f} orders/sec, {refused:,} refused for lack of stock")
+    print(f"on_hand={on_hand} sold={sold} order_lines={lined} starting stock={args.stock}")
+
+    failures = []
+    if len(results) != args.writers:
+        failures.append("a writer thread died")
+    if on_hand < 0:
+        failures.append("stock went negative")
+    if sold + on_hand != args.stock:
+        failures.append("units sold + on hand does not match starting stock")
+    if sold != units or lined != units:
+        failures.append("acknowledged units disagree with sales/order_lines")
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK: no oversell")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Repeatable benchmark suite over synthetic shop data.
+
+Builds (or reuses) a seeded database at the chosen scale and times:
+
+    import_*            DataImporter.import_from_csv into a fresh database (bulk and streaming)
+    view_stock_*        the View Stock pages (inventory summary and restock history)
+    view_sales_*        the View Sales pages, first page and a page deep in the table
+    dashboard_*         every Sales Dashboard aggregate, and the whole dashboard read from the
+                        sales_daily rollup and from the columnar snapshot
+    export_*            DataExporter.export_to_csv and the streaming DataExporter.export_sales
+    generate_pdf_bill   SalesManager.generate_pdf_bill
+
+The query cache is cleared before every timed run. Results are written as JSON so
+two runs can be compared with benchmarks.compare:
+
+    python -m benchmarks.suite --scale 1m --output results/1m-after.json
+    python -m benchmarks.compare results/1m-before.json results/1m-after.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+
+from benchmarks.datagen import SCALES, build_database, write_csv
+from data_exporter import SALES_EXPORT_COLUMNS, SALES_EXPORT_QUERY, DataExporter
+from data_importer import DataImporter
+from db_manager import DBManager, get_pool
+from pagination import fetch_page
+from query_cache import query_cache
+from sales_manager import GRANULARITIES, SalesManager
+from snapshot import snapshot_for
+
+# Mirrors the paged_table calls in StockManager.view_stock and SalesManager.view_sales:
+# name -> (columns, from clause, sort expression, id expression, descending)
+VIEW_PAGES = {
+    "view_stock_by_product": (["p.product_name", "p.price", "i.on_hand", "i.last_restock", "i.last_sale"],
+                              "inventory i JOIN products p ON i.product_id = p.id", "p.product_name",
+                              "i.product_id", False),
+    "view_stock_by_on_hand": (["p.product_name", "p.price", "i.on_hand", "i.last_restock", "i.last_sale"],
+                              "inventory i JOIN products p ON i.product_id = p.id", "i.on_hand",
+                              "i.product_id", True),
+    "view_stock_restocks": (["s.date_added", "p.product_name", "p.price", "s.quantity"],
+                            "stock s JOIN products p ON s.product_id = p.id", "s.date_added", "s.id", True),
+    "view_sales_by_date": (["s.id", "s.date_of_sale", "p.product_name", "p.price", "s.quantity", "s.total"],
+                           "sales s JOIN products p ON s.product_id = p.id", "s.date_of_sale", "s.id", True),
+    "view_sales_by_total": (["s.id", "s.date_of_sale", "p.product_name", "p.price", "s.quantity", "s.total"],
+                            "sales s JOIN products p ON s.product_id = p.id", "s.total", "s.id", True),
+}
+PAGE_SIZE = 50
+
+
+def measure(run, repeat, setup=None):
+    # run() returns the number of rows it processed
+    times = []
+    rows = 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        rows = run()
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {"best_s": best, "median_s": statistics.median(times), "runs": times, "rows": rows,
+            "rows_per_s": rows / best if best else None}
+
+
+def bench_imports(workdir, csv_paths, repeat):
+    results = {}
+    for name, kind, streaming in (("import_stock_csv", "Stock", False), ("import_sales_csv", "Sales", False),
+                                  ("import_sales_csv_streaming", "Sales", True)):
+        table = "stock" if kind == "Stock" else "sales"
+        expected = sum(1 for _ in open(csv_paths[kind])) - 1
+        state = {"runs": 0}
+
+        def setup():
+            # A fresh, empty database for every run
+            state["runs"] += 1
+            state["path"] = os.path.join(workdir, f"{name}_{state['runs']}.db")
+            state["db"] = DBManager(state["path"])
+
+        def run():
+            db = state.pop("db")
+            try:
+                DataImporter(db.c).import_from_csv(csv_paths[kind], streaming=streaming)
+                imported = db.c.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            finally:
+                db.close()
+                get_pool(state["path"]).close_all()
+            if imported != expected:
+                raise RuntimeError(f"{name}: imported {imported:,} of {expected:,} rows")
+            return imported
+
+        results[name] = measure(run, repeat, setup)
+    return results
+
+
+def bench_views(cursor, repeat):
+    results = {}
+    for name, (columns, from_clause, order_expr, id_expr, descending) in VIEW_PAGES.items():
+        results[name] = measure(lambda: len(fetch_page(cursor, columns, from_clause, order_expr, id_expr,
+                                                       descending=descending, page_size=PAGE_SIZE)[0]),
+                                repeat, query_cache.clear)
+
+    # A page from the middle of the sales table costs the same as the first one with keyset paging
+    middle = cursor.execute("SELECT date_of_sale, id FROM sales ORDER BY date_of_sale DESC, id DESC LIMIT 1 "
+                            "OFFSET (SELECT COUNT(*) / 2 FROM sales)").fetchone()
+    columns, from_clause, order_expr, id_expr, descending = VIEW_PAGES["view_sales_by_date"]
+    results["view_sales_deep_page"] = measure(
+        lambda: len(fetch_page(cursor, columns, from_clause, order_expr, id_expr, after=middle,
+                               descending=descending, page_size=PAGE_SIZE)[0]),
+        repeat, query_cache.clear)
+    return results
+
+
+def bench_dashboard(cursor, repeat):
+    # Every aggregate over the full history and the time series at each granularity
+    manager = SalesManager(cursor)
+    window = tuple(manager.dashboard_query("date_range")[0])
+    params = {"totals": window, "most_sold_product": window, "sales_by_product": window + (10, 10)}
+    results = {f"dashboard_{name}": measure(lambda: len(manager.dashboard_query(name, params)), repeat,
+                                            query_cache.clear)
+               for name, params in params.items()}
+    for granularity in GRANULARITIES:
+        results[f"dashboard_sales_over_time_{granularity.lower()}"] = measure(
+            lambda: len(manager.dashboard_query("sales_over_time", window, GRANULARITIES[granularity])), repeat,
+            query_cache.clear)
+
+    # The whole dashboard from each source; the snapshot is brought up to date before timing
+    snapshot_for(cursor).refresh(cursor)
+    for source, build in (("rollup", manager.rollup_dashboard), ("snapshot", manager.snapshot_dashboard)):
+        for granularity in GRANULARITIES:
+            results[f"dashboard_{source}_{granularity.lower()}"] = measure(
+                lambda: len(build(*window, granularity)["sales_over_time"]), repeat, query_cache.clear)
+    return results
+
+
+def bench_exports(cursor, repeat):
+    import pandas as pd
+
+    def dataframe_export():
+        df = pd.DataFrame(cursor.execute(SALES_EXPORT_QUERY).fetchall(), columns=SALES_EXPORT_COLUMNS)
+        DataExporter.export_to_csv(df, "sales_data.csv")
+        return len(df)
+
+    def streaming_export():
+        out, rows = DataExporter.export_sales(cursor, "CSV")
+        out.close()
+        return rows
+
+    return {"export_to_csv": measure(dataframe_export, repeat),
+            "export_sales_csv": measure(streaming_export, repeat)}
+
+
+def bench_bills(cursor, bills, repeat):
+    sample = cursor.execute("""SELECT s.date_of_sale, p.product_name, p.price, s.quantity, s.total
+                               FROM sales s JOIN products p ON s.product_id = p.id
+                               ORDER BY s.id LIMIT ?""", (bills,)).fetchall()
+
+    def render():
+        for date_of_sale, product_name, price, quantity, total in sample:
+            SalesManager.generate_pdf_bill(date_of_sale, product_name, price, quantity, total,
+                                           "Benchmark Customer", "5550100")
+        return len(sample)
+
+    return {"generate_pdf_bill": measure(render, repeat)}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES, default="10k")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--db", help="reuse (or build) the benchmark database at this path")
+    parser.add_argument("--import-rows", type=int,
+                        help="rows per imported CSV file (default: the scale's sales rows, at most 1,000,000)")
+    parser.add_argument("--bills", type=int, default=200, help="bills rendered per run")
+    parser.add_argument("--skip", nargs="+", default=[], choices=["imports", "views", "dashboard", "exports", "bills"])
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<scale>-<timestamp>.json)")
+    args = parser.parse_args()
+
+    products, stock_rows, sales_rows = SCALES[args.scale]
+    workdir = tempfile.mkdtemp(prefix="shop_bench_")
+    db_path = args.db or os.path.join(workdir, f"shop_{args.scale}.db")
+    if not os.path.exists(db_path):
+        print(f"Building {db_path}: {products:,} products, {stock_rows:,} stock rows, {sales_rows:,} sales")
+        build_database(db_path, products, stock_rows, sales_rows, args.seed).close()
+
+    results = {}
+    try:
+        if "imports" not in args.skip:
+            import_rows = args.import_rows or min(sales_rows, 1000000)
+            print(f"Writing {import_rows:,}-row import files")
+            csv_paths = {kind: write_csv(os.path.join(workdir, f"{kind.lower()}.csv"), kind, products, import_rows,
+                                         args.seed) for kind in ("Stock", "Sales")}
+            results.update(bench_imports(workdir, csv_paths, args.repeat))
+
+        db = DBManager(db_path)
+        try:
+            if "views" not in args.skip:
+                results.update(bench_views(db.c, args.repeat))
+            if "dashboard" not in args.skip:
+                results.update(bench_dashboard(db.c, args.repeat))
+            if "exports" not in args.skip:
+                results.update(bench_exports(db.c, args.repeat))
+            if "bills" not in args.skip:
+                results.update(bench_bills(db.c, args.bills, args.repeat))
+        finally:
+            db.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for name, result in results.items():
+        print(f"{name:<32} {result['best_s'] * 1000:10.2f} ms best {result['median_s'] * 1000:10.2f} ms median "
+              f"{result['rows']:>10,} rows")
+
+    output = args.output or os.path.join("benchmarks", "results",
+                                         f"{args.scale}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"meta": {"scale": args.scale, "seed": args.seed, "repeat": args.repeat,
+                            "products": products, "stock_rows": stock_rows, "sales_rows": sales_rows,
+                            "revision": git_revision(), "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                            "platform": platform.platform(), "cpus": os.cpu_count()},
+                   "results": results}, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
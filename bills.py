@@ -0,0 +1,118 @@
+import io
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+# Batches smaller than this render in-process; process start-up would cost more than it saves
+POOL_THRESHOLD = 50
+
+
+def make_bill(date_of_sale, lines, customer_name="", customer_mobile="", bill_no=None):
+    # lines: (product_name, price, quantity, total) tuples
+    return {"bill_no": bill_no, "date_of_sale": date_of_sale, "customer_name": customer_name or "",
+            "customer_mobile": customer_mobile or "", "lines": [tuple(line) for line in lines],
+            "total": sum(line[3] for line in lines)}
+
+
+def _pdf_bytes(pdf):
+    # PyFPDF returns a latin-1 str, fpdf2 returns a bytearray
+    out = pdf.output(dest="S")
+    return out.encode("latin-1") if isinstance(out, str) else bytes(out)
+
+
+def _draw_layout(pdf):
+    # Static part of every bill: title and section headings
+    pdf.add_page()
+    pdf.set_font("Arial", "B", 16)
+    pdf.set_text_color(0, 0, 128)  # Dark blue
+    pdf.cell(200, 10, txt="Sale Bill", ln=True, align='C')
+    pdf.ln(10)
+
+    pdf.set_font("Arial", "B", 12)
+    pdf.set_text_color(0, 0, 0)  # Black
+    pdf.cell(100, 10, txt="Customer Information", ln=True)
+    pdf.set_xy(10, 60)
+    pdf.cell(100, 10, txt="Sale Details", ln=True)
+    pdf.set_xy(10, 80)
+    pdf.set_font("Arial", "B", 11)
+    pdf.cell(90, 8, txt="Product", border="B")
+    pdf.cell(30, 8, txt="Price", border="B", align='R')
+    pdf.cell(25, 8, txt="Qty", border="B", align='R')
+    pdf.cell(35, 8, txt="Amount", border="B", align='R', ln=True)
+
+
+def _draw_bill(pdf, bill):
+    # Variable part, positioned against the layout drawn by _draw_layout
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_font("Arial", "", 12)
+    pdf.set_xy(10, 40)
+    pdf.cell(100, 10, txt=f"Customer Name: {bill['customer_name']}")
+    pdf.cell(100, 10, txt=f"Customer Mobile: {bill['customer_mobile']}")
+    pdf.set_xy(10, 68)
+    date_text = f"Date of Sale: {bill['date_of_sale']}"
+    if bill["bill_no"] is not None:
+        date_text += f"    Bill No: {bill['bill_no']}"
+    pdf.cell(100, 10, txt=date_text)
+
+    pdf.set_xy(10, 88)
+    pdf.set_font("Arial", "", 11)
+    for product_name, price, quantity, total in bill["lines"]:
+        pdf.cell(90, 8, txt=str(product_name))
+        pdf.cell(30, 8, txt=f"${price:.2f}", align='R')
+        pdf.cell(25, 8, txt=str(quantity), align='R')
+        pdf.cell(35, 8, txt=f"${total:.2f}", align='R', ln=True)
+
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(145, 10, txt="Total Amount:", border="T", align='R')
+    pdf.cell(35, 10, txt=f"${bill['total']:.2f}", border="T", align='R', ln=True)
+
+    # Footer
+    pdf.ln(20)
+    pdf.set_font("Arial", "I", 10)
+    pdf.set_text_color(128, 128, 128)  # Gray
+    pdf.cell(200, 10, txt="Thank you for your purchase!", ln=True, align='C')
+
+
+def render_bill(bill):
+    # Rendered straight to bytes in memory, no temporary files
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    _draw_layout(pdf)
+    _draw_bill(pdf, bill)
+    return _pdf_bytes(pdf)
+
+
+def render_bills_pdf(bills):
+    # One multi-page document, one bill per page
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    for bill in bills:
+        _draw_layout(pdf)
+        _draw_bill(pdf, bill)
+    return _pdf_bytes(pdf)
+
+
+def _render_many(bills):
+    return [render_bill(bill) for bill in bills]
+
+
+def render_bills_zip(bills, workers=None):
+    # One PDF per bill, rendered across a process pool for large batches
+    if len(bills) < POOL_THRESHOLD:
+        rendered = _render_many(bills)
+    else:
+        workers = workers or os.cpu_count() or 1
+        size = -(-len(bills) // workers)
+        batches = [bills[i:i + size] for i in range(0, len(bills), size)]
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            rendered = [pdf for batch in pool.map(_render_many, batches) for pdf in batch]
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for index, (bill, pdf_bytes) in enumerate(zip(bills, rendered), start=1):
+            name = bill["bill_no"] if bill["bill_no"] is not None else index
+            archive.writestr(f"bill_{name}.pdf", pdf_bytes)
+    return buffer.getvalue()
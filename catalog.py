@@ -0,0 +1,125 @@
+import heapq
+import sqlite3
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+from query_cache import query_cache
+
+
+def _trigrams(text):
+    # Per-word trigrams, padded so word starts and ends carry extra weight
+    trigrams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+class ProductCatalog:
+    # In-memory copy of the products table: name -> (id, price), a sorted name list
+    # for prefix lookups and a trigram index for typo-tolerant matches.
+    def __init__(self, rows):
+        self.by_name = {}
+        self._trigram_index = {}
+        self._trigram_counts = []
+        self._names = []
+        for product_id, product_name, price in rows:
+            self.by_name[product_name] = (product_id, price)
+            name_trigrams = _trigrams(product_name.lower())
+            for trigram in name_trigrams:
+                self._trigram_index.setdefault(trigram, []).append(len(self._names))
+            self._trigram_counts.append(len(name_trigrams))
+            self._names.append(product_name)
+        self._sorted = sorted((name.lower(), name) for name in self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def names(self):
+        return [name for _, name in self._sorted]
+
+    def search(self, term, k=20):
+        term = term.strip().lower()
+        if not term:
+            return [name for _, name in self._sorted[:k]]
+
+        # Prefix matches first, in alphabetical order
+        results = []
+        i = bisect_left(self._sorted, (term,))
+        while i < len(self._sorted) and len(results) < k and self._sorted[i][0].startswith(term):
+            results.append(self._sorted[i][1])
+            i += 1
+        if len(results) == k:
+            return results
+
+        # Then names sharing the most of the term's trigrams, which also catches typos.
+        # Ties go to the shorter (closer) name.
+        term_trigrams = _trigrams(term)
+        overlap = Counter()
+        for trigram in term_trigrams:
+            overlap.update(self._trigram_index.get(trigram, ()))
+        seen = set(results)
+        scored = heapq.nlargest(k + len(results), (
+            (shared / len(term_trigrams), -self._trigram_counts[index], index)
+            for index, shared in overlap.items()))
+        for score, _, index in scored:
+            if score < 0.4 or len(results) == k:
+                break
+            if self._names[index] not in seen:
+                results.append(self._names[index])
+        return results
+
+
+# database file -> (catalog, products generation it was built at)
+_catalogs = {}
+_catalog_lock = threading.Lock()
+
+
+def get_catalog(cursor):
+    # Rebuilt only when the products table's cache generation has moved on.
+    # Every store's database has its own catalog
+    database = getattr(cursor.connection, "db_name", None)
+    generation = query_cache.generation(cursor, "products")
+    with _catalog_lock:
+        catalog, catalog_generation = _catalogs.get(database, (None, None))
+        if catalog is None or catalog_generation != generation:
+            catalog = ProductCatalog(cursor.execute("SELECT id, product_name, price FROM products").fetchall())
+            _catalogs[database] = (catalog, generation)
+        return catalog
+
+
+def create_products_fts(conn):
+    # Optional FTS5 trigram index over product names (substring search that can use an index).
+    # Skipped when SQLite is built without FTS5 or is older than 3.34; searches then use LIKE.
+    try:
+        conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS products_fts
+                        USING fts5(product_name, content='products', content_rowid='id', tokenize='trigram')""")
+    except sqlite3.OperationalError:
+        return
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+                        INSERT INTO products_fts (rowid, product_name) VALUES (new.id, new.product_name);
+                    END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+                        INSERT INTO products_fts (products_fts, rowid, product_name)
+                        VALUES ('delete', old.id, old.product_name);
+                    END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF product_name ON products BEGIN
+                        INSERT INTO products_fts (products_fts, rowid, product_name)
+                        VALUES ('delete', old.id, old.product_name);
+                        INSERT INTO products_fts (rowid, product_name) VALUES (new.id, new.product_name);
+                    END""")
+    conn.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+
+
+def fts_available(cursor):
+    return bool(query_cache.fetchall(cursor, "SELECT 1 FROM sqlite_master WHERE name = 'products_fts'"))
+
+
+def product_search_condition(cursor, name_column, id_column, term):
+    # SQL condition and parameters for a product-name search. Uses the FTS5 index when it
+    # exists and the term is long enough for trigram matching, otherwise LIKE.
+    if len(term) >= 3 and fts_available(cursor):
+        return (f"{id_column} IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)",
+                '"' + term.replace('"', '""') + '"')
+    return f"{name_column} LIKE ?", f"%{term}%"
@@ -0,0 +1,143 @@
+import sqlite3
+from datetime import datetime
+
+from db_manager import run_in_transaction
+from inventory import InsufficientStock, Inventory
+from lots import StockLots
+from query_cache import query_cache
+from reorder import ReorderLevels
+from rollups import SalesRollup
+
+# Tables a placed order writes to, for query cache invalidation
+ORDER_TABLES = ("orders", "order_lines", "sales", "inventory", "sales_daily", "stock", "sale_lots", "reorder_levels",
+                "stock_alerts")
+
+
+class Checkout:
+    # Prices a cart in one lookup and records it as a single order: one orders row,
+    # its order_lines, the matching sales rows and the inventory/lot/rollup updates,
+    # all committed together. Orders that would take stock below zero are refused.
+    LOOKUP_BATCH = 500
+
+    def __init__(self, cursor):
+        self.c = cursor
+
+    @staticmethod
+    def merge_cart(cart):
+        # cart: iterable of (product_name, quantity); repeated products become one line
+        merged = {}
+        for product_name, quantity in cart:
+            merged[product_name] = merged.get(product_name, 0) + int(quantity)
+        return [(name, quantity) for name, quantity in merged.items() if quantity > 0]
+
+    def price_lines(self, cart):
+        cart = self.merge_cart(cart)
+        names = [name for name, _ in cart]
+        products = {}
+        for i in range(0, len(names), self.LOOKUP_BATCH):
+            batch = names[i:i + self.LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            for product_id, name, price in self.c.execute(
+                    f"SELECT id, product_name, price FROM products WHERE product_name IN ({placeholders})", batch):
+                products[name] = (product_id, price)
+
+        missing = [name for name in names if name not in products]
+        if missing:
+            raise ValueError(f"Unknown product(s): {', '.join(missing)}")
+        # (product_id, product_name, price, quantity, total)
+        return [(products[name][0], name, products[name][1], quantity, products[name][1] * quantity)
+                for name, quantity in cart]
+
+    def place_order(self, cart, customer_name="", customer_mobile="", date_of_sale=None):
+        date_of_sale = date_of_sale or datetime.now().strftime("%Y-%m-%d")
+        lines = self.price_lines(cart)
+        if not lines:
+            raise ValueError("The cart is empty.")
+
+        def record():
+            last_sale_id = self.c.execute("SELECT COALESCE(MAX(id), 0) FROM sales").fetchone()[0]
+            order_id = self.write_order(lines, customer_name, customer_mobile, date_of_sale)
+            self.apply_sales_since(last_sale_id)
+            return order_id
+
+        order_id = run_in_transaction(self.c.connection, record)
+        query_cache.invalidate(*ORDER_TABLES)
+        return order_id, date_of_sale, lines
+
+    def place_orders(self, orders):
+        # orders: (cart, customer_name, customer_mobile, date_of_sale) tuples. Each order is accepted
+        # or refused on its own, and the accepted ones are committed together. Returns, per order,
+        # (order_id, date_of_sale, lines) or the exception that refused it.
+        results = []
+        priced = []
+        for cart, customer_name, customer_mobile, date_of_sale in orders:
+            date_of_sale = date_of_sale or datetime.now().strftime("%Y-%m-%d")
+            try:
+                lines = self.price_lines(cart)
+                if not lines:
+                    raise ValueError("The cart is empty.")
+            except ValueError as e:
+                results.append(e)
+                continue
+            results.append((None, date_of_sale, lines))
+            priced.append((len(results) - 1, (lines, customer_name, customer_mobile, date_of_sale)))
+
+        if priced:
+            written = run_in_transaction(self.c.connection, lambda: self.write_orders([order for _, order in priced]))
+            query_cache.invalidate(*ORDER_TABLES)
+            for (index, _), order_id in zip(priced, written):
+                results[index] = order_id if isinstance(order_id, Exception) else (order_id,) + results[index][1:]
+        return results
+
+    def write_orders(self, orders):
+        # Priced orders, (lines, customer_name, customer_mobile, date_of_sale), inside the caller's
+        # transaction. An order that cannot be written is rolled back to its savepoint on its own;
+        # its exception takes the place of its order id in the result, so one bad order never
+        # holds up the rest. Lots, rollup and reorder levels are then updated once for all of them.
+        last_sale_id = self.c.execute("SELECT COALESCE(MAX(id), 0) FROM sales").fetchone()[0]
+        order_ids = []
+        for lines, customer_name, customer_mobile, date_of_sale in orders:
+            self.c.execute("SAVEPOINT order_entry")
+            try:
+                order_ids.append(self.write_order(lines, customer_name, customer_mobile, date_of_sale))
+            except sqlite3.OperationalError:
+                # Locks and I/O errors are not down to the order; the caller's transaction fails
+                raise
+            except Exception as e:
+                # E.g. the stock ran out, or a field SQLite cannot store
+                self.c.execute("ROLLBACK TO order_entry")
+                order_ids.append(e)
+            self.c.execute("RELEASE order_entry")
+        self.apply_sales_since(last_sale_id)
+        return order_ids
+
+    def write_order(self, lines, customer_name, customer_mobile, date_of_sale):
+        # The orders, order_lines and sales rows of one priced order, inside the caller's transaction.
+        # Reserve stock first so a short line aborts the order before anything is written.
+        inventory = Inventory(self.c)
+        for product_id, product_name, _, quantity, _ in lines:
+            try:
+                inventory.reserve(product_id, quantity, date_of_sale)
+            except InsufficientStock as e:
+                raise InsufficientStock(product_name, quantity, e.available) from None
+
+        self.c.execute("""INSERT INTO orders (date_of_sale, customer_name, customer_mobile, total, line_count)
+                          VALUES (?, ?, ?, ?, ?)""",
+                       (date_of_sale, customer_name, customer_mobile, sum(line[4] for line in lines), len(lines)))
+        order_id = self.c.lastrowid
+        self.c.executemany("""INSERT INTO order_lines (order_id, line_no, product_id, quantity, price, total)
+                              VALUES (?, ?, ?, ?, ?, ?)""",
+                           [(order_id, line_no, product_id, quantity, price, total)
+                            for line_no, (product_id, _, price, quantity, total) in enumerate(lines, start=1)])
+        self.c.executemany("""INSERT INTO sales (product_id, date_of_sale, quantity, total, order_id)
+                              VALUES (?, ?, ?, ?, ?)""",
+                           [(product_id, date_of_sale, quantity, total, order_id)
+                            for product_id, _, _, quantity, total in lines])
+        return order_id
+
+    def apply_sales_since(self, sale_id):
+        # Lots, rollup and reorder levels for every sale written after sale_id, once per transaction
+        StockLots(self.c).allocate_sales_since(sale_id)
+        SalesRollup(self.c).apply_sales_since(sale_id)
+        ReorderLevels(self.c).apply_sales_since(sale_id)
+        query_cache.touch(self.c, *ORDER_TABLES)
@@ -1,9 +1,124 @@
+import csv
+import gzip
 import io
+import tempfile
+
+SALES_EXPORT_COLUMNS = ["id", "date_of_sale", "product_name", "price", "quantity", "total"]
+SALES_EXPORT_QUERY = """SELECT s.id, s.date_of_sale, p.product_name, p.price, s.quantity, s.total
+                        FROM sales s
+                        JOIN products p ON s.product_id = p.id"""
+
+EXPORT_FORMATS = {
+    "CSV": ("sales_data.csv", "text/csv"),
+    "CSV (gzip)": ("sales_data.csv.gz", "application/gzip"),
+    "Parquet": ("sales_data.parquet", "application/octet-stream"),
+}
+
+
+def sales_filters(start_date=None, end_date=None, product_name=None):
+    where, params = [], []
+    if start_date:
+        where.append("s.date_of_sale >= ?")
+        params.append(str(start_date))
+    if end_date:
+        where.append("s.date_of_sale <= ?")
+        params.append(str(end_date))
+    if product_name:
+        where.append("p.product_name = ?")
+        params.append(product_name)
+    return where, params
+
 
 class DataExporter:
+    CHUNK_SIZE = 10000
+    # Exports stay in memory up to this size, then spill to a temporary file on disk
+    SPOOL_SIZE = 8 * 1024 * 1024
+
     @staticmethod
     def export_to_csv(df, filename):
         buffer = io.StringIO()
         df.to_csv(buffer, index=False)
         buffer.seek(0)
         return buffer.getvalue()
+
+    @classmethod
+    def iter_sales(cls, cursor, where=(), params=()):
+        # Yield the sales export in fetchmany() chunks so only one chunk is held at a time
+        query = SALES_EXPORT_QUERY
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY s.id"
+        rows = cursor.execute(query, list(params))
+        while True:
+            chunk = rows.fetchmany(cls.CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    @classmethod
+    def write_sales_csv(cls, cursor, out, where=(), params=(), compress=False, progress=None):
+        raw = gzip.GzipFile(fileobj=out, mode="wb", compresslevel=6) if compress else out
+        text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        writer = csv.writer(text)
+        writer.writerow(SALES_EXPORT_COLUMNS)
+        rows = 0
+        for chunk in cls.iter_sales(cursor, where, params):
+            writer.writerows(chunk)
+            rows += len(chunk)
+            if progress:
+                progress(rows)
+        text.flush()
+        # Detach so closing the wrappers does not close the caller's file
+        text.detach()
+        if compress:
+            raw.close()
+        return rows
+
+    @classmethod
+    def write_sales_parquet(cls, cursor, out, where=(), params=(), progress=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet export needs the optional 'pyarrow' package.")
+
+        schema = pa.schema([("id", pa.int64()), ("date_of_sale", pa.string()), ("product_name", pa.string()),
+                            ("price", pa.float64()), ("quantity", pa.int64()), ("total", pa.float64())])
+        rows = 0
+        with pq.ParquetWriter(out, schema) as writer:
+            # One row group per fetched chunk
+            for chunk in cls.iter_sales(cursor, where, params):
+                writer.write_table(pa.Table.from_pylist(
+                    [dict(zip(SALES_EXPORT_COLUMNS, row)) for row in chunk], schema=schema))
+                rows += len(chunk)
+                if progress:
+                    progress(rows)
+        return rows
+
+    @classmethod
+    def export_sales(cls, cursor, export_format="CSV", where=(), params=(), out=None, progress=None):
+        # Writes to out when given (e.g. a file on disk), otherwise to a spooled temporary file
+        out = tempfile.SpooledTemporaryFile(max_size=cls.SPOOL_SIZE) if out is None else out
+        if export_format == "Parquet":
+            rows = cls.write_sales_parquet(cursor, out, where, params, progress)
+        else:
+            rows = cls.write_sales_csv(cursor, out, where, params, export_format == "CSV (gzip)", progress)
+        out.seek(0)
+        return out, rows
+
+    @staticmethod
+    def count_sales(cursor, where=(), params=()):
+        query = "SELECT COUNT(*) FROM sales s JOIN products p ON s.product_id = p.id"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        return cursor.execute(query, list(params)).fetchone()[0]
+
+
+def export_job(job, export_format, where, params):
+    total = DataExporter.count_sales(job.c, where, params)
+    file_name, mime = EXPORT_FORMATS[export_format]
+    with open(job.output(file_name, mime), "wb") as out:
+        _, rows = DataExporter.export_sales(job.c, export_format, where, params, out,
+                                            lambda rows: job.progress(rows / max(total, 1),
+                                                                      f"{rows:,} / {total:,} rows"))
+    return f"{rows:,} sales exported"
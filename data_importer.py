@@ -1,35 +1,410 @@
-import pandas as pd
+import hashlib
+import os
+import time
+from datetime import datetime
+from itertools import chain
+
 import streamlit as st
 
+from db_manager import run_in_transaction
+from inventory import Inventory
+from lots import StockLots
+from query_cache import query_cache
+from reorder import ReorderLevels
+from rollups import SalesRollup
+
+STOCK_COLUMNS = ["date_added", "product_name", "price", "quantity"]
+# Optional in stock files: what one unit cost to buy, for FIFO costing and margins
+UNIT_COST_COLUMN = "unit_cost"
+SALES_COLUMNS = ["date_of_sale", "product_name", "price", "quantity", "total"]
+
+# kind -> (table, fields that make two rows identical, rows never treated as duplicates,
+# duplicates that may be deleted)
+DEDUPE_KEYS = {
+    # Lots with a different cost are different restocks. A lot that sales have taken units
+    # from stays: its sales are costed from it, and what is left on hand is counted from it.
+    "Stock": ("stock", "product_id, date_added, quantity, unit_cost", "", "remaining = quantity"),
+    # Sales recorded at the checkout belong to an order and are never duplicates of an import
+    "Sales": ("sales", "product_id, date_of_sale, quantity, total", "WHERE order_id IS NULL", "1"),
+}
+# kind -> (column labels, columns) of the duplicates listed for review, from {table} t and products p
+DUPLICATE_PREVIEWS = {
+    "Stock": (["ID", "Date Added", "Product", "Quantity", "Unit Cost", "Imported"],
+              "t.id, t.date_added, p.product_name, t.quantity, t.unit_cost, t.row_hash IS NOT NULL"),
+    "Sales": (["ID", "Date of Sale", "Product", "Quantity", "Total", "Imported"],
+              "t.id, t.date_of_sale, p.product_name, t.quantity, t.total, t.row_hash IS NOT NULL"),
+}
+PREVIEW_ROWS = 200
+# Copies of rows imported before imports were keyed: rows without a key that repeat an
+# earlier row without one field for field (a file imported twice), and keyed rows that repeat
+# one (such a file imported again since), each keyed copy matching one earlier unkeyed row.
+# original is the first unkeyed row, which takes over the key of its first keyed copy.
+DUPLICATES_QUERY = """SELECT id, row_hash, CASE WHEN keyed = 1 THEN original END AS original
+                      FROM (SELECT id, row_hash, {removable} AS removable,
+                                   SUM(row_hash IS NULL) OVER copies AS unkeyed,
+                                   SUM(row_hash IS NOT NULL) OVER copies AS keyed,
+                                   MIN(CASE WHEN row_hash IS NULL THEN id END) OVER copies AS original
+                            FROM {table} {where}
+                            WINDOW copies AS (PARTITION BY {key} ORDER BY id))
+                      WHERE removable AND CASE WHEN row_hash IS NULL THEN unkeyed > 1 ELSE keyed <= unkeyed END"""
+
+
+def row_hashes(source, first_row, *columns):
+    # Import key for each row: a 64-bit hash of the source file name, the row's position in
+    # the file and its fields. The position keeps identical lines of one file apart, while
+    # importing the same file again (or a longer version of it) reproduces the same keys.
+    keys = []
+    for position, fields in enumerate(zip(*columns), first_row):
+        text = "\x1f".join([source, str(position)] + [str(field) for field in fields])
+        keys.append(int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big", signed=True))
+    return keys
+
+
+def _source_name(file):
+    return os.path.basename(file if isinstance(file, str) else getattr(file, "name", ""))
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
 class DataImporter:
+    CHUNK_SIZE = 50000
+    # Stay well below SQLite's bound-parameter limit when resolving product ids
+    LOOKUP_BATCH = 500
+    SCAN_BLOCK_SIZE = 1 << 20
+
     def __init__(self, cursor):
         self.c = cursor
 
-    def import_from_csv(self, file):
+    def import_from_csv(self, file, streaming=False):
+        try:
+            if streaming:
+                self._streaming_import(file)
+            else:
+                self._bulk_import(file)
+        except ImportFormatError as e:
+            st.error(str(e))
+        except Exception as e:
+            st.error(f"An error occurred while importing data: {e}")
+
+    @staticmethod
+    def _detect_kind(columns):
+        if all(col in columns for col in STOCK_COLUMNS):
+            return "Stock"
+        if all(col in columns for col in SALES_COLUMNS):
+            return "Sales"
+        return None
+
+    @staticmethod
+    def _written_tables(kind):
+        if kind == "Stock":
+            return "products", "stock", "inventory", "stock_alerts"
+        return "products", "sales", "inventory", "sales_daily", "stock", "sale_lots", "reorder_levels", "stock_alerts"
+
+    def _import_chunk(self, kind, chunk, product_ids, source, first_row):
+        # Returns the number of rows inserted; rows already imported are skipped
+        if kind == "Stock":
+            return self._import_stock_chunk(chunk, product_ids, source, first_row)
+        return self._import_sales_chunk(chunk, product_ids, source, first_row)
+
+    def _last_id(self, kind):
+        table = "stock" if kind == "Stock" else "sales"
+        return self.c.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+
+    def _apply_since(self, kind, last_id):
+        # Bring inventory, the FIFO lots, the sales rollup and the reorder alerts up to date
+        # with the rows imported after last_id
+        if kind == "Stock":
+            Inventory(self.c).apply_stock_since(last_id)
+            StockLots(self.c).open_lots_since(last_id)
+            ReorderLevels(self.c).apply_stock_since(last_id)
+        else:
+            Inventory(self.c).apply_sales_since(last_id)
+            StockLots(self.c).allocate_sales_since(last_id)
+            SalesRollup(self.c).apply_sales_since(last_id)
+            ReorderLevels(self.c).apply_sales_since(last_id)
+
+    def bulk_import(self, file):
+        # Import the whole file in one transaction; returns (kind, rows inserted,
+        # rows skipped as already imported, seconds)
+        import pandas as pd
+
+        start = time.perf_counter()
+        chunks = pd.read_csv(file, chunksize=self.CHUNK_SIZE)
+        first_chunk = next(chunks)
+        kind = self._detect_kind(first_chunk.columns)
+        if kind is None:
+            raise ImportFormatError("CSV file does not match expected format.")
+
+        product_ids = {}
+        source = _source_name(file)
+        rows = inserted = 0
+        self.c.execute("BEGIN IMMEDIATE")
+        try:
+            last_id = self._last_id(kind)
+            for chunk in chain([first_chunk], chunks):
+                inserted += self._import_chunk(kind, chunk, product_ids, source, rows)
+                rows += len(chunk)
+            # Once for the whole file, so the open lots are only read once
+            self._apply_since(kind, last_id)
+            query_cache.touch(self.c, *self._written_tables(kind))
+            self.c.connection.commit()
+        except Exception:
+            self.c.connection.rollback()
+            raise
+        query_cache.invalidate(*self._written_tables(kind))
+        return kind, inserted, rows - inserted, time.perf_counter() - start
+
+    def streaming_import(self, file, progress=None):
+        # Commit and checkpoint every chunk, resuming after the last committed chunk of an
+        # interrupted import of the same file. progress(done, total_rows, rows_per_sec) is
+        # called after each chunk. Returns (kind, rows inserted, rows skipped as duplicates,
+        # rows skipped by resuming), or (kind, 0, 0, total_rows) when the file was imported before.
+        import pandas as pd
+
+        file_hash, total_rows = self._scan_file(file)
+        checkpoint = self.c.execute(
+            "SELECT rows_committed, completed, kind FROM import_checkpoints WHERE file_hash=?", (file_hash,)
+        ).fetchone()
+        if checkpoint and checkpoint[1]:
+            return checkpoint[2], 0, 0, total_rows
+        skip, _, kind = checkpoint if checkpoint else (0, 0, None)
+
+        # Keep the header row and skip data rows that are already committed. A callable rather
+        # than a range, which pandas would turn into a set of every skipped row number.
+        chunks = pd.read_csv(file, chunksize=self.CHUNK_SIZE, skiprows=(lambda i: 0 < i <= skip) if skip else None)
+        start = time.perf_counter()
+        product_ids = {}
+        source = _source_name(file)
+        done = skip
+        inserted = 0
+        for chunk in chunks:
+            if kind is None:
+                kind = self._detect_kind(chunk.columns)
+                if kind is None:
+                    raise ImportFormatError("CSV file does not match expected format.")
+
+            # Write lock up front: a deferred transaction that reads first fails outright, rather
+            # than waiting, when another import or job writes at the same time
+            self.c.execute("BEGIN IMMEDIATE")
+            try:
+                last_id = self._last_id(kind)
+                inserted += self._import_chunk(kind, chunk, product_ids, source, done)
+                self._apply_since(kind, last_id)
+                done += len(chunk)
+                self._save_checkpoint(file_hash, getattr(file, "name", str(file)), kind, done, total_rows, 0)
+                query_cache.touch(self.c, *self._written_tables(kind))
+                self.c.connection.commit()
+            except Exception:
+                self.c.connection.rollback()
+                raise
+            query_cache.invalidate(*self._written_tables(kind))
+            if progress:
+                progress(done, total_rows, (done - skip) / max(time.perf_counter() - start, 1e-9))
+
+        if kind is None:
+            raise ImportFormatError("CSV file does not match expected format.")
+
+        self._save_checkpoint(file_hash, getattr(file, "name", str(file)), kind, done, total_rows, 1)
+        self.c.connection.commit()
+        return kind, inserted, done - skip - inserted, skip
+
+    @staticmethod
+    def _show_duplicates(kind, duplicates):
+        if duplicates:
+            st.info(f"{duplicates:,} {kind.lower()} rows were already imported and have been skipped.")
+
+    def _bulk_import(self, file):
+        kind, inserted, duplicates, elapsed = self.bulk_import(file)
+        elapsed = max(elapsed, 1e-9)
+        rows = inserted + duplicates
+        st.success(f"{kind} data imported successfully! {inserted:,} rows inserted "
+                   f"({rows:,} read in {elapsed:.2f}s, {rows / elapsed:,.0f} rows/sec)")
+        self._show_duplicates(kind, duplicates)
+
+    def _streaming_import(self, file):
+        progress_bar = st.progress(0.0, text="Starting import...")
+
+        def progress(done, total_rows, rate):
+            progress_bar.progress(min(done / max(total_rows, 1), 1.0),
+                                  text=f"{done:,} / {total_rows:,} rows ({rate:,.0f} rows/sec)")
+
         try:
-            df = pd.read_csv(file)
-            if all(col in df.columns for col in ["date_added", "product_name", "price", "quantity"]):
-                # Import stock data
-                for _, row in df.iterrows():
-                    self.c.execute("INSERT OR IGNORE INTO products (product_name, price) VALUES (?, ?)",
-                                   (row['product_name'], row['price']))
-                    product_id = self.c.execute("SELECT id FROM products WHERE product_name=?", (row['product_name'],)).fetchone()[0]
-                    self.c.execute("INSERT INTO stock (product_id, date_added, quantity) VALUES (?, ?, ?)",
-                                   (product_id, row['date_added'], row['quantity']))
-                st.success("Stock data imported successfully!")
-
-            elif all(col in df.columns for col in ["date_of_sale", "product_name", "price", "quantity", "total"]):
-                # Import sales data
-                for _, row in df.iterrows():
-                    self.c.execute("INSERT OR IGNORE INTO products (product_name, price) VALUES (?, ?)",
-                                   (row['product_name'], row['price']))
-                    product_id = self.c.execute("SELECT id FROM products WHERE product_name=?", (row['product_name'],)).fetchone()[0]
-                    self.c.execute("INSERT INTO sales (product_id, date_of_sale, quantity, total) VALUES (?, ?, ?, ?)",
-                                   (product_id, row['date_of_sale'], row['quantity'], row['total']))
-                st.success("Sales data imported successfully!")
+            kind, inserted, duplicates, resumed = self.streaming_import(file, progress)
+        finally:
+            progress_bar.empty()
+        if not inserted and not duplicates and resumed:
+            st.warning("This file has already been imported.")
+            return
+        if resumed:
+            st.info(f"Resumed interrupted import after row {resumed:,}.")
+        st.success(f"{kind} data imported successfully! {inserted:,} rows inserted.")
+        self._show_duplicates(kind, duplicates)
+
+    @staticmethod
+    def _duplicates_query(kind):
+        table, key, where, removable = DEDUPE_KEYS[kind]
+        return table, DUPLICATES_QUERY.format(table=table, key=key, where=where, removable=removable)
+
+    def count_duplicates(self, kind):
+        _, query = self._duplicates_query(kind)
+        return self.c.execute(f"SELECT COUNT(*) FROM ({query})").fetchone()[0]
+
+    def duplicate_preview(self, kind, limit=PREVIEW_ROWS):
+        # The first duplicates remove_duplicates would delete, as (labels, rows)
+        table, query = self._duplicates_query(kind)
+        labels, columns = DUPLICATE_PREVIEWS[kind]
+        rows = self.c.execute(f"""SELECT {columns} FROM {table} t JOIN products p ON t.product_id = p.id
+                                  WHERE t.id IN (SELECT id FROM ({query}))
+                                  ORDER BY t.id LIMIT ?""", (limit,)).fetchall()
+        return labels, rows
 
+    def remove_duplicates(self, kind):
+        # Delete copies of rows imported before imports were keyed (see DUPLICATES_QUERY).
+        # Inventory and the sales rollup give back what the deleted rows added, and the kept
+        # rows take over the keys of their deleted copies, so importing the same file once
+        # more inserts nothing. Returns the rows deleted.
+        table, query = self._duplicates_query(kind)
+
+        def work():
+            self.c.execute("DROP TABLE IF EXISTS temp.duplicate_ids")
+            self.c.execute("CREATE TEMP TABLE duplicate_ids AS " + query)
+            if kind == "Stock":
+                Inventory(self.c).reverse_stock("temp.duplicate_ids")
+            else:
+                Inventory(self.c).reverse_sales("temp.duplicate_ids")
+                StockLots(self.c).reverse_sales("temp.duplicate_ids")
+                SalesRollup(self.c).reverse_sales("temp.duplicate_ids")
+            product_ids = [product_id for (product_id,) in self.c.execute(
+                f"SELECT DISTINCT product_id FROM {table} WHERE id IN (SELECT id FROM temp.duplicate_ids)").fetchall()]
+            self.c.execute(f"DELETE FROM {table} WHERE id IN (SELECT id FROM temp.duplicate_ids)")
+            removed = self.c.rowcount
+            self.c.execute(f"""UPDATE {table} SET row_hash = (SELECT d.row_hash FROM temp.duplicate_ids d
+                                                              WHERE d.original = {table}.id)
+                               WHERE id IN (SELECT original FROM temp.duplicate_ids)""")
+            self.c.execute("DROP TABLE temp.duplicate_ids")
+            if kind == "Sales" and removed:
+                # Velocities cannot be unfolded, so recompute them
+                ReorderLevels(self.c).rebuild()
             else:
-                st.error("CSV file does not match expected format.")
+                ReorderLevels(self.c).update_alerts(product_ids)
+            if removed:
+                query_cache.touch(self.c, *self._written_tables(kind))
+            return removed
+
+        removed = run_in_transaction(self.c.connection, work)
+        if removed:
+            query_cache.invalidate(*self._written_tables(kind))
+            if kind == "Sales":
+                # The snapshot only appends new sales, so reload it from scratch
+                from snapshot import snapshot_for
 
+                snapshot_for(self.c).clear()
+        return removed
+
+    def clean_duplicates(self):
+        st.caption("Finds copies of rows imported before imports skipped rows they had already seen: rows "
+                   "that repeat an earlier row field for field, from a file imported twice then or imported "
+                   "again since. Restocks that sales have already taken units from are kept. "
+                   "Sales recorded at the checkout are never removed. Restocks or sales entered by hand "
+                   "cannot be told apart from such rows, so check the rows found before removing them.")
+        try:
+            if st.button("Find duplicates"):
+                import pandas as pd
+
+                for kind in DEDUPE_KEYS:
+                    count = self.count_duplicates(kind)
+                    st.write(f"**{kind}:** {count:,} duplicate rows")
+                    if count:
+                        labels, rows = self.duplicate_preview(kind)
+                        st.dataframe(pd.DataFrame(rows, columns=labels), hide_index=True)
+                        if count > len(rows):
+                            st.caption(f"Showing the first {len(rows):,}.")
+            confirmed = st.checkbox("I have checked that the rows found are duplicates, not separate restocks or "
+                                    "sales that happen to match")
+            if st.button("Remove duplicates", disabled=not confirmed):
+                for kind in DEDUPE_KEYS:
+                    st.write(f"**{kind}:** removed {self.remove_duplicates(kind):,} duplicate rows")
         except Exception as e:
-            st.error(f"An error occurred while importing data: {e}")
+            st.error(f"An error occurred while removing duplicates: {e}")
+
+    def _save_checkpoint(self, file_hash, file_name, kind, rows_committed, total_rows, completed):
+        self.c.execute("""INSERT OR REPLACE INTO import_checkpoints
+                          (file_hash, file_name, kind, rows_committed, total_rows, completed, updated_at)
+                          VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                       (file_hash, file_name, kind, rows_committed, total_rows, completed,
+                        datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+    def _scan_file(self, file):
+        # Hash the upload and count its data rows in one bounded-memory pass
+        digest = hashlib.sha256()
+        newlines = 0
+        last_block = b""
+        handle = file if hasattr(file, "read") else open(file, "rb")
+        try:
+            for block in iter(lambda: handle.read(self.SCAN_BLOCK_SIZE), b""):
+                digest.update(block)
+                newlines += block.count(b"\n")
+                last_block = block
+        finally:
+            if handle is file:
+                file.seek(0)
+            else:
+                handle.close()
+        lines = newlines + (1 if last_block and not last_block.endswith(b"\n") else 0)
+        return digest.hexdigest(), max(lines - 1, 0)
+
+    def _resolve_product_ids(self, chunk, product_ids):
+        # Upsert each distinct product once, then map names to ids in batches
+        new_products = chunk.drop_duplicates("product_name")
+        new_products = new_products[~new_products["product_name"].isin(product_ids)]
+        if not new_products.empty:
+            names = new_products["product_name"].tolist()
+            self.c.executemany("INSERT OR IGNORE INTO products (product_name, price) VALUES (?, ?)",
+                               zip(names, new_products["price"].tolist()))
+            for i in range(0, len(names), self.LOOKUP_BATCH):
+                batch = names[i:i + self.LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                product_ids.update(
+                    (name, product_id) for product_id, name in self.c.execute(
+                        f"SELECT id, product_name FROM products WHERE product_name IN ({placeholders})", batch)
+                )
+        return chunk["product_name"].map(product_ids).tolist()
+
+    def _import_stock_chunk(self, chunk, product_ids, source, first_row):
+        ids = self._resolve_product_ids(chunk, product_ids)
+        columns = [chunk[column].tolist() for column in STOCK_COLUMNS]
+        if UNIT_COST_COLUMN in chunk.columns:
+            unit_costs = chunk[UNIT_COST_COLUMN].astype(object).where(chunk[UNIT_COST_COLUMN].notna(), None).tolist()
+        else:
+            unit_costs = [None] * len(chunk)
+        self.c.executemany("""INSERT OR IGNORE INTO stock (product_id, date_added, quantity, unit_cost, row_hash)
+                              VALUES (?, ?, ?, ?, ?)""",
+                           zip(ids, columns[0], columns[3], unit_costs, row_hashes(source, first_row, *columns)))
+        return self.c.rowcount
+
+    def _import_sales_chunk(self, chunk, product_ids, source, first_row):
+        ids = self._resolve_product_ids(chunk, product_ids)
+        columns = [chunk[column].tolist() for column in SALES_COLUMNS]
+        self.c.executemany("""INSERT OR IGNORE INTO sales (product_id, date_of_sale, quantity, total, row_hash)
+                              VALUES (?, ?, ?, ?, ?)""",
+                           zip(ids, columns[0], columns[3], columns[4], row_hashes(source, first_row, *columns)))
+        return self.c.rowcount
+
+
+def import_job(job, path):
+    # Background import of a saved upload; streaming, so an interrupted job resumes when resubmitted
+    def progress(done, total_rows, rate):
+        job.progress(done / max(total_rows, 1), f"{done:,} / {total_rows:,} rows ({rate:,.0f} rows/sec)")
+
+    # The copy goes whether or not the import succeeds; a failed import is resubmitted by uploading again
+    try:
+        kind, inserted, duplicates, resumed = DataImporter(job.c).streaming_import(path, progress)
+    finally:
+        job.runner.discard_upload(path)
+    if not inserted and not duplicates and resumed:
+        return "This file has already been imported."
+    return (f"{kind} data imported: {inserted:,} rows inserted"
+            + (f", {duplicates:,} already imported rows skipped" if duplicates else "")
+            + (f", resumed after row {resumed:,}" if resumed else ""))
@@ -1,22 +1,275 @@
+import os
+import queue
+import random
 import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from catalog import create_products_fts
+from lots import open_existing_lots
+from query_stats import InstrumentedConnection
+from reorder import rebuild_reorder_levels
+
+# Applied to every pooled connection: WAL lets readers run alongside the writer,
+# and busy_timeout makes writers wait for the lock instead of failing immediately.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+)
+
+# Ordered schema migrations. Each step runs once and is recorded in schema_version;
+# steps may be SQL strings or callables taking the connection.
+MIGRATIONS = [
+    (1, "base tables", [
+        '''CREATE TABLE IF NOT EXISTS products
+           (id INTEGER PRIMARY KEY AUTOINCREMENT, product_name TEXT UNIQUE, price REAL)''',
+        '''CREATE TABLE IF NOT EXISTS stock
+           (id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER, date_added DATE, quantity INTEGER,
+           FOREIGN KEY (product_id) REFERENCES products(id))''',
+        '''CREATE TABLE IF NOT EXISTS sales
+           (id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER, date_of_sale DATE, quantity INTEGER, total REAL,
+           FOREIGN KEY (product_id) REFERENCES products(id))''',
+    ]),
+    (2, "import checkpoints", [
+        '''CREATE TABLE IF NOT EXISTS import_checkpoints
+           (file_hash TEXT PRIMARY KEY, file_name TEXT, kind TEXT, rows_committed INTEGER,
+           total_rows INTEGER, completed INTEGER, updated_at TEXT)''',
+    ]),
+    (3, "query indexes", [
+        # Covers the dashboard's per-date totals and sales joins without touching the table
+        "CREATE INDEX IF NOT EXISTS idx_sales_date_product_total ON sales (date_of_sale, product_id, total)",
+        # Covers per-product quantity rollups (most sold product)
+        "CREATE INDEX IF NOT EXISTS idx_sales_product_quantity ON sales (product_id, quantity)",
+        "CREATE INDEX IF NOT EXISTS idx_stock_product ON stock (product_id)",
+    ]),
+    (4, "inventory", [
+        '''CREATE TABLE IF NOT EXISTS inventory
+           (product_id INTEGER PRIMARY KEY, on_hand INTEGER NOT NULL DEFAULT 0, last_restock DATE, last_sale DATE,
+           FOREIGN KEY (product_id) REFERENCES products(id))''',
+        # Until now sales adjusted stock rows in place, so the stock rows already hold what is on hand
+        '''INSERT OR IGNORE INTO inventory (product_id, on_hand, last_restock, last_sale)
+           SELECT p.id,
+                  COALESCE((SELECT SUM(quantity) FROM stock WHERE product_id = p.id), 0),
+                  (SELECT MAX(date_added) FROM stock WHERE product_id = p.id),
+                  (SELECT MAX(date_of_sale) FROM sales WHERE product_id = p.id)
+           FROM products p''',
+    ]),
+    (5, "daily sales rollup", [
+        '''CREATE TABLE IF NOT EXISTS sales_daily
+           (date DATE, product_id INTEGER, qty INTEGER NOT NULL, revenue REAL NOT NULL, count INTEGER NOT NULL,
+           PRIMARY KEY (date, product_id)) WITHOUT ROWID''',
+        '''INSERT INTO sales_daily (date, product_id, qty, revenue, count)
+           SELECT date_of_sale, product_id, SUM(quantity), SUM(total), COUNT(*)
+           FROM sales
+           WHERE date_of_sale IS NOT NULL AND product_id IS NOT NULL
+           GROUP BY date_of_sale, product_id''',
+    ]),
+    (6, "pagination indexes", [
+        # (date, rowid) order for keyset pages of the sales and restock tables
+        "CREATE INDEX IF NOT EXISTS idx_sales_date ON sales (date_of_sale)",
+        "CREATE INDEX IF NOT EXISTS idx_stock_date ON stock (date_added)",
+    ]),
+    (7, "orders", [
+        '''CREATE TABLE IF NOT EXISTS orders
+           (id INTEGER PRIMARY KEY AUTOINCREMENT, date_of_sale DATE, customer_name TEXT, customer_mobile TEXT,
+           total REAL, line_count INTEGER)''',
+        '''CREATE TABLE IF NOT EXISTS order_lines
+           (order_id INTEGER, line_no INTEGER, product_id INTEGER, quantity INTEGER, price REAL, total REAL,
+           PRIMARY KEY (order_id, line_no),
+           FOREIGN KEY (order_id) REFERENCES orders(id),
+           FOREIGN KEY (product_id) REFERENCES products(id))''',
+        # Sales rows written by a checkout point back at their order
+        "ALTER TABLE sales ADD COLUMN order_id INTEGER REFERENCES orders(id)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_order ON sales (order_id)",
+    ]),
+    (8, "product search index", [create_products_fts]),
+    (9, "background jobs", [
+        '''CREATE TABLE IF NOT EXISTS jobs
+           (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, label TEXT, status TEXT NOT NULL,
+           progress REAL NOT NULL DEFAULT 0, message TEXT, result_path TEXT, result_name TEXT, result_mime TEXT,
+           error TEXT, created_at TEXT, started_at TEXT, finished_at TEXT)''',
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)",
+    ]),
+    (10, "import row keys", [
+        # Imported rows carry a hash of their source file, position and fields, so importing
+        # a file again inserts nothing. Rows entered by hand have no key and are not indexed.
+        "ALTER TABLE sales ADD COLUMN row_hash INTEGER",
+        "ALTER TABLE stock ADD COLUMN row_hash INTEGER",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_sales_row_hash ON sales (row_hash) WHERE row_hash IS NOT NULL",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_stock_row_hash ON stock (row_hash) WHERE row_hash IS NOT NULL",
+    ]),
+    (11, "stock lots", [
+        # Each restock is a FIFO lot: its unit cost and how many of its units are still unsold
+        "ALTER TABLE stock ADD COLUMN unit_cost REAL",
+        "ALTER TABLE stock ADD COLUMN remaining INTEGER NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS idx_stock_open_lots ON stock (product_id, date_added) WHERE remaining > 0",
+        # The units each sale took from each lot, and the sale's cost of goods sold
+        '''CREATE TABLE IF NOT EXISTS sale_lots
+           (sale_id INTEGER, stock_id INTEGER, quantity INTEGER NOT NULL, unit_cost REAL,
+           PRIMARY KEY (sale_id, stock_id),
+           FOREIGN KEY (sale_id) REFERENCES sales(id),
+           FOREIGN KEY (stock_id) REFERENCES stock(id)) WITHOUT ROWID''',
+        "ALTER TABLE sales ADD COLUMN cogs REAL",
+        # Cost of the day's costed sales, and the revenue of those sales, for margins
+        "ALTER TABLE sales_daily ADD COLUMN cogs REAL NOT NULL DEFAULT 0",
+        "ALTER TABLE sales_daily ADD COLUMN costed_revenue REAL NOT NULL DEFAULT 0",
+        open_existing_lots,
+    ]),
+    (12, "reorder alerts", [
+        # EWMA units sold per day as of rate_date, and optional per-product reorder policy
+        '''CREATE TABLE IF NOT EXISTS reorder_levels
+           (product_id INTEGER PRIMARY KEY, daily_rate REAL NOT NULL DEFAULT 0, rate_date DATE,
+           lead_time_days REAL, safety_days REAL,
+           FOREIGN KEY (product_id) REFERENCES products(id))''',
+        # Products at or below their reorder point
+        '''CREATE TABLE IF NOT EXISTS stock_alerts
+           (product_id INTEGER PRIMARY KEY, on_hand INTEGER, daily_rate REAL, days_of_cover REAL,
+           reorder_point REAL, raised_at TEXT,
+           FOREIGN KEY (product_id) REFERENCES products(id))''',
+        rebuild_reorder_levels,
+    ]),
+    (13, "sale queue", [
+        # The last write-behind journal entry applied, committed with the sales it wrote
+        '''CREATE TABLE IF NOT EXISTS sale_queue
+           (id INTEGER PRIMARY KEY CHECK (id = 1), applied_seq INTEGER NOT NULL)''',
+        "INSERT OR IGNORE INTO sale_queue (id, applied_seq) VALUES (1, 0)",
+        # Queued sales that could not be applied, e.g. because the stock ran out first
+        '''CREATE TABLE IF NOT EXISTS sale_queue_rejects
+           (seq INTEGER PRIMARY KEY, entry TEXT, error TEXT, rejected_at TEXT)''',
+    ]),
+    (14, "sale queue numbers", [
+        # Journal sequence numbers handed out so far, so they stay unique across processes and restarts
+        "ALTER TABLE sale_queue ADD COLUMN reserved_seq INTEGER NOT NULL DEFAULT 0",
+        "UPDATE sale_queue SET reserved_seq = applied_seq",
+    ]),
+    (15, "table versions", [
+        # Bumped in the transaction of each write to a cached table, so other processes' query caches notice it
+        '''CREATE TABLE IF NOT EXISTS table_versions
+           (name TEXT PRIMARY KEY, version INTEGER NOT NULL) WITHOUT ROWID''',
+    ]),
+]
+
+
+def migrate(conn, target_version=None):
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                    (version INTEGER PRIMARY KEY, name TEXT, applied_at TEXT)''')
+    conn.commit()
+    applied_versions = {row[0] for row in conn.execute("SELECT version FROM schema_version")}
+    for version, name, steps in MIGRATIONS:
+        if target_version is not None and version > target_version:
+            break
+        if version in applied_versions:
+            continue
+        # Take the write lock before checking, so concurrent processes apply each step once
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            applied = conn.execute("SELECT 1 FROM schema_version WHERE version=?", (version,)).fetchone()
+            if not applied:
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(step)
+                conn.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                             (version, name, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def schema_version(conn):
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def _is_contention(error):
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+def run_in_transaction(conn, work, retries=5, base_delay=0.05, max_delay=1.0):
+    # Run work() inside BEGIN IMMEDIATE and commit. The write lock is taken up front, so
+    # read-then-write sequences inside work() cannot interleave with another writer.
+    # Lock contention beyond busy_timeout is retried with jittered exponential backoff.
+    for attempt in range(retries + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work()
+                conn.commit()
+                return result
+            except Exception:
+                conn.rollback()
+                raise
+        except sqlite3.OperationalError as e:
+            if not _is_contention(e) or attempt == retries:
+                raise
+            time.sleep(min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+
+class ConnectionPool:
+    def __init__(self, db_name, size=8):
+        self.db_name = db_name
+        self._idle = queue.LifoQueue(maxsize=size)
+        conn = self._connect()
+        migrate(conn)
+        self.release(conn)
+
+    def _connect(self):
+        # Connections are handed between Streamlit script threads, but only one holder uses each at a time.
+        # Every statement run through them is timed into query_stats.
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, factory=InstrumentedConnection)
+        # Which store's file this is, so process-wide caches keep each database's results apart
+        conn.db_name = os.path.abspath(self.db_name)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_name='shop_data.db'):
+    key = os.path.abspath(db_name)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_name)
+        return pool
+
 
 class DBManager:
     def __init__(self, db_name='shop_data.db'):
-        self.conn = sqlite3.connect(db_name)
+        self.pool = get_pool(db_name)
+        self.conn = self.pool.acquire()
         self.c = self.conn.cursor()
-        self._init_db()
-
-    def _init_db(self):
-        self.c.execute('''CREATE TABLE IF NOT EXISTS products
-                         (id INTEGER PRIMARY KEY AUTOINCREMENT, product_name TEXT UNIQUE, price REAL)''')
-        self.c.execute('''CREATE TABLE IF NOT EXISTS stock
-                         (id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER, date_added DATE, quantity INTEGER,
-                         FOREIGN KEY (product_id) REFERENCES products(id))''')
-        self.c.execute('''CREATE TABLE IF NOT EXISTS sales
-                         (id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER, date_of_sale DATE, quantity INTEGER, total REAL,
-                         FOREIGN KEY (product_id) REFERENCES products(id))''')
-        self.conn.commit()
 
     def close(self):
         self.conn.commit()
-        self.conn.close()
+        self.pool.release(self.conn)
@@ -0,0 +1,79 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from db_manager import get_pool
+from sales_manager import GRANULARITIES, TOP_PRODUCTS, SalesManager
+from stores import list_stores, store_db
+
+# Chain-wide reporting over the per-store databases. Every store answers the dashboard
+# aggregates from its own sales_daily rollup, on its own connection and thread (SQLite lets
+# go of the GIL while a statement runs), and only the small partial results are merged here.
+# Products are matched by name, as every store numbers its products independently.
+MAX_WORKERS = os.cpu_count() or 1
+
+
+def _on_store(store_id, work):
+    pool = get_pool(store_db(store_id))
+    conn = pool.acquire()
+    try:
+        return work(SalesManager(conn.cursor()))
+    finally:
+        pool.release(conn)
+
+
+def map_stores(work, stores=None, workers=None):
+    # work(sales manager) on every store in parallel -> {store id: result}
+    stores = list_stores() if stores is None else list(stores)
+    with ThreadPoolExecutor(max_workers=workers or max(1, min(len(stores), MAX_WORKERS))) as executor:
+        return dict(zip(stores, executor.map(lambda store_id: _on_store(store_id, work), stores)))
+
+
+def federated_date_range(stores=None, workers=None):
+    ranges = [dates for dates in map_stores(lambda sales: sales.dashboard_query("date_range")[0],
+                                            stores, workers).values() if dates[0] is not None]
+    if not ranges:
+        return None, None
+    return min(first for first, _ in ranges), max(last for _, last in ranges)
+
+
+def store_dashboard(sales, start_date, end_date, granularity="Day"):
+    # One store's partial aggregates; every part can be summed with another store's
+    window = (start_date, end_date)
+    return {"totals": tuple(sales.dashboard_query("totals", window)[0]),
+            "product_totals": sales.dashboard_query("product_totals", window),
+            "sales_over_time": sales.dashboard_query("sales_over_time", window, GRANULARITIES[granularity])}
+
+
+def merge_dashboards(partials, top_n=TOP_PRODUCTS):
+    # Partial aggregates of several stores -> the figures SalesManager.rollup_dashboard returns
+    total_sales, num_sales = 0, 0
+    products = defaultdict(lambda: [0, 0.0])
+    periods = defaultdict(float)
+    for partial in partials:
+        revenue, count = partial["totals"]
+        total_sales += revenue
+        num_sales += count
+        for product_name, quantity, revenue in partial["product_totals"]:
+            products[product_name][0] += quantity or 0
+            products[product_name][1] += revenue or 0.0
+        for bucket, revenue in partial["sales_over_time"]:
+            periods[bucket] += revenue
+
+    most_sold_product = max(products.items(), key=lambda item: item[1][0], default=None)
+    ranked = sorted(products.items(), key=lambda item: item[1][1], reverse=True)
+    sales_by_product = [(product_name, revenue) for product_name, (_, revenue) in ranked[:top_n]]
+    if len(ranked) > top_n:
+        sales_by_product.append(("Other", sum(revenue for _, (_, revenue) in ranked[top_n:])))
+    return {"totals": (total_sales, num_sales),
+            "most_sold_product": (most_sold_product[0], most_sold_product[1][0]) if most_sold_product else None,
+            "sales_over_time": sorted(periods.items()),
+            "sales_by_product": sales_by_product}
+
+
+def federated_dashboard(start_date, end_date, granularity="Day", top_n=TOP_PRODUCTS, stores=None, workers=None):
+    # The Sales Dashboard figures for the whole chain, plus (store, total sales, number of sales)
+    partials = map_stores(lambda sales: store_dashboard(sales, start_date, end_date, granularity), stores, workers)
+    data = merge_dashboards(partials.values(), top_n)
+    data["stores"] = [(store_id, *partial["totals"]) for store_id, partial in partials.items()]
+    return data
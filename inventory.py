@@ -0,0 +1,59 @@
+class InsufficientStock(Exception):
+    def __init__(self, product, requested, available):
+        super().__init__(f"Only {available} of {product} in stock, {requested} requested.")
+        self.product = product
+        self.requested = requested
+        self.available = available
+
+
+class Inventory:
+    # Keeps the per-product inventory row in step with the stock/sales ledgers.
+    # Callers write the ledger row and call these in the same transaction.
+    def __init__(self, cursor):
+        self.c = cursor
+
+    def on_hand(self, product_id):
+        row = self.c.execute("SELECT on_hand FROM inventory WHERE product_id=?", (product_id,)).fetchone()
+        return row[0] if row else 0
+
+    def reserve(self, product_id, quantity, date_of_sale):
+        # Conditional decrement: succeeds only while enough stock is on hand.
+        # Run it inside run_in_transaction so the check and the write hold the write lock together.
+        self.c.execute("""UPDATE inventory SET on_hand = on_hand - ?,
+                              last_sale = MAX(COALESCE(last_sale, ?), ?)
+                          WHERE product_id = ? AND on_hand >= ?""",
+                       (quantity, date_of_sale, date_of_sale, product_id, quantity))
+        if self.c.rowcount == 0:
+            raise InsufficientStock(product_id, quantity, self.on_hand(product_id))
+
+    def apply_stock_since(self, stock_id):
+        # Fold every stock row written after stock_id into inventory (bulk imports)
+        self.c.execute("""INSERT INTO inventory (product_id, on_hand, last_restock)
+                          SELECT product_id, SUM(quantity), MAX(date_added) FROM stock
+                          WHERE id > ? GROUP BY product_id
+                          ON CONFLICT(product_id) DO UPDATE SET
+                              on_hand = on_hand + excluded.on_hand,
+                              last_restock = MAX(COALESCE(last_restock, excluded.last_restock), excluded.last_restock)""",
+                       (stock_id,))
+
+    def apply_sales_since(self, sale_id):
+        self.c.execute("""INSERT INTO inventory (product_id, on_hand, last_sale)
+                          SELECT product_id, -SUM(quantity), MAX(date_of_sale) FROM sales
+                          WHERE id > ? GROUP BY product_id
+                          ON CONFLICT(product_id) DO UPDATE SET
+                              on_hand = on_hand + excluded.on_hand,
+                              last_sale = MAX(COALESCE(last_sale, excluded.last_sale), excluded.last_sale)""",
+                       (sale_id,))
+
+    def reverse_stock(self, id_table):
+        # Take back the restocks whose ids are listed in id_table, before they are deleted
+        self.c.execute(f"""INSERT INTO inventory (product_id, on_hand)
+                           SELECT product_id, -SUM(quantity) FROM stock
+                           WHERE id IN (SELECT id FROM {id_table}) GROUP BY product_id
+                           ON CONFLICT(product_id) DO UPDATE SET on_hand = on_hand + excluded.on_hand""")
+
+    def reverse_sales(self, id_table):
+        self.c.execute(f"""INSERT INTO inventory (product_id, on_hand)
+                           SELECT product_id, SUM(quantity) FROM sales
+                           WHERE id IN (SELECT id FROM {id_table}) GROUP BY product_id
+                           ON CONFLICT(product_id) DO UPDATE SET on_hand = on_hand + excluded.on_hand""")
@@ -0,0 +1,153 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from db_manager import DBManager, get_pool, run_in_transaction
+
+ACTIVE = ("queued", "running")
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class Job:
+    # Handed to a job function: its own pooled cursor, progress reporting and output files
+    def __init__(self, runner, job_id, cursor):
+        self.runner = runner
+        self.id = job_id
+        self.c = cursor
+
+    def progress(self, fraction, message=None):
+        fields = {"progress": max(0.0, min(fraction, 1.0))}
+        if message is not None:
+            fields["message"] = message
+        self.runner.update(self.id, **fields)
+
+    def output(self, file_name, mime):
+        # Path the job should write its downloadable result to
+        path = os.path.join(self.runner.results_dir, f"{self.id}-{file_name}")
+        self.runner.update(self.id, result_path=path, result_name=file_name, result_mime=mime)
+        return path
+
+
+class JobRunner:
+    # Runs imports, exports and report rendering off the Streamlit script thread. The jobs
+    # table records status, progress and result files, so any session can follow a job.
+    def __init__(self, db_name, workers=2):
+        self.db_name = db_name
+        self.pool = get_pool(db_name)
+        # One results folder per database file, as job ids restart in every store's database
+        self.results_dir = os.path.join(os.path.dirname(os.path.abspath(db_name)), "job_results",
+                                        os.path.splitext(os.path.basename(db_name))[0])
+        os.makedirs(self.results_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        # Upload copies this process still has a job for; any other folder under uploads is left over
+        self._uploads = set()
+        self._uploads_lock = threading.Lock()
+        # Jobs still queued or running belonged to a previous process that has gone away
+        self._write("UPDATE jobs SET status='failed', error='Interrupted by an application restart', "
+                    "finished_at=? WHERE status IN ('queued', 'running')", (_now(),))
+
+    def _write(self, query, params=()):
+        conn = self.pool.acquire()
+        try:
+            return run_in_transaction(conn, lambda: conn.execute(query, params).lastrowid)
+        finally:
+            self.pool.release(conn)
+
+    def update(self, job_id, **fields):
+        try:
+            self._write(f"UPDATE jobs SET {', '.join(f'{name}=?' for name in fields)} WHERE id=?",
+                        (*fields.values(), job_id))
+        except sqlite3.OperationalError:
+            # Progress is advisory; a busy database must not fail the job itself
+            if "status" in fields:
+                raise
+
+    def submit(self, kind, label, work, *args):
+        # work(job, *args) runs on a worker thread and returns a short summary message
+        job_id = self._write("INSERT INTO jobs (kind, label, status, created_at) VALUES (?, ?, 'queued', ?)",
+                             (kind, label, _now()))
+        self._executor.submit(self._run, job_id, work, args)
+        return job_id
+
+    def _run(self, job_id, work, args):
+        self.update(job_id, status="running", started_at=_now())
+        db = DBManager(self.db_name)
+        try:
+            message = work(Job(self, job_id, db.c), *args)
+            self.update(job_id, status="done", progress=1.0, message=message, finished_at=_now())
+        except Exception as e:
+            self.update(job_id, status="failed", error=f"{e}\n\n{traceback.format_exc(limit=5)}", finished_at=_now())
+        finally:
+            db.close()
+
+    def _read(self, query, params=()):
+        conn = self.pool.acquire()
+        try:
+            return conn.execute(query, params).fetchall()
+        finally:
+            self.pool.release(conn)
+
+    def jobs(self, limit=50):
+        # Uses its own pooled connection, so it can be polled after the script run has ended
+        return self._read("""SELECT id, kind, label, status, progress, message, result_path, result_name,
+                                    result_mime, error, created_at, started_at, finished_at
+                             FROM jobs ORDER BY id DESC LIMIT ?""", (limit,))
+
+    def clear_finished(self):
+        paths = [row[0] for row in self._read(
+            "SELECT result_path FROM jobs WHERE status NOT IN (?, ?) AND result_path IS NOT NULL", ACTIVE)]
+        self._write("DELETE FROM jobs WHERE status NOT IN (?, ?)", ACTIVE)
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        uploads_dir = os.path.join(self.results_dir, "uploads")
+        with self._uploads_lock:
+            live = {os.path.dirname(path) for path in self._uploads}
+            for name in os.listdir(uploads_dir) if os.path.isdir(uploads_dir) else []:
+                if os.path.join(uploads_dir, name) not in live:
+                    shutil.rmtree(os.path.join(uploads_dir, name), ignore_errors=True)
+
+    def save_upload(self, uploaded_file):
+        # Uploaded files only live for the script run, so copy them where the job can read them.
+        # Each copy gets a folder of its own: uploads with the same name may be imported at the
+        # same time, and the file keeps its name because imported rows are keyed by it.
+        uploads_dir = os.path.join(self.results_dir, "uploads")
+        os.makedirs(uploads_dir, exist_ok=True)
+        path = os.path.join(tempfile.mkdtemp(dir=uploads_dir), os.path.basename(uploaded_file.name))
+        with self._uploads_lock:
+            self._uploads.add(path)
+        uploaded_file.seek(0)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(uploaded_file, f)
+        return path
+
+    def discard_upload(self, path):
+        with self._uploads_lock:
+            self._uploads.discard(path)
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+_runners = {}
+_runners_lock = threading.Lock()
+
+
+def get_runner(db_name='shop_data.db'):
+    key = os.path.abspath(db_name)
+    with _runners_lock:
+        runner = _runners.get(key)
+        if runner is None:
+            runner = _runners[key] = JobRunner(db_name)
+        return runner
+
+
+def runner_for(cursor):
+    # The runner for whichever database file this cursor is connected to
+    return get_runner(cursor.execute("PRAGMA database_list").fetchone()[2])
@@ -0,0 +1,92 @@
+from collections import defaultdict, deque
+
+
+def open_existing_lots(conn):
+    # Migration step: the inventory row already holds what is on hand, so the newest
+    # restocks of each product are the ones still (partly) unsold under FIFO.
+    conn.execute("CREATE TEMP TABLE lot_backfill (id INTEGER PRIMARY KEY, remaining INTEGER)")
+    conn.execute("""INSERT INTO temp.lot_backfill (id, remaining)
+                    SELECT id, MIN(quantity, on_hand - newer) FROM (
+                        SELECT s.id, s.quantity, i.on_hand,
+                               COALESCE(SUM(s.quantity) OVER (PARTITION BY s.product_id
+                                                              ORDER BY s.date_added DESC, s.id DESC
+                                                              ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING), 0)
+                                   AS newer
+                        FROM stock s JOIN inventory i ON i.product_id = s.product_id)
+                    WHERE on_hand - newer > 0 AND quantity > 0""")
+    conn.execute("""UPDATE stock SET remaining = (SELECT remaining FROM temp.lot_backfill b WHERE b.id = stock.id)
+                    WHERE id IN (SELECT id FROM temp.lot_backfill)""")
+    conn.execute("DROP TABLE temp.lot_backfill")
+
+
+class StockLots:
+    # FIFO cost layers over the stock ledger. Every stock row is a lot with a unit cost and
+    # the quantity still unsold (stock.remaining). Each new sale consumes the oldest open
+    # lots of its product; sale_lots records what it took from which lot and sales.cogs
+    # its cost. Callers write the ledger rows and call these in the same transaction,
+    # allocating sales before SalesRollup.apply_sales_since so the rollup sees their cost.
+    BATCH_SIZE = 100000
+
+    def __init__(self, cursor):
+        self.c = cursor
+
+    def open_lots_since(self, stock_id):
+        # Every stock row written after stock_id starts out entirely unsold
+        self.c.execute("UPDATE stock SET remaining = quantity WHERE id > ? AND quantity > 0", (stock_id,))
+
+    def allocate_sales_since(self, sale_id):
+        # Assign every sale written after sale_id to lots, in id order and in batches. The
+        # open lots of the products involved are read once through idx_stock_open_lots. A sale
+        # that finds too little stock, or lots without a cost, takes what there is and keeps
+        # cogs NULL. Returns the number of sales allocated.
+        lots = defaultdict(deque)
+        for lot_id, product_id, remaining, unit_cost in self.c.execute(
+                """SELECT id, product_id, remaining, unit_cost FROM stock
+                   WHERE remaining > 0 AND product_id IN (SELECT DISTINCT product_id FROM sales WHERE id > ?)
+                   ORDER BY product_id, date_added, id""", (sale_id,)).fetchall():
+            lots[product_id].append([lot_id, remaining, unit_cost])
+
+        allocated = 0
+        while True:
+            sales = self.c.execute("SELECT id, product_id, quantity FROM sales WHERE id > ? ORDER BY id LIMIT ?",
+                                   (sale_id, self.BATCH_SIZE)).fetchall()
+            if not sales:
+                return allocated
+            self._allocate(sales, lots)
+            allocated += len(sales)
+            sale_id = sales[-1][0]
+
+    def _allocate(self, sales, lots):
+        allocations = []
+        costs = []
+        touched = {}
+        for sale, product_id, quantity in sales:
+            open_lots = lots.get(product_id)
+            needed = quantity or 0
+            cost = 0.0
+            while needed > 0 and open_lots:
+                lot = open_lots[0]
+                taken = min(needed, lot[1])
+                allocations.append((sale, lot[0], taken, lot[2]))
+                cost = None if cost is None or lot[2] is None else cost + taken * lot[2]
+                lot[1] -= taken
+                needed -= taken
+                touched[lot[0]] = lot[1]
+                if not lot[1]:
+                    open_lots.popleft()
+            if needed <= 0 and cost is not None:
+                costs.append((cost, sale))
+
+        self.c.executemany("INSERT INTO sale_lots (sale_id, stock_id, quantity, unit_cost) VALUES (?, ?, ?, ?)",
+                           allocations)
+        self.c.executemany("UPDATE stock SET remaining = ? WHERE id = ?",
+                           [(remaining, lot_id) for lot_id, remaining in touched.items()])
+        self.c.executemany("UPDATE sales SET cogs = ? WHERE id = ?", costs)
+
+    def reverse_sales(self, id_table):
+        # Put the units taken by the sales whose ids are listed in id_table back into their lots
+        self.c.execute(f"""UPDATE stock SET remaining = remaining + (
+                               SELECT SUM(l.quantity) FROM sale_lots l
+                               WHERE l.stock_id = stock.id AND l.sale_id IN (SELECT id FROM {id_table}))
+                           WHERE id IN (SELECT stock_id FROM sale_lots WHERE sale_id IN (SELECT id FROM {id_table}))""")
+        self.c.execute(f"DELETE FROM sale_lots WHERE sale_id IN (SELECT id FROM {id_table})")
@@ -0,0 +1,25 @@
+import importlib
+import threading
+
+# name -> (module, class); a manager's module is only imported the first time a page asks for it
+MANAGERS = {
+    "stock": ("stock_manager", "StockManager"),
+    "sales": ("sales_manager", "SalesManager"),
+    "importer": ("data_importer", "DataImporter"),
+}
+
+# Managers are built once per pooled connection and live as long as the connection does. They are kept on
+# the connection itself: each holds one of its cursors, so a cache keyed by the connection would keep it alive.
+_managers_lock = threading.Lock()
+
+
+def get_manager(name, conn):
+    with _managers_lock:
+        if not hasattr(conn, "managers"):
+            conn.managers = {}
+        managers = conn.managers
+        manager = managers.get(name)
+        if manager is None:
+            module, class_name = MANAGERS[name]
+            manager = managers[name] = getattr(importlib.import_module(module), class_name)(conn.cursor())
+        return manager
@@ -0,0 +1,74 @@
+import streamlit as st
+
+from catalog import product_search_condition
+from query_cache import query_cache
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+
+def fetch_page(cursor, columns, from_clause, order_expr, id_expr, where=(), params=(), after=None,
+               descending=False, page_size=50, tables=()):
+    # Keyset pagination: seek past the (sort value, id) of the previous page's last row
+    # instead of OFFSET, so every page costs the same no matter how deep it is.
+    conditions = list(where)
+    params = list(params)
+    direction = "DESC" if descending else "ASC"
+    if after is not None:
+        conditions.append(f"({order_expr}, {id_expr}) {'<' if descending else '>'} (?, ?)")
+        params.extend(after)
+
+    query = f"SELECT {', '.join(columns)}, {order_expr}, {id_expr} FROM {from_clause}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {order_expr} {direction}, {id_expr} {direction} LIMIT ?"
+    params.append(page_size + 1)
+
+    rows = query_cache.fetchall(cursor, query, params, tables=tables)
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_key = tuple(rows[-1][-2:]) if rows else None
+    return [row[:-2] for row in rows], next_key, has_more
+
+
+def paged_table(key, cursor, columns, labels, from_clause, id_expr, sort_options, where=(), params=(), tables=()):
+    # Render one page of a query as a virtualized grid with sort, page size and prev/next controls
+    import pandas as pd
+
+    sort_col, dir_col, size_col = st.columns(3)
+    sort_label = sort_col.selectbox("Sort by", list(sort_options), key=f"{key}_sort")
+    descending = dir_col.selectbox("Order", ["Ascending", "Descending"], key=f"{key}_dir") == "Descending"
+    page_size = size_col.selectbox("Rows per page", PAGE_SIZES, index=1, key=f"{key}_size")
+
+    # Any change to sorting or filters starts again from the first page
+    signature = (sort_label, descending, page_size, tuple(where), tuple(params))
+    if st.session_state.get(f"{key}_signature") != signature:
+        st.session_state[f"{key}_signature"] = signature
+        st.session_state[f"{key}_cursors"] = [None]
+    cursors = st.session_state[f"{key}_cursors"]
+
+    rows, next_key, has_more = fetch_page(cursor, columns, from_clause, sort_options[sort_label], id_expr,
+                                          where, params, cursors[-1], descending, page_size, tables)
+    df = pd.DataFrame(rows, columns=labels)
+    st.dataframe(df, hide_index=True, width="stretch")
+
+    prev_col, info_col, next_col = st.columns([1, 2, 1])
+    prev_col.button("Previous", key=f"{key}_prev", disabled=len(cursors) == 1, on_click=cursors.pop)
+    info_col.caption(f"Page {len(cursors)}, {len(rows)} rows")
+    next_col.button("Next", key=f"{key}_next", disabled=not has_more, on_click=cursors.append, args=(next_key,))
+    return df
+
+
+def search_filters(key, cursor, name_column, id_column, date_column=None):
+    # Product search and optional date range, returned as SQL conditions and parameters
+    where, params = [], []
+    search_term = st.text_input("Search Product", key=f"{key}_search").strip()
+    if search_term:
+        condition, param = product_search_condition(cursor, name_column, id_column, search_term)
+        where.append(condition)
+        params.append(param)
+    if date_column and st.checkbox("Filter by date", key=f"{key}_by_date"):
+        date_range = st.date_input("Date range", value=[], key=f"{key}_dates")
+        if len(date_range) == 2:
+            where.append(f"{date_column} BETWEEN ? AND ?")
+            params.extend(day.isoformat() for day in date_range)
+    return where, params
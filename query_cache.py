@@ -0,0 +1,131 @@
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+
+
+def _estimate_size(rows):
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+    return size
+
+
+def _database(cursor):
+    # Pooled connections carry the path of their database file
+    return getattr(cursor.connection, "db_name", None)
+
+
+class QueryCache:
+    # Process-wide LRU cache of read query results. Every cached query declares the
+    # tables it reads; writers call invalidate() after committing, which bumps those
+    # tables' generation counters so older results can never be served again. Results are
+    # keyed by the database file as well, so stores sharing a process never share results.
+    # Writers in other processes (api.py, another app instance) cannot call invalidate()
+    # here, so writers also call touch() inside their transaction, which bumps the tables'
+    # versions in the database's table_versions, and results are keyed by those too. They
+    # are only re-read when PRAGMA data_version, as seen by a connection of the cache's own,
+    # shows that another connection has committed.
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._generations = {}
+        # database file -> (watching connection, data_version last seen, {table: version})
+        self._watchers = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _table_versions(self, database):
+        # Called with the lock held. Entries that read a table changed since are freed straight away.
+        if database is None:
+            return {}
+        watcher, seen, versions = self._watchers.get(database, (None, None, {}))
+        if watcher is None:
+            watcher = sqlite3.connect(database, check_same_thread=False)
+        data_version = watcher.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != seen:
+            current = dict(watcher.execute("SELECT name, version FROM table_versions").fetchall())
+            changed = {table for table in current.keys() | versions.keys() if current.get(table) != versions.get(table)}
+            if changed:
+                stale = [key for key, (_, _, entry_tables) in self._entries.items()
+                         if key[0] == database and not entry_tables.isdisjoint(changed)]
+                for key in stale:
+                    self.bytes -= self._entries.pop(key)[1]
+            self._watchers[database] = (watcher, data_version, current)
+            versions = current
+        return versions
+
+    def fetchall(self, cursor, query, params=(), tables=()):
+        with self._lock:
+            database = _database(cursor)
+            versions = self._table_versions(database)
+            key = (database, query, tuple(params),
+                   tuple((table, self._generations.get(table, 0), versions.get(table, 0)) for table in tables))
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        rows = cursor.execute(query, params).fetchall()
+        size = _estimate_size(rows)
+        if size > self.max_bytes:
+            return rows
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (rows, size, frozenset(tables))
+                self.bytes += size
+                while self.bytes > self.max_bytes:
+                    _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                    self.bytes -= evicted_size
+                    self.evictions += 1
+        return rows
+
+    def invalidate(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+            # Entries for the old generations are unreachable now, so free them straight away
+            stale = [key for key, (_, _, entry_tables) in self._entries.items() if not entry_tables.isdisjoint(tables)]
+            for key in stale:
+                self.bytes -= self._entries.pop(key)[1]
+
+    @staticmethod
+    def touch(cursor, *tables):
+        # Inside the writer's transaction, so the new versions commit with the change itself
+        cursor.executemany("""INSERT INTO table_versions (name, version) VALUES (?, 1)
+                              ON CONFLICT(name) DO UPDATE SET version = version + 1""", [(table,) for table in tables])
+
+    def generation(self, cursor, table):
+        # Changes whenever the table is invalidated or touched, or the whole cache is cleared
+        with self._lock:
+            return self._epoch, self._table_versions(_database(cursor)).get(table, 0), self._generations.get(table, 0)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            self._epoch += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "generations": dict(self._generations),
+            }
+
+
+query_cache = QueryCache()
@@ -0,0 +1,208 @@
+import itertools
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# Upper bounds (milliseconds) of the latency histogram buckets; the last bucket is +Inf
+BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+logger = logging.getLogger("shop.slow_query")
+
+
+def normalize(sql):
+    sql = " ".join(sql.split())
+    # Batched IN (?, ?, ...) lists of any length count as one statement
+    return re.sub(r"\?(\s*,\s*\?)+", "?, ...", sql)
+
+
+class QueryStats:
+    # Process-wide per-statement call counts, rows, total time and latency histograms,
+    # plus a bounded log of statements slower than slow_query_ms.
+    def __init__(self, slow_query_ms=100.0, slow_log_size=200):
+        self.slow_query_ms = slow_query_ms
+        self.slow_log = deque(maxlen=slow_log_size)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, sql, seconds, rows, connection=None, params=()):
+        key = normalize(sql)
+        elapsed_ms = seconds * 1000
+        bucket = next((i for i, bound in enumerate(BUCKETS_MS) if elapsed_ms <= bound), len(BUCKETS_MS))
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                entry = self._stats[key] = {"calls": 0, "rows": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                            "buckets": [0] * (len(BUCKETS_MS) + 1)}
+            entry["calls"] += 1
+            entry["rows"] += max(rows, 0)
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            entry["buckets"][bucket] += 1
+
+        if elapsed_ms >= self.slow_query_ms:
+            plan = self._explain(connection, sql, params)
+            self.slow_log.append({"time": time.strftime("%Y-%m-%d %H:%M:%S"), "sql": key,
+                                  "ms": round(elapsed_ms, 3), "rows": rows, "plan": plan})
+            logger.warning("slow query (%.1f ms, %d rows): %s\n  plan: %s", elapsed_ms, rows, key, " | ".join(plan))
+
+    @staticmethod
+    def _explain(connection, sql, params):
+        if connection is None or not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return []
+        try:
+            # A plain cursor, so the EXPLAIN itself is not recorded
+            cursor = sqlite3.Cursor(connection)
+            return [row[3] for row in cursor.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        except (sqlite3.Error, ValueError):
+            return []
+
+    def snapshot(self):
+        with self._lock:
+            return {sql: dict(entry, buckets=list(entry["buckets"])) for sql, entry in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.slow_log.clear()
+
+    @staticmethod
+    def percentile(entry, fraction):
+        # Upper bound of the histogram bucket holding the given fraction of calls
+        target = entry["calls"] * fraction
+        seen = 0
+        for bound, count in zip(BUCKETS_MS + (float("inf"),), entry["buckets"]):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def to_json(self):
+        return json.dumps({"buckets_ms": BUCKETS_MS, "statements": self.snapshot(),
+                           "slow_queries": list(self.slow_log)}, indent=2)
+
+    def to_prometheus(self):
+        lines = ["# HELP shop_query_duration_ms SQLite statement latency in milliseconds.",
+                 "# TYPE shop_query_duration_ms histogram"]
+        rows_lines = ["# HELP shop_query_rows_total Rows returned or changed by SQLite statements.",
+                      "# TYPE shop_query_rows_total counter"]
+        for sql, entry in sorted(self.snapshot().items()):
+            label = 'statement="' + sql.replace("\\", "\\\\").replace('"', '\\"') + '"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS_MS + ("+Inf",), entry["buckets"]):
+                cumulative += count
+                lines.append(f'shop_query_duration_ms_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f"shop_query_duration_ms_sum{{{label}}} {entry['total_ms']:.3f}")
+            lines.append(f"shop_query_duration_ms_count{{{label}}} {entry['calls']}")
+            rows_lines.append(f"shop_query_rows_total{{{label}}} {entry['rows']}")
+        return "\n".join(lines + rows_lines) + "\n"
+
+    def dump(self, directory="metrics"):
+        os.makedirs(directory, exist_ok=True)
+        json_path = os.path.join(directory, "query_stats.json")
+        prom_path = os.path.join(directory, "query_stats.prom")
+        with open(json_path, "w") as f:
+            f.write(self.to_json())
+        with open(prom_path, "w") as f:
+            f.write(self.to_prometheus())
+        return json_path, prom_path
+
+
+query_stats = QueryStats(slow_query_ms=float(os.environ.get("SHOP_SLOW_QUERY_MS", 100)))
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Times each statement from execute() until its results are consumed, the cursor
+    # runs another statement, or it is closed, and counts the rows fetched or changed.
+    _pending = None
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            sql, params, seconds, rows = pending
+            query_stats.record(sql, seconds, rows, self.connection, params)
+
+    def execute(self, sql, params=()):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._pending = [sql, params, elapsed, max(self.rowcount, 0)]
+            if self.description is None:
+                self._finish()
+
+    def executemany(self, sql, seq_of_params):
+        self._finish()
+        # The first parameter set stands in for the batch if it needs an EXPLAIN QUERY PLAN
+        seq_of_params = iter(seq_of_params)
+        first = next(seq_of_params, None)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, [] if first is None else itertools.chain([first], seq_of_params))
+        finally:
+            query_stats.record(sql, time.perf_counter() - start, self.rowcount, self.connection,
+                               () if first is None else first)
+
+    def _fetched(self, start, rows, exhausted):
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - start
+            self._pending[3] += rows
+            if exhausted:
+                self._finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(start, len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, 0, True)
+            raise
+        self._fetched(start, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # The built-in shortcuts use a plain cursor, so route them through cursor()
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
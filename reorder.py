@@ -0,0 +1,233 @@
+import argparse
+from collections import defaultdict
+from datetime import date, datetime
+
+# Sales velocity is an exponentially weighted average of units sold per day, spanning about two weeks
+VELOCITY_SPAN_DAYS = 14
+ALPHA = 2 / (VELOCITY_SPAN_DAYS + 1)
+# Defaults for products without their own: days a reorder takes to arrive, and extra days of cover to hold
+LEAD_TIME_DAYS = 7
+SAFETY_DAYS = 7
+# Below one unit every thousand days a product counts as no longer selling
+MIN_RATE = 0.001
+LOOKUP_BATCH = 500
+
+
+def _day(value):
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def fold_sales(rate, rate_date, daily_sales):
+    # Fold (day, units) pairs into an EWMA daily rate that is current as of rate_date:
+    # every day without sales decays the rate by (1 - ALPHA), a day's units add ALPHA * units.
+    # Days before rate_date (backdated sales) are added with the decay they would have had.
+    for day, units in daily_sales:
+        if day is None or not units:
+            continue
+        if rate_date is None or day > rate_date:
+            rate = (rate * (1 - ALPHA) ** (day - rate_date).days if rate_date else 0.0) + ALPHA * units
+            rate_date = day
+        else:
+            rate += ALPHA * units * (1 - ALPHA) ** (rate_date - day).days
+    return rate, rate_date
+
+
+def rebuild_reorder_levels(conn):
+    # Migration step
+    ReorderLevels(conn.cursor()).rebuild()
+
+
+def rate_on(rate, rate_date, today):
+    # The rate decayed to today, for the days since the last sale
+    if not rate or rate_date is None or rate_date >= today:
+        return rate or 0.0
+    return rate * (1 - ALPHA) ** (today - rate_date).days
+
+
+class ReorderLevels:
+    # Per-product sales velocity, days of cover and reorder point, and the set of products
+    # that need reordering (stock_alerts). Sales fold into reorder_levels as they are
+    # recorded; every sale or restock re-evaluates just the products it touched, so reading
+    # the alerts never scans the catalogue. Callers update inventory first and call these
+    # in the same transaction.
+    def __init__(self, cursor, today=None):
+        self.c = cursor
+        self.today = today or date.today()
+
+    def apply_sales_since(self, sale_id):
+        # Fold every sale written after sale_id into its product's velocity
+        self.update_alerts(self._fold_since(sale_id))
+
+    def _fold_since(self, sale_id):
+        # Returns the products whose velocity changed
+        daily = defaultdict(list)
+        for product_id, day, units in self.c.execute(
+                """SELECT product_id, date_of_sale, SUM(quantity) FROM sales WHERE id > ? AND product_id IS NOT NULL
+                   GROUP BY product_id, date_of_sale ORDER BY product_id, date_of_sale""", (sale_id,)).fetchall():
+            daily[product_id].append((_day(day), units))
+        if not daily:
+            return []
+        current = self._levels(list(daily))
+        updates = []
+        for product_id, daily_sales in daily.items():
+            rate, rate_date = current.get(product_id, (0.0, None))
+            rate, rate_date = fold_sales(rate, rate_date, daily_sales)
+            updates.append((product_id, rate, rate_date and rate_date.isoformat()))
+        self.c.executemany("""INSERT INTO reorder_levels (product_id, daily_rate, rate_date) VALUES (?, ?, ?)
+                              ON CONFLICT(product_id) DO UPDATE SET
+                                  daily_rate = excluded.daily_rate, rate_date = excluded.rate_date""", updates)
+        return list(daily)
+
+    def apply_stock_since(self, stock_id):
+        self.update_alerts([product_id for (product_id,) in self.c.execute(
+            "SELECT DISTINCT product_id FROM stock WHERE id > ?", (stock_id,)).fetchall()])
+
+    def set_policy(self, product_id, lead_time_days=None, safety_days=None):
+        # Per-product lead time and safety days; None falls back to the defaults
+        self.c.execute("""INSERT INTO reorder_levels (product_id, lead_time_days, safety_days) VALUES (?, ?, ?)
+                          ON CONFLICT(product_id) DO UPDATE SET
+                              lead_time_days = excluded.lead_time_days, safety_days = excluded.safety_days""",
+                       (product_id, lead_time_days, safety_days))
+        self.update_alerts([product_id])
+
+    def _levels(self, product_ids):
+        levels = {}
+        for i in range(0, len(product_ids), LOOKUP_BATCH):
+            batch = product_ids[i:i + LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            for product_id, rate, rate_date in self.c.execute(
+                    f"SELECT product_id, daily_rate, rate_date FROM reorder_levels WHERE product_id IN ({placeholders})",
+                    batch).fetchall():
+                levels[product_id] = (rate or 0.0, _day(rate_date) if rate_date else None)
+        return levels
+
+    def evaluate(self, on_hand, rate, rate_date, lead_time_days=None, safety_days=None):
+        # (daily rate today, days of cover, reorder point, needs reordering)
+        rate = rate_on(rate, _day(rate_date) if rate_date else None, self.today)
+        if rate < MIN_RATE:
+            rate = 0.0
+        lead_time_days = LEAD_TIME_DAYS if lead_time_days is None else lead_time_days
+        safety_days = SAFETY_DAYS if safety_days is None else safety_days
+        reorder_point = rate * (lead_time_days + safety_days)
+        days_of_cover = max(on_hand, 0) / rate if rate > 0 else None
+        return rate, days_of_cover, reorder_point, on_hand <= reorder_point
+
+    def update_alerts(self, product_ids):
+        # Re-evaluate these products: raise an alert, refresh its figures, or clear it
+        raised_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for i in range(0, len(product_ids), LOOKUP_BATCH):
+            batch = product_ids[i:i + LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            alerts = []
+            for product_id, on_hand, rate, rate_date, lead_time_days, safety_days in self.c.execute(
+                    f"""SELECT i.product_id, i.on_hand, r.daily_rate, r.rate_date, r.lead_time_days, r.safety_days
+                        FROM inventory i LEFT JOIN reorder_levels r ON r.product_id = i.product_id
+                        WHERE i.product_id IN ({placeholders})""", batch).fetchall():
+                rate, days_of_cover, reorder_point, alert = self.evaluate(on_hand, rate, rate_date,
+                                                                          lead_time_days, safety_days)
+                if alert:
+                    alerts.append((product_id, on_hand, rate, days_of_cover, reorder_point, raised_at))
+            # An alert that stays open keeps the time it was first raised
+            self.c.executemany("""INSERT INTO stock_alerts
+                                  (product_id, on_hand, daily_rate, days_of_cover, reorder_point, raised_at)
+                                  VALUES (?, ?, ?, ?, ?, ?)
+                                  ON CONFLICT(product_id) DO UPDATE SET
+                                      on_hand = excluded.on_hand, daily_rate = excluded.daily_rate,
+                                      days_of_cover = excluded.days_of_cover, reorder_point = excluded.reorder_point""",
+                               alerts)
+            cleared = sorted(set(batch) - {alert[0] for alert in alerts})
+            if cleared:
+                self.c.execute(f"DELETE FROM stock_alerts WHERE product_id IN ({','.join('?' * len(cleared))})",
+                               cleared)
+
+    def stale_alerts(self):
+        # Open alerts whose stored figures are not today's. Only reads, so showing the alerts
+        # takes the write lock only when there is something to refresh, about once a day.
+        stale = []
+        for product_id, stored_on_hand, stored_rate, stored_point, on_hand, rate, rate_date, lead_time_days, \
+                safety_days in self.c.execute(
+                    """SELECT a.product_id, a.on_hand, a.daily_rate, a.reorder_point,
+                              i.on_hand, r.daily_rate, r.rate_date, r.lead_time_days, r.safety_days
+                       FROM stock_alerts a
+                       LEFT JOIN inventory i ON i.product_id = a.product_id
+                       LEFT JOIN reorder_levels r ON r.product_id = a.product_id""").fetchall():
+            if on_hand is None:
+                stale.append(product_id)
+                continue
+            rate, _, reorder_point, alert = self.evaluate(on_hand, rate, rate_date, lead_time_days, safety_days)
+            if not alert or (stored_on_hand, stored_rate, stored_point) != (on_hand, rate, reorder_point):
+                stale.append(product_id)
+        return stale
+
+    def refresh_alerts(self):
+        # Rates only decay while a product sits unsold, which can only clear alerts, so
+        # re-evaluating the open ones is enough to bring the whole set up to today
+        stale = self.stale_alerts()
+        self.update_alerts(stale)
+        return stale
+
+    def rebuild(self):
+        # Recompute every velocity from the full sales history, then every alert
+        self.c.execute("UPDATE reorder_levels SET daily_rate = 0, rate_date = NULL")
+        self._fold_since(0)
+        self.update_alerts([product_id for (product_id,) in
+                            self.c.execute("SELECT product_id FROM inventory").fetchall()])
+
+    def check(self):
+        # Products whose stored velocity differs from one folded from the full history:
+        # (product_id, stored rate, recomputed rate), both decayed to today
+        daily = defaultdict(list)
+        for product_id, day, units in self.c.execute(
+                """SELECT product_id, date_of_sale, SUM(quantity) FROM sales WHERE product_id IS NOT NULL
+                   GROUP BY product_id, date_of_sale ORDER BY product_id, date_of_sale"""):
+            daily[product_id].append((_day(day), units))
+        stored = {product_id: rate_on(rate, _day(rate_date) if rate_date else None, self.today)
+                  for product_id, rate, rate_date in self.c.execute(
+                      "SELECT product_id, daily_rate, rate_date FROM reorder_levels")}
+        mismatches = []
+        for product_id in sorted(set(daily) | set(stored)):
+            rate = rate_on(*fold_sales(0.0, None, daily.get(product_id, [])), self.today)
+            if abs(rate - stored.get(product_id, 0.0)) > 1e-6 * max(1.0, rate):
+                mismatches.append((product_id, stored.get(product_id, 0.0), rate))
+        return mismatches
+
+    def alerts(self):
+        return self.c.execute("""SELECT p.product_name, a.on_hand, a.daily_rate, a.days_of_cover, a.reorder_point,
+                                        a.raised_at, a.product_id
+                                 FROM stock_alerts a JOIN products p ON a.product_id = p.id
+                                 ORDER BY a.on_hand > 0, a.days_of_cover, p.product_name""").fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the sales velocity and low-stock alerts.")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--db", default="shop_data.db")
+    args = parser.parse_args()
+
+    from db_manager import DBManager, run_in_transaction
+    from query_cache import query_cache
+
+    db = DBManager(args.db)
+    levels = ReorderLevels(db.c)
+    try:
+        if args.command == "rebuild":
+            def rebuild():
+                levels.rebuild()
+                query_cache.touch(db.c, "reorder_levels", "stock_alerts")
+
+            run_in_transaction(db.conn, rebuild)
+            print(f"Rebuilt velocities: {len(levels.alerts())} products need reordering")
+        mismatches = levels.check()
+        for row in mismatches[:20]:
+            print("mismatch (product_id, stored/recomputed units per day):", row)
+        print(f"{len(mismatches)} mismatched products")
+        raise SystemExit(1 if mismatches else 0)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
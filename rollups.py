@@ -0,0 +1,101 @@
+import argparse
+
+# Sales without a date or product (blank cells in files imported long ago) have no place in
+# the rollup, whose key columns cannot be NULL
+ROLLUP_KEYS = "date_of_sale IS NOT NULL AND product_id IS NOT NULL"
+REBUILD_QUERY = f"""INSERT INTO sales_daily (date, product_id, qty, revenue, count, cogs, costed_revenue)
+                    SELECT date_of_sale, product_id, SUM(quantity), SUM(total), COUNT(*),
+                           COALESCE(SUM(cogs), 0), COALESCE(SUM(CASE WHEN cogs IS NOT NULL THEN total END), 0)
+                    FROM sales
+                    WHERE {ROLLUP_KEYS}
+                    GROUP BY date_of_sale, product_id"""
+
+
+class SalesRollup:
+    # Daily per-product sales totals kept in step with the sales table.
+    # Callers insert the sale rows and call these in the same transaction.
+    def __init__(self, cursor):
+        self.c = cursor
+
+    def apply_sales_since(self, sale_id):
+        # Run after StockLots.allocate_sales_since, which fills in sales.cogs
+        self.c.execute(f"""INSERT INTO sales_daily (date, product_id, qty, revenue, count, cogs, costed_revenue)
+                           SELECT date_of_sale, product_id, SUM(quantity), SUM(total), COUNT(*),
+                                  COALESCE(SUM(cogs), 0), COALESCE(SUM(CASE WHEN cogs IS NOT NULL THEN total END), 0)
+                           FROM sales
+                           WHERE id > ? AND {ROLLUP_KEYS} GROUP BY date_of_sale, product_id
+                           ON CONFLICT(date, product_id) DO UPDATE SET
+                               qty = qty + excluded.qty,
+                               revenue = revenue + excluded.revenue,
+                               count = count + excluded.count,
+                               cogs = cogs + excluded.cogs,
+                               costed_revenue = costed_revenue + excluded.costed_revenue""",
+                       (sale_id,))
+
+    def reverse_sales(self, id_table):
+        # Subtract the sales whose ids are listed in id_table, before they are deleted
+        self.c.execute(f"""INSERT INTO sales_daily (date, product_id, qty, revenue, count, cogs, costed_revenue)
+                           SELECT date_of_sale, product_id, -SUM(quantity), -SUM(total), -COUNT(*),
+                                  -COALESCE(SUM(cogs), 0), -COALESCE(SUM(CASE WHEN cogs IS NOT NULL THEN total END), 0)
+                           FROM sales
+                           WHERE id IN (SELECT id FROM {id_table}) AND {ROLLUP_KEYS}
+                           GROUP BY date_of_sale, product_id
+                           ON CONFLICT(date, product_id) DO UPDATE SET
+                               qty = qty + excluded.qty,
+                               revenue = revenue + excluded.revenue,
+                               count = count + excluded.count,
+                               cogs = cogs + excluded.cogs,
+                               costed_revenue = costed_revenue + excluded.costed_revenue""")
+        self.c.execute("DELETE FROM sales_daily WHERE count <= 0")
+
+    def rebuild(self):
+        self.c.execute("DELETE FROM sales_daily")
+        self.c.execute(REBUILD_QUERY)
+
+    def check(self):
+        # Rows where the rollup disagrees with a fresh aggregation of the raw sales
+        return self.c.execute(f"""WITH raw AS (SELECT date_of_sale AS date, product_id, SUM(quantity) AS qty,
+                                                     SUM(total) AS revenue, COUNT(*) AS count,
+                                                     COALESCE(SUM(cogs), 0) AS cogs
+                                              FROM sales WHERE {ROLLUP_KEYS}
+                                              GROUP BY date_of_sale, product_id),
+                                      keys AS (SELECT date, product_id FROM raw
+                                               UNION SELECT date, product_id FROM sales_daily)
+                                 SELECT k.date, k.product_id, r.qty, d.qty, r.revenue, d.revenue, r.count, d.count
+                                 FROM keys k
+                                 LEFT JOIN raw r ON r.date = k.date AND r.product_id = k.product_id
+                                 LEFT JOIN sales_daily d ON d.date = k.date AND d.product_id = k.product_id
+                                 WHERE r.qty IS NOT d.qty OR r.count IS NOT d.count
+                                    OR ABS(COALESCE(r.revenue, 0) - COALESCE(d.revenue, 0)) > 0.005
+                                    OR ABS(COALESCE(r.cogs, 0) - COALESCE(d.cogs, 0)) > 0.005
+                                    OR r.revenue IS NULL OR d.revenue IS NULL""").fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the sales_daily rollup table.")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--db", default="shop_data.db")
+    args = parser.parse_args()
+
+    from db_manager import DBManager
+    from query_cache import query_cache
+
+    db = DBManager(args.db)
+    rollup = SalesRollup(db.c)
+    try:
+        if args.command == "rebuild":
+            rollup.rebuild()
+            query_cache.touch(db.c, "sales_daily")
+            db.conn.commit()
+            print(f"Rebuilt sales_daily: {db.c.execute('SELECT COUNT(*) FROM sales_daily').fetchone()[0]} rows")
+        mismatches = rollup.check()
+        for row in mismatches[:20]:
+            print("mismatch (date, product_id, raw/rollup qty, revenue, count):", row)
+        print(f"{len(mismatches)} mismatched (date, product) rows")
+        raise SystemExit(1 if mismatches else 0)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from checkout import ORDER_TABLES, Checkout
+from db_manager import get_pool, run_in_transaction
+from inventory import InsufficientStock, Inventory
+from query_cache import query_cache
+
+# Write-behind checkout, used when SHOP_WRITE_BEHIND=1. A sale is priced, checked against the
+# stock not already claimed by queued sales, appended to a journal file next to the database
+# and acknowledged. One writer thread applies the queued sales in group commits of up to
+# BATCH_SIZE, each recording the last journal entry it applied, so entries left behind by a
+# crash are replayed exactly once when the queue is next opened. Only one process at a time
+# can hold a database's journal; while another does, sales are committed directly.
+WRITE_BEHIND = os.environ.get("SHOP_WRITE_BEHIND") == "1"
+BATCH_SIZE = 256
+# Journal sequence numbers are reserved in the database this many at a time
+SEQ_BLOCK = 1000
+RETRY_DELAY = 1.0
+QUEUE_TABLES = ORDER_TABLES + ("sale_queue", "sale_queue_rejects")
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class JournalBusy(RuntimeError):
+    pass
+
+
+class SaleQueue:
+    def __init__(self, db_name, batch_size=BATCH_SIZE, durable=True):
+        self.db_name = db_name
+        self.path = f"{db_name}.queue"
+        self.batch_size = batch_size
+        # fsync every entry before acknowledging it; otherwise a power cut may lose the newest ones
+        self.durable = durable
+        self.pool = get_pool(db_name)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            # Held until close: a second process appending to or truncating the journal would lose sales
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(self._fd)
+            raise JournalBusy(f"The sale journal {self.path} is in use by another process.") from None
+        self.error = None
+        self._entries = deque()
+        # product_id -> units held by sales still in the queue
+        self._claimed = Counter()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._closed = False
+        self._conn = self.pool.acquire()
+        if durable:
+            # The journal is emptied once its sales are committed, so those commits must reach the
+            # disk first; with synchronous=NORMAL a WAL commit is only synced at a checkpoint
+            self._conn.execute("PRAGMA synchronous=FULL")
+        self._applied, self._seq = self._conn.execute("SELECT applied_seq, reserved_seq FROM sale_queue").fetchone()
+        self._replay()
+        self._reserve(self._conn)
+        self._thread = threading.Thread(target=self._run, name="sale-queue", daemon=True)
+        self._thread.start()
+
+    def _replay(self):
+        # Queue what a previous process journaled but never applied. A torn last line was
+        # never acknowledged, so it is cut off before anything is appended after it.
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                f.truncate(end)
+        for line in data[:end].splitlines():
+            entry = json.loads(line)
+            self._seq = max(self._seq, entry["seq"])
+            if entry["seq"] > self._applied:
+                self._queue(entry)
+
+    def _reserve(self, conn):
+        # Numbers from an earlier process are never handed out again, even if its journal is gone
+        def work():
+            conn.execute("UPDATE sale_queue SET reserved_seq = MAX(reserved_seq, ?) + ?", (self._seq, SEQ_BLOCK))
+            return conn.execute("SELECT reserved_seq FROM sale_queue").fetchone()[0]
+
+        self._reserved = run_in_transaction(conn, work)
+
+    def _queue(self, entry):
+        self._entries.append(entry)
+        for product_id, _, _, quantity, _ in entry["lines"]:
+            self._claimed[product_id] += quantity
+
+    def submit(self, cart, customer_name="", customer_mobile="", date_of_sale=None):
+        # Returns (journal sequence number, date of sale, priced lines) once the sale is journaled
+        date_of_sale = date_of_sale or datetime.now().strftime("%Y-%m-%d")
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            lines = Checkout(cursor).price_lines(cart)
+            if not lines:
+                raise ValueError("The cart is empty.")
+            inventory = Inventory(cursor)
+            with self._changed:
+                if self._closed:
+                    raise RuntimeError("The sale queue is closed.")
+                for product_id, product_name, _, quantity, _ in lines:
+                    available = inventory.on_hand(product_id) - self._claimed[product_id]
+                    if available < quantity:
+                        raise InsufficientStock(product_name, quantity, max(available, 0))
+                if self._seq >= self._reserved:
+                    self._reserve(conn)
+                self._seq += 1
+                entry = {"seq": self._seq, "date_of_sale": date_of_sale, "customer_name": customer_name,
+                         "customer_mobile": customer_mobile, "lines": lines}
+                os.write(self._fd, (json.dumps(entry) + "\n").encode())
+                self._queue(entry)
+                self._changed.notify_all()
+        finally:
+            self.pool.release(conn)
+        # Outside the lock, so tills submitting at the same time share the wait for the disk
+        if self.durable:
+            os.fsync(self._fd)
+        return entry["seq"], date_of_sale, lines
+
+    def _run(self):
+        while True:
+            with self._changed:
+                while not self._entries and not self._closed:
+                    self._changed.wait()
+                if not self._entries:
+                    return
+                batch = [self._entries[i] for i in range(min(self.batch_size, len(self._entries)))]
+            try:
+                self._apply(batch)
+            except Exception as e:
+                # Nothing of the batch was committed; keep it queued and try again
+                self.error = f"{_now()}: {e}"
+                time.sleep(RETRY_DELAY)
+                continue
+            query_cache.invalidate(*QUEUE_TABLES)
+            with self._changed:
+                for entry in batch:
+                    self._entries.popleft()
+                    for product_id, _, _, quantity, _ in entry["lines"]:
+                        self._claimed[product_id] -= quantity
+                self._applied = batch[-1]["seq"]
+                self.error = None
+                # Everything journaled is durably in the database now, so the journal can start over
+                if not self._entries:
+                    os.ftruncate(self._fd, 0)
+                self._changed.notify_all()
+
+    def _apply(self, batch):
+        # One transaction for the whole batch. A sale that cannot be applied any more is
+        # recorded in sale_queue_rejects instead; the rest still commit.
+        c = self._conn.cursor()
+
+        def work():
+            results = Checkout(c).write_orders([(entry["lines"], entry["customer_name"], entry["customer_mobile"],
+                                                 entry["date_of_sale"]) for entry in batch])
+            c.executemany("""INSERT OR REPLACE INTO sale_queue_rejects (seq, entry, error, rejected_at)
+                             VALUES (?, ?, ?, ?)""",
+                          [(entry["seq"], json.dumps(entry), str(result), _now())
+                           for entry, result in zip(batch, results) if isinstance(result, Exception)])
+            c.execute("UPDATE sale_queue SET applied_seq = ?", (batch[-1]["seq"],))
+
+        run_in_transaction(self._conn, work)
+
+    def pending(self):
+        with self._lock:
+            return len(self._entries)
+
+    def flush(self, timeout=None):
+        # Wait until every sale submitted so far has been applied; False if the timeout ran out
+        with self._changed:
+            if not self._entries:
+                return True
+            target = self._entries[-1]["seq"]
+            return self._changed.wait_for(lambda: self._applied >= target, timeout)
+
+    def rejects(self):
+        conn = self.pool.acquire()
+        try:
+            return conn.execute("SELECT seq, entry, error, rejected_at FROM sale_queue_rejects ORDER BY seq").fetchall()
+        finally:
+            self.pool.release(conn)
+
+    def clear_rejects(self):
+        conn = self.pool.acquire()
+        try:
+            run_in_transaction(conn, lambda: conn.execute("DELETE FROM sale_queue_rejects"))
+        finally:
+            self.pool.release(conn)
+        query_cache.invalidate("sale_queue_rejects")
+
+    def close(self, timeout=None):
+        # Applies what is queued before the writer stops; anything left is replayed next time
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            # Closing the journal also releases its lock
+            os.close(self._fd)
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self.pool.release(self._conn)
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_sale_queue(db_name='shop_data.db'):
+    # None while another process holds the journal; callers then commit sales directly
+    key = os.path.abspath(db_name)
+    with _queues_lock:
+        queue = _queues.get(key)
+        if queue is None:
+            try:
+                queue = _queues[key] = SaleQueue(db_name)
+            except JournalBusy:
+                return None
+        return queue
+
+
+def sale_queue_for(cursor):
+    # The queue of whichever database file this cursor is connected to, or None
+    return get_sale_queue(cursor.execute("PRAGMA database_list").fetchone()[2])
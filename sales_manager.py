@@ -1,13 +1,81 @@
 import base64
-import tempfile
-from datetime import datetime
+import json
+from datetime import date
 
-import pandas as pd
-import plotly.graph_objects as go
 import streamlit as st
-from fpdf import FPDF
 
-from data_exporter import DataExporter
+from bills import make_bill, render_bill, render_bills_pdf, render_bills_zip
+from catalog import get_catalog
+from checkout import Checkout
+from data_exporter import EXPORT_FORMATS, DataExporter, export_job, sales_filters
+from downsample import lttb
+from inventory import Inventory
+from jobs import runner_for
+from pagination import paged_table, search_filters
+from query_cache import query_cache
+from sale_queue import WRITE_BEHIND, sale_queue_for
+
+# The dashboard aggregates, all answered from the sales_daily rollup over a date window:
+# name -> (query, tables read). Every query takes the window's first and last date first.
+DASHBOARD_QUERIES = {
+    # Only days stored as ISO dates; others (e.g. 03/09/2024 from an old import) can't be charted or picked
+    "date_range": ("""SELECT date(MIN(date)), date(MAX(date))
+                      FROM sales_daily
+                      WHERE date(date) IS NOT NULL""", ("sales_daily",)),
+    "totals": ("""SELECT COALESCE(SUM(revenue), 0), COALESCE(SUM(count), 0)
+                  FROM sales_daily
+                  WHERE date BETWEEN ? AND ?""", ("sales_daily",)),
+    "most_sold_product": ("""SELECT p.product_name, SUM(d.qty) as total_quantity
+                             FROM sales_daily d
+                             JOIN products p ON d.product_id = p.id
+                             WHERE d.date BETWEEN ? AND ?
+                             GROUP BY d.product_id
+                             ORDER BY total_quantity DESC
+                             LIMIT 1""", ("sales_daily", "products")),
+    # Days are summed first in primary-key order, so the bucket expression only runs once per day
+    "sales_over_time": ("""SELECT {bucket} as bucket, SUM(total_sales)
+                           FROM (SELECT date, SUM(revenue) as total_sales
+                                 FROM sales_daily
+                                 WHERE date BETWEEN ? AND ?
+                                 GROUP BY date)
+                           GROUP BY bucket
+                           ORDER BY bucket""", ("sales_daily",)),
+    # The top N products by revenue, with the rest summed into a single "Other" slice
+    "sales_by_product": ("""WITH ranked AS (SELECT product_id, SUM(revenue) as revenue,
+                                                   ROW_NUMBER() OVER (ORDER BY SUM(revenue) DESC) as rank
+                                            FROM sales_daily
+                                            WHERE date BETWEEN ? AND ?
+                                            GROUP BY product_id)
+                            SELECT CASE WHEN r.rank <= ? THEN p.product_name ELSE 'Other' END, SUM(r.revenue)
+                            FROM ranked r
+                            JOIN products p ON r.product_id = p.id
+                            GROUP BY CASE WHEN r.rank <= ? THEN r.product_id END
+                            ORDER BY MIN(r.rank)""", ("sales_daily", "products")),
+    # Per product quantity and revenue, merged by name across stores for the chain-wide dashboard
+    "product_totals": ("""SELECT p.product_name, SUM(d.qty), SUM(d.revenue)
+                          FROM sales_daily d
+                          JOIN products p ON d.product_id = p.id
+                          WHERE d.date BETWEEN ? AND ?
+                          GROUP BY d.product_id""", ("sales_daily", "products")),
+    # Per product revenue, and the revenue and FIFO cost of the sales whose cost is known
+    "margins": ("""SELECT p.product_name, SUM(d.qty), SUM(d.revenue), SUM(d.costed_revenue), SUM(d.cogs)
+                   FROM sales_daily d
+                   JOIN products p ON d.product_id = p.id
+                   WHERE d.date BETWEEN ? AND ?
+                   GROUP BY d.product_id
+                   ORDER BY SUM(d.costed_revenue) - SUM(d.cogs) DESC""", ("sales_daily", "products")),
+}
+
+# Start of each bucket, computed in SQL from the rollup's date column
+GRANULARITIES = {
+    "Day": "date",
+    "Week": "date(date, '-6 days', 'weekday 1')",
+    "Month": "strftime('%Y-%m-01', date)",
+}
+
+# Longer series are downsampled with LTTB before they are sent to the browser
+MAX_CHART_POINTS = 500
+TOP_PRODUCTS = 10
 
 
 class SalesManager:
@@ -16,201 +84,405 @@ class SalesManager:
 
     @staticmethod
     def generate_pdf_bill(date_of_sale, product_name, price, quantity, total, customer_name, customer_mobile):
-        pdf = FPDF()
-        pdf.add_page()
-
-        # Set title font and color
-        pdf.set_font("Arial", "B", 16)
-        pdf.set_text_color(0, 0, 128)  # Dark blue
-        pdf.cell(200, 10, txt="Sale Bill", ln=True, align='C')
-
-        # Add a line break
-        pdf.ln(10)
-
-        # Add customer information
-        pdf.set_font("Arial", "B", 12)
-        pdf.set_text_color(0, 0, 0)  # Black
-        pdf.cell(100, 10, txt="Customer Information", ln=True)
-
-        pdf.set_font("Arial", "", 12)
-        pdf.cell(100, 10, txt=f"Customer Name: {customer_name}")
-        pdf.cell(100, 10, txt=f"Customer Mobile: {customer_mobile}")
-
-        # Add a line break
-        pdf.ln(10)
-
-        # Add sale details
-        pdf.set_font("Arial", "B", 12)
-        pdf.cell(100, 10, txt="Sale Details", ln=True)
-
-        pdf.set_font("Arial", "", 12)
-        pdf.cell(100, 10, txt=f"Date of Sale: {date_of_sale}")
-        pdf.ln(8)
-        pdf.cell(100, 10, txt=f"Product Name: {product_name}")
-        pdf.ln(8)
-        pdf.cell(100, 10, txt=f"Price per Unit: ${price:.2f}")
-        pdf.ln(8)
-        pdf.cell(100, 10, txt=f"Quantity Sold: {quantity}")
-        pdf.ln(8)
-        pdf.cell(100, 10, txt=f"Total Amount: ${total:.2f}")
-
-        # Add footer
-        pdf.ln(20)
-        pdf.set_font("Arial", "I", 10)
-        pdf.set_text_color(128, 128, 128)  # Gray
-        pdf.cell(200, 10, txt="Thank you for your purchase!", ln=True, align='C')
-
-        # Save PDF to a temporary file and return the file path
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-            pdf.output(tmp_file.name)
-            return tmp_file.name  # Return the file path
+        bill = make_bill(date_of_sale, [(product_name, price, quantity, total)], customer_name, customer_mobile)
+        return render_bill(bill)
+
+    def load_bills(self, start_date=None, end_date=None, first_id=None, last_id=None):
+        # One bill per order; sales recorded before checkout orders existed get a bill each
+        where, params = sales_filters(start_date, end_date)
+        if first_id is not None:
+            where.append("s.id >= ?")
+            params.append(first_id)
+        if last_id is not None:
+            where.append("s.id <= ?")
+            params.append(last_id)
+        query = """SELECT s.id, s.order_id, s.date_of_sale, p.product_name, s.quantity, s.total,
+                          o.customer_name, o.customer_mobile
+                   FROM sales s
+                   JOIN products p ON s.product_id = p.id
+                   LEFT JOIN orders o ON s.order_id = o.id"""
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY s.id"
+
+        bills = {}
+        for sale_id, order_id, date_of_sale, product_name, quantity, total, name, mobile in self.c.execute(query,
+                                                                                                          params):
+            bill_no = f"O{order_id}" if order_id is not None else f"S{sale_id}"
+            bill = bills.setdefault(bill_no, {"date_of_sale": date_of_sale, "lines": [], "customer_name": name,
+                                              "customer_mobile": mobile})
+            # Unit price as charged at the time, not the current list price
+            bill["lines"].append((product_name, total / quantity if quantity else total, quantity, total))
+        return [make_bill(bill["date_of_sale"], bill["lines"], bill["customer_name"], bill["customer_mobile"],
+                          bill_no=bill_no) for bill_no, bill in bills.items()]
+
+    def reprint_bills(self):
+        st.header("Reprint Bills")
+        mode = st.radio("Select sales by", ["Day", "Sale ID range"], horizontal=True)
+        if mode == "Day":
+            day = st.date_input("Date of Sale")
+            selection = {"start_date": day, "end_date": day}
+            description = f"sales on {day}"
+        else:
+            first_col, last_col = st.columns(2)
+            selection = {"first_id": first_col.number_input("First Sale ID", min_value=1, format="%d"),
+                         "last_id": last_col.number_input("Last Sale ID", min_value=1, format="%d")}
+            description = f"sales {selection['first_id']} to {selection['last_id']}"
+        output = st.radio("Output", ["Single PDF", "ZIP of PDFs"], horizontal=True)
+
+        render_col, background_col = st.columns(2)
+        if render_col.button("Render Bills"):
+            try:
+                bills = self.load_bills(**selection)
+                if not bills:
+                    st.write("No sales found for this selection.")
+                elif output == "Single PDF":
+                    st.download_button(f"Download {len(bills)} Bills (PDF)", data=render_bills_pdf(bills),
+                                       file_name="bills.pdf", mime="application/pdf")
+                else:
+                    st.download_button(f"Download {len(bills)} Bills (ZIP)", data=render_bills_zip(bills),
+                                       file_name="bills.zip", mime="application/zip")
+            except Exception as e:
+                st.error(f"An error occurred while rendering bills: {e}")
+
+        if background_col.button("Render in background"):
+            try:
+                job_id = runner_for(self.c).submit("bills", f"{output} of {description}", bills_job, selection, output)
+                st.success(f"Started job {job_id}; follow it on the Jobs page.")
+            except Exception as e:
+                st.error(f"An error occurred while starting the job: {e}")
 
     def record_sale(self):
         st.header("Record a Sale")
+        if WRITE_BEHIND:
+            self.queued_sale_rejects()
+        cart = st.session_state.setdefault("cart", {})
         try:
-            stock_data = self.c.execute("SELECT product_name FROM products").fetchall()
-            product_options = [item[0] for item in stock_data]
-
-            product_name = st.selectbox("Product Name", product_options)
+            catalog = get_catalog(self.c)
+            search_term = st.text_input("Search Products")
+            product_name = st.selectbox("Product Name", catalog.search(search_term, k=50))
             if product_name:
-                price = self.c.execute("SELECT price FROM products WHERE product_name=?", (product_name,)).fetchone()[0]
+                product_id, price = catalog.by_name[product_name]
+                st.caption(f"Price: ${price:.2f} | In stock: {Inventory(self.c).on_hand(product_id)}")
                 quantity = st.number_input("Quantity Sold", min_value=1, format="%d")
-                total = price * quantity
-
-                # Capture customer information
-                st.subheader("Customer Information")
-                customer_name = st.text_input("Customer Name")
-                customer_mobile = st.text_input("Customer Mobile")
-
-                if st.button("Record Sale"):
-                    try:
-                        product_id = \
-                        self.c.execute("SELECT id FROM products WHERE product_name=?", (product_name,)).fetchone()[0]
-                        self.c.execute("UPDATE stock SET quantity = quantity - ? WHERE product_id = ?",
-                                       (quantity, product_id))
-                        date_of_sale = datetime.now().strftime("%Y-%m-%d")
-                        self.c.execute(
-                            "INSERT INTO sales (product_id, date_of_sale, quantity, total) VALUES (?, ?, ?, ?)",
-                            (product_id, date_of_sale, quantity, total))
-                        self.c.connection.commit()
-                        st.success("Sale recorded successfully!")
-
-                        st.subheader("Generated Bill")
-                        st.write(f"**Date of Sale:** {date_of_sale}")
-                        st.write(f"**Product Name:** {product_name}")
-                        st.write(f"**Price per Unit:** ${price:.2f}")
-                        st.write(f"**Quantity Sold:** {quantity}")
-                        st.write(f"**Total Amount:** ${total:.2f}")
-
-                        # Generate and download PDF bill
-                        pdf_path = self.generate_pdf_bill(date_of_sale, product_name, price, quantity, total,
-                                                          customer_name, customer_mobile)
-
-                        # Encode PDF to base64 for embedding
-                        with open(pdf_path, "rb") as f:
-                            pdf_bytes = f.read()
-                            b64_pdf = base64.b64encode(pdf_bytes).decode('utf-8')
-
-                        pdf_display = f'<embed src="data:application/pdf;base64,{b64_pdf}" width="600" height="800" type="application/pdf">'
-                        st.markdown(pdf_display, unsafe_allow_html=True)
-
-                        # Print button
-                        print_button = f"""
-                        <a href="data:application/octet-stream;base64,{b64_pdf}" download="bill.pdf" target="_blank">
-                        <button>Print Bill</button>
-                        </a>
-                        """
-                        st.markdown(print_button, unsafe_allow_html=True)
-
-                    except Exception as e:
-                        st.error(f"An error occurred while recording the sale: {e}")
+                if st.button("Add to Cart"):
+                    cart[product_name] = cart.get(product_name, 0) + quantity
         except Exception as e:
             st.error(f"An error occurred while fetching stock data for sale: {e}")
 
+        if not cart:
+            return
+
+        import pandas as pd
+
+        st.subheader("Cart")
+        checkout = Checkout(self.c)
+        try:
+            # Every cart line is priced by one batched product lookup
+            lines = checkout.price_lines(cart.items())
+            df = pd.DataFrame([line[1:] for line in lines], columns=["Product", "Price", "Quantity", "Total"])
+            st.dataframe(df, hide_index=True)
+            st.write(f"**Cart Total:** ${df['Total'].sum():.2f}")
+        except Exception as e:
+            st.error(f"An error occurred while pricing the cart: {e}")
+
+        remove_col, clear_col = st.columns(2)
+        to_remove = remove_col.selectbox("Remove a product", list(cart))
+        if remove_col.button("Remove"):
+            cart.pop(to_remove, None)
+            st.rerun()
+        if clear_col.button("Clear Cart"):
+            cart.clear()
+            st.rerun()
+
+        # Capture customer information
+        st.subheader("Customer Information")
+        customer_name = st.text_input("Customer Name")
+        customer_mobile = st.text_input("Customer Mobile")
+
+        if st.button("Checkout"):
+            try:
+                queue = sale_queue_for(self.c) if WRITE_BEHIND else None
+                if queue is not None:
+                    # Acknowledged once journaled; the queue's writer thread commits it shortly after
+                    seq, date_of_sale, lines = queue.submit(cart.items(), customer_name, customer_mobile)
+                    bill_no = f"Q{seq}"
+                    st.success(f"Sale {bill_no} queued successfully!")
+                else:
+                    order_id, date_of_sale, lines = checkout.place_order(cart.items(), customer_name,
+                                                                         customer_mobile)
+                    bill_no = f"O{order_id}"
+                    st.success(f"Order {order_id} recorded successfully!")
+                cart.clear()
+                self.show_bill(make_bill(date_of_sale, [line[1:] for line in lines], customer_name, customer_mobile,
+                                         bill_no=bill_no))
+            except Exception as e:
+                st.error(f"An error occurred while recording the sale: {e}")
+
+    def queued_sale_rejects(self):
+        # Queued sales the writer could not apply, e.g. because another till sold the stock first
+        queue = sale_queue_for(self.c)
+        if queue is None:
+            return
+        if queue.error:
+            st.warning(f"Queued sales are waiting to be written: {queue.error}")
+        rejects = queue.rejects()
+        if not rejects:
+            return
+
+        with st.expander(f"{len(rejects)} queued sales could not be recorded"):
+            for seq, entry, error, rejected_at in rejects:
+                entry = json.loads(entry)
+                items = ", ".join(f"{quantity} x {product_name}" for _, product_name, _, quantity, _ in entry["lines"])
+                st.write(f"**Q{seq}** ({entry['customer_name'] or 'no name'}, {rejected_at}): {items}. {error}")
+            if st.button("Clear refused sales"):
+                queue.clear_rejects()
+                st.rerun()
+
+    @staticmethod
+    def show_bill(bill):
+        st.subheader("Generated Bill")
+        st.write(f"**Date of Sale:** {bill['date_of_sale']}")
+        for product_name, price, quantity, total in bill["lines"]:
+            st.write(f"**{product_name}:** {quantity} x ${price:.2f} = ${total:.2f}")
+        st.write(f"**Total Amount:** ${bill['total']:.2f}")
+
+        # Generate the PDF bill in memory and encode it to base64 for embedding
+        b64_pdf = base64.b64encode(render_bill(bill)).decode('utf-8')
+
+        pdf_display = f'<embed src="data:application/pdf;base64,{b64_pdf}" width="600" height="800" type="application/pdf">'
+        st.markdown(pdf_display, unsafe_allow_html=True)
+
+        # Print button
+        print_button = f"""
+        <a href="data:application/octet-stream;base64,{b64_pdf}" download="bill.pdf" target="_blank">
+        <button>Print Bill</button>
+        </a>
+        """
+        st.markdown(print_button, unsafe_allow_html=True)
+
     def view_sales(self):
         st.header("Sales Records")
         try:
-            sales_data = self.c.execute("""SELECT s.id, s.date_of_sale, p.product_name, p.price, s.quantity, s.total
-                                          FROM sales s
-                                          JOIN products p ON s.product_id = p.id""").fetchall()
-            if sales_data:
-                df = pd.DataFrame(sales_data, columns=["ID", "Date of Sale", "Product", "Price", "Quantity", "Total"])
-                st.table(df)
-
-                csv = DataExporter.export_to_csv(df, "sales_data.csv")
-                st.download_button(label="Download Sales CSV", data=csv, file_name="sales_data.csv", mime="text/csv")
-            else:
-                st.write("No sales data available.")
+            where, params = search_filters("sales", self.c, "p.product_name", "p.id", "s.date_of_sale")
+            paged_table("sales", self.c,
+                        columns=["s.id", "s.date_of_sale", "p.product_name", "p.price", "s.quantity", "s.total"],
+                        labels=["ID", "Date of Sale", "Product", "Price", "Quantity", "Total"],
+                        from_clause="sales s JOIN products p ON s.product_id = p.id",
+                        id_expr="s.id",
+                        sort_options={"Date of Sale": "s.date_of_sale", "ID": "s.id", "Total": "s.total"},
+                        where=where, params=params, tables=("sales", "products"))
+
+            export_format = st.selectbox("Export format", list(EXPORT_FORMATS))
+            if st.button("Prepare export"):
+                export_file, rows = DataExporter.export_sales(self.c, export_format, where, params)
+                file_name, mime = EXPORT_FORMATS[export_format]
+                st.caption(f"{rows:,} sales exported")
+                # Streamlit takes bytes, not the spooled temporary file itself
+                with export_file:
+                    data = export_file.read()
+                st.download_button(label=f"Download Sales {export_format}", data=data,
+                                   file_name=file_name, mime=mime)
+            if st.button("Export in background"):
+                job_id = runner_for(self.c).submit("export", f"Sales {export_format}", export_job, export_format,
+                                                   where, params)
+                st.success(f"Started job {job_id}; follow it on the Jobs page.")
         except Exception as e:
             st.error(f"An error occurred while fetching sales data: {e}")
 
 
 
 
+    def dashboard_query(self, name, params=(), bucket="date"):
+        query, tables = DASHBOARD_QUERIES[name]
+        return query_cache.fetchall(self.c, query.replace("{bucket}", bucket), params, tables=tables)
+
+    def rollup_dashboard(self, start_date, end_date, granularity="Day", top_n=TOP_PRODUCTS):
+        # Dashboard figures from SQL aggregates over the sales_daily rollup
+        window = (start_date, end_date)
+        most_sold_product = self.dashboard_query("most_sold_product", window)
+        return {"totals": tuple(self.dashboard_query("totals", window)[0]),
+                "most_sold_product": tuple(most_sold_product[0]) if most_sold_product else None,
+                "sales_over_time": self.dashboard_query("sales_over_time", window, GRANULARITIES[granularity]),
+                "sales_by_product": self.dashboard_query("sales_by_product", window + (top_n, top_n))}
+
+    def snapshot_dashboard(self, start_date, end_date, granularity="Day", top_n=TOP_PRODUCTS):
+        # The same figures from vectorized scans of the columnar snapshot, brought up to date first
+        from snapshot import from_days, snapshot_for
+
+        snapshot = snapshot_for(self.c)
+        snapshot.refresh(self.c)
+        names = dict(query_cache.fetchall(self.c, "SELECT id, product_name FROM products", tables=("products",)))
+        product_ids, quantities, revenues = snapshot.by_product(start_date, end_date)
+        most_sold_product = None
+        if len(product_ids):
+            best = quantities.argmax()
+            most_sold_product = (names.get(int(product_ids[best])), int(quantities[best]))
+        ranked = revenues.argsort()[::-1]
+        sales_by_product = [(names.get(int(product_ids[i])), float(revenues[i])) for i in ranked[:top_n]]
+        if len(ranked) > top_n:
+            sales_by_product.append(("Other", float(revenues[ranked[top_n:]].sum())))
+        periods, period_revenue = snapshot.by_period(start_date, end_date, granularity.lower())
+        return {"totals": snapshot.totals(start_date, end_date),
+                "most_sold_product": most_sold_product,
+                "sales_over_time": list(zip(from_days(periods), period_revenue.tolist())),
+                "sales_by_product": sales_by_product}
+
+    @staticmethod
+    def downsample(series, max_points=MAX_CHART_POINTS):
+        # [(iso date, value)] -> at most max_points of them, picked by LTTB. Buckets that aren't ISO dates are dropped
+        days = []
+        for day, value in series:
+            try:
+                days.append((date.fromisoformat(day).toordinal(), day, value))
+            except (TypeError, ValueError):
+                continue
+        return [days[i][1:] for i in lttb([x for x, _, _ in days], [value for _, _, value in days], max_points)]
+
+    def render_dashboard(self, data, granularity):
+        import pandas as pd
+        import plotly.graph_objects as go
+
+        total_sales, num_sales = data["totals"]
+        most_sold_product = data["most_sold_product"]
+
+        if most_sold_product:
+            most_sold_product_name, most_sold_quantity = most_sold_product
+        else:
+            most_sold_product_name, most_sold_quantity = "N/A", 0
+
+        st.subheader("Total Sales")
+        st.write(f"**Total Sales Amount:** ${total_sales:.2f}")
+
+        st.subheader("Number of Sales")
+        st.write(f"**Number of Sales:** {num_sales}")
+
+        st.subheader("Most Sold Product")
+        st.write(f"**Product Name:** {most_sold_product_name}")
+        st.write(f"**Quantity Sold:** {most_sold_quantity}")
+
+        # Create a graph for total sales over time
+        st.subheader("Sales Over Time")
+        sales_over_time = self.downsample(data["sales_over_time"])
+        if len(sales_over_time) < len(data["sales_over_time"]):
+            st.caption(f"Showing {len(sales_over_time):,} of {len(data['sales_over_time']):,} points "
+                       f"(downsampled)")
+        df_sales_over_time = pd.DataFrame(sales_over_time, columns=["Date", "Total Sales"])
+        fig_sales_over_time = go.Figure(data=[go.Scatter(x=df_sales_over_time["Date"],
+                                                         y=df_sales_over_time["Total Sales"],
+                                                         mode='lines+markers',
+                                                         name='Total Sales')])
+        fig_sales_over_time.update_layout(title=f'Sales Over Time (by {granularity.lower()})',
+                                          xaxis_title='Date',
+                                          yaxis_title='Total Sales',
+                                          xaxis=dict(tickformat='%Y-%m-%d'))
+        st.plotly_chart(fig_sales_over_time)
+
+        # Create a pie chart for sales by product
+        st.subheader("Sales Distribution by Product")
+        df_sales_by_product = pd.DataFrame(data["sales_by_product"], columns=["Product Name", "Total Sales"])
+        fig_sales_by_product = go.Figure(data=[go.Pie(labels=df_sales_by_product["Product Name"],
+                                                      values=df_sales_by_product["Total Sales"],
+                                                      hole=0.4)])
+        fig_sales_by_product.update_layout(title='Sales Distribution by Product')
+        st.plotly_chart(fig_sales_by_product)
+
     def show_sales_dashboard(self):
             st.header("Sales Dashboard")
             try:
-                # Fetch data for dashboard
-                total_sales = self.c.execute("SELECT SUM(total) FROM sales").fetchone()[0]
-                num_sales = self.c.execute("SELECT COUNT(*) FROM sales").fetchone()[0]
-                most_sold_product = self.c.execute("""SELECT p.product_name, SUM(s.quantity) as total_quantity
-                                                      FROM sales s
-                                                      JOIN products p ON s.product_id = p.id
-                                                      GROUP BY p.product_name
-                                                      ORDER BY total_quantity DESC
-                                                      LIMIT 1""").fetchone()
-
-                if most_sold_product:
-                    most_sold_product_name, most_sold_quantity = most_sold_product
-                else:
-                    most_sold_product_name, most_sold_quantity = "N/A", 0
-
-                st.subheader("Total Sales")
-                st.write(f"**Total Sales Amount:** ${total_sales:.2f}")
-
-                st.subheader("Number of Sales")
-                st.write(f"**Number of Sales:** {num_sales}")
-
-                st.subheader("Most Sold Product")
-                st.write(f"**Product Name:** {most_sold_product_name}")
-                st.write(f"**Quantity Sold:** {most_sold_quantity}")
-
-                # Create a graph for total sales over time
-                st.subheader("Sales Over Time")
-                sales_over_time = self.c.execute("""SELECT date_of_sale, SUM(total) as total_sales
-                                                    FROM sales
-                                                    GROUP BY date_of_sale
-                                                    ORDER BY date_of_sale""").fetchall()
-                df_sales_over_time = pd.DataFrame(sales_over_time, columns=["Date", "Total Sales"])
-                fig_sales_over_time = go.Figure(data=[go.Scatter(x=df_sales_over_time["Date"],
-                                                                 y=df_sales_over_time["Total Sales"],
-                                                                 mode='lines+markers',
-                                                                 name='Total Sales')])
-                fig_sales_over_time.update_layout(title='Sales Over Time',
-                                                  xaxis_title='Date',
-                                                  yaxis_title='Total Sales',
-                                                  xaxis=dict(tickformat='%Y-%m-%d'))
-                st.plotly_chart(fig_sales_over_time)
-
-                # Create a pie chart for sales by product
-                st.subheader("Sales Distribution by Product")
-                sales_by_product = self.c.execute("""SELECT p.product_name, SUM(s.total) as total_sales
-                                                     FROM sales s
-                                                     JOIN products p ON s.product_id = p.id
-                                                     GROUP BY p.product_name""").fetchall()
-                df_sales_by_product = pd.DataFrame(sales_by_product, columns=["Product Name", "Total Sales"])
-                fig_sales_by_product = go.Figure(data=[go.Pie(labels=df_sales_by_product["Product Name"],
-                                                              values=df_sales_by_product["Total Sales"],
-                                                              hole=0.4)])
-                fig_sales_by_product.update_layout(title='Sales Distribution by Product')
-                st.plotly_chart(fig_sales_by_product)
+                first_date, last_date = self.dashboard_query("date_range")[0]
+                if first_date is None:
+                    st.write("No sales recorded yet.")
+                    return
+                first_date, last_date = date.fromisoformat(first_date), date.fromisoformat(last_date)
+
+                range_col, granularity_col, top_col = st.columns([2, 1, 1])
+                date_range = range_col.date_input("Date range", value=(first_date, last_date),
+                                                  min_value=first_date, max_value=last_date, key="dashboard_dates")
+                granularity = granularity_col.selectbox("Granularity", list(GRANULARITIES), key="dashboard_granularity")
+                top_n = top_col.number_input("Top products", min_value=1, max_value=50, value=TOP_PRODUCTS,
+                                             key="dashboard_top")
+                # A half-picked range covers the single chosen day
+                start_date, end_date = (tuple(date_range) * 2)[:2] if date_range else (first_date, last_date)
+                window = (start_date.isoformat(), end_date.isoformat())
+
+                try:
+                    data = self.snapshot_dashboard(*window, granularity, top_n)
+                except Exception as e:
+                    st.caption(f"Analytics snapshot unavailable ({e}); reading the sales_daily rollup instead.")
+                    data = self.rollup_dashboard(*window, granularity, top_n)
+                self.render_dashboard(data, granularity)
 
             except Exception as e:
                 st.error(f"An error occurred while generating the sales dashboard: {e}")
 
+    def show_chain_dashboard(self):
+        import pandas as pd
+
+        from federation import federated_dashboard, federated_date_range
+        from stores import list_stores
+
+        st.header("All Stores")
+        try:
+            stores = list_stores()
+            first_date, last_date = federated_date_range(stores)
+            if first_date is None:
+                st.write("No sales recorded yet.")
+                return
+            first_date, last_date = date.fromisoformat(first_date), date.fromisoformat(last_date)
+
+            range_col, granularity_col, top_col = st.columns([2, 1, 1])
+            date_range = range_col.date_input("Date range", value=(first_date, last_date),
+                                              min_value=first_date, max_value=last_date, key="chain_dates")
+            granularity = granularity_col.selectbox("Granularity", list(GRANULARITIES), key="chain_granularity")
+            top_n = top_col.number_input("Top products", min_value=1, max_value=50, value=TOP_PRODUCTS,
+                                         key="chain_top")
+            start_date, end_date = (tuple(date_range) * 2)[:2] if date_range else (first_date, last_date)
+
+            data = federated_dashboard(start_date.isoformat(), end_date.isoformat(), granularity, top_n, stores)
+            st.subheader("Sales by Store")
+            st.dataframe(pd.DataFrame(data["stores"], columns=["Store", "Total Sales", "Number of Sales"]),
+                         hide_index=True, width="stretch")
+            self.render_dashboard(data, granularity)
+        except Exception as e:
+            st.error(f"An error occurred while generating the chain dashboard: {e}")
+
+    def show_margins(self):
+        import pandas as pd
+
+        st.header("Margins")
+        try:
+            first_date, last_date = self.dashboard_query("date_range")[0]
+            if first_date is None:
+                st.write("No sales recorded yet.")
+                return
+            first_date, last_date = date.fromisoformat(first_date), date.fromisoformat(last_date)
+            date_range = st.date_input("Date range", value=(first_date, last_date), min_value=first_date,
+                                       max_value=last_date, key="margin_dates")
+            start_date, end_date = (tuple(date_range) * 2)[:2] if date_range else (first_date, last_date)
+
+            df = pd.DataFrame(self.dashboard_query("margins", (start_date.isoformat(), end_date.isoformat())),
+                              columns=["Product", "Quantity Sold", "Revenue", "Costed Revenue", "COGS"])
+            df["Gross Margin"] = df["Costed Revenue"] - df["COGS"]
+            df["Margin %"] = (100 * df["Gross Margin"] / df["Costed Revenue"].where(df["Costed Revenue"] > 0)).round(1)
+
+            revenue, costed_revenue, cogs = df["Revenue"].sum(), df["Costed Revenue"].sum(), df["COGS"].sum()
+            revenue_col, cogs_col, margin_col = st.columns(3)
+            revenue_col.metric("Revenue", f"${revenue:,.2f}")
+            cogs_col.metric("Cost of Goods Sold", f"${cogs:,.2f}")
+            margin_col.metric("Gross Margin", f"${costed_revenue - cogs:,.2f}",
+                              f"{100 * (costed_revenue - cogs) / costed_revenue:.1f}%" if costed_revenue else None)
+            if costed_revenue < revenue:
+                st.caption(f"Margins cover ${costed_revenue:,.2f} of revenue. Sales whose stock lots had no unit "
+                           f"cost, that were oversold, or that were recorded before lot tracking have no cost.")
+            st.dataframe(df, hide_index=True, width="stretch")
+        except Exception as e:
+            st.error(f"An error occurred while calculating margins: {e}")
+
     def display(self):
         st.sidebar.header("Sales Manager")
-        page = st.sidebar.selectbox("Select a page", ["Record Sale", "View Sales", "Sales Dashboard"])
+        page = st.sidebar.selectbox("Select a page", ["Record Sale", "View Sales", "Sales Dashboard", "Margins",
+                                                      "Reprint Bills"])
 
         if page == "Record Sale":
             self.record_sale()
@@ -220,4 +492,21 @@ class SalesManager:
             show_dashboard = st.sidebar.checkbox("Show Sales Dashboard", value=True)
             if show_dashboard:
                 self.show_sales_dashboard()
-
+        elif page == "Margins":
+            self.show_margins()
+        elif page == "Reprint Bills":
+            self.reprint_bills()
+
+
+def bills_job(job, selection, output):
+    bills = SalesManager(job.c).load_bills(**selection)
+    if not bills:
+        return "No sales found for this selection."
+    job.progress(0.1, f"Rendering {len(bills):,} bills")
+    if output == "Single PDF":
+        data, file_name, mime = render_bills_pdf(bills), "bills.pdf", "application/pdf"
+    else:
+        data, file_name, mime = render_bills_zip(bills), "bills.zip", "application/zip"
+    with open(job.output(file_name, mime), "wb") as f:
+        f.write(data)
+    return f"{len(bills):,} bills rendered"
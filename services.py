@@ -0,0 +1,159 @@
+from datetime import date, datetime
+
+from catalog import product_search_condition
+from checkout import Checkout
+from db_manager import run_in_transaction
+from inventory import InsufficientStock, Inventory
+from query_cache import query_cache
+from reorder import ReorderLevels
+from sale_queue import WRITE_BEHIND, sale_queue_for
+
+# Shop operations without any UI, for the Streamlit pages and the HTTP API (api.py). They take
+# and return plain values, and refuse bad input with ValueError.
+LOOKUP_BATCH = 500
+RESTOCK_TABLES = ("products", "stock", "inventory", "stock_alerts")
+
+STOCK_QUERY = """SELECT p.id, p.product_name, p.price, COALESCE(i.on_hand, 0), i.last_restock, i.last_sale,
+                        a.product_id IS NOT NULL
+                 FROM products p
+                 LEFT JOIN inventory i ON i.product_id = p.id
+                 LEFT JOIN stock_alerts a ON a.product_id = p.id"""
+STOCK_FIELDS = ("product_id", "product_name", "price", "on_hand", "last_restock", "last_sale", "low_stock")
+
+
+def _product_name(value):
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f"Product names must be non-empty text, not {value!r}")
+    return value
+
+
+def _quantity(value, minimum):
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        raise ValueError(f"Quantity must be a whole number of at least {minimum}, not {value!r}")
+    return value
+
+
+def _amount(value, name):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        raise ValueError(f"{name} must be a number of at least 0, not {value!r}")
+    return float(value)
+
+
+def _text(value, name):
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"{name} must be text, not {value!r}")
+    return value or ""
+
+
+def _sale_date(value):
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except (TypeError, ValueError):
+        raise ValueError(f"Dates must look like 2024-09-01, not {value!r}") from None
+
+
+class ShopService:
+    def __init__(self, cursor):
+        self.c = cursor
+
+    def stock(self, product_names=None, search=None, limit=100):
+        # Stock levels of the named products (unknown names are left out), of the products
+        # matching search, or of the first `limit` products by name
+        if product_names is not None:
+            rows = []
+            for i in range(0, len(product_names), LOOKUP_BATCH):
+                batch = product_names[i:i + LOOKUP_BATCH]
+                rows += self.c.execute(f"{STOCK_QUERY} WHERE p.product_name IN ({','.join('?' * len(batch))})",
+                                       batch).fetchall()
+        elif search:
+            condition, param = product_search_condition(self.c, "p.product_name", "p.id", search)
+            rows = self.c.execute(f"{STOCK_QUERY} WHERE {condition} ORDER BY p.product_name LIMIT ?",
+                                  (param, limit)).fetchall()
+        else:
+            rows = self.c.execute(f"{STOCK_QUERY} ORDER BY p.product_name LIMIT ?", (limit,)).fetchall()
+        return [dict(zip(STOCK_FIELDS, row[:-1] + (bool(row[-1]),))) for row in rows]
+
+    def low_stock(self):
+        return [{"product_id": product_id, "product_name": product_name, "on_hand": on_hand, "daily_rate": daily_rate,
+                 "days_of_cover": days_of_cover, "reorder_point": reorder_point, "raised_at": raised_at}
+                for product_name, on_hand, daily_rate, days_of_cover, reorder_point, raised_at, product_id
+                in ReorderLevels(self.c).alerts()]
+
+    def restock(self, items, update_prices=False, date_added=None):
+        # items: (product_name, quantity, unit_cost, price), all committed together or not at all.
+        # A product that does not exist yet is created at its price. An existing product keeps
+        # its price unless update_prices is set. Returns the product ids, in order.
+        date_added = _sale_date(date_added) or datetime.now().strftime("%Y-%m-%d")
+        checked = []
+        for product_name, quantity, unit_cost, price in items:
+            checked.append((_product_name(product_name), _quantity(quantity, 0), _amount(unit_cost, "Unit cost"),
+                            _amount(price, "Price")))
+
+        def work():
+            last_stock_id = self.c.execute("SELECT COALESCE(MAX(id), 0) FROM stock").fetchone()[0]
+            product_ids = []
+            for product_name, quantity, unit_cost, price in checked:
+                row = self.c.execute("SELECT id FROM products WHERE product_name=?", (product_name,)).fetchone()
+                if row is None:
+                    if price is None:
+                        raise ValueError(f"Unknown product {product_name!r}: a new product needs a price")
+                    self.c.execute("INSERT INTO products (product_name, price) VALUES (?, ?)", (product_name, price))
+                    product_ids.append(self.c.lastrowid)
+                else:
+                    if update_prices and price is not None:
+                        self.c.execute("UPDATE products SET price=? WHERE id=?", (price, row[0]))
+                    product_ids.append(row[0])
+            # Restocks of nothing only change the price
+            self.c.executemany("""INSERT INTO stock (product_id, date_added, quantity, unit_cost, remaining)
+                                  VALUES (?, ?, ?, ?, ?)""",
+                               [(product_id, date_added, quantity, unit_cost, quantity)
+                                for product_id, (_, quantity, unit_cost, _) in zip(product_ids, checked) if quantity])
+            Inventory(self.c).apply_stock_since(last_stock_id)
+            ReorderLevels(self.c).apply_stock_since(last_stock_id)
+            query_cache.touch(self.c, *RESTOCK_TABLES)
+            return product_ids
+
+        product_ids = run_in_transaction(self.c.connection, work)
+        query_cache.invalidate(*RESTOCK_TABLES)
+        return product_ids
+
+    def record_sales(self, orders):
+        # orders: (cart, customer_name, customer_mobile, date_of_sale) with cart [(product_name, quantity)].
+        # Each order is recorded or refused on its own. With write-behind on, recorded means queued.
+        # Returns a dict per order: its order id (or queue number), date, total and lines, or its error.
+        checked = []
+        results = []
+        for cart, customer_name, customer_mobile, date_of_sale in orders:
+            try:
+                cart = [(_product_name(product_name), _quantity(quantity, 1)) for product_name, quantity in cart]
+                checked.append((cart, _text(customer_name, "Customer name"), _text(customer_mobile, "Customer mobile"),
+                                _sale_date(date_of_sale)))
+                results.append(None)
+            except (TypeError, ValueError) as e:
+                checked.append(None)
+                results.append(ValueError(f"Invalid order: {e}"))
+
+        # Without the queue (another process holds its journal) sales are committed directly
+        queue = sale_queue_for(self.c) if WRITE_BEHIND else None
+        if queue is not None:
+            for index, order in enumerate(checked):
+                if order is not None:
+                    try:
+                        results[index] = ("queued", *queue.submit(*order))
+                    except (InsufficientStock, ValueError) as e:
+                        results[index] = e
+        else:
+            placed = Checkout(self.c).place_orders([order for order in checked if order is not None])
+            indexes = [index for index, order in enumerate(checked) if order is not None]
+            for index, result in zip(indexes, placed):
+                results[index] = result if isinstance(result, Exception) else ("order_id", *result)
+
+        return [{"error": str(result)} if isinstance(result, Exception) else
+                {result[0]: result[1], "date_of_sale": result[2], "total": sum(line[4] for line in result[3]),
+                 "lines": [{"product_name": product_name, "price": price, "quantity": quantity, "total": total}
+                           for _, product_name, price, quantity, total in result[3]]}
+                for result in results]
@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# One flat binary file per column, appended to as new sales arrive
+COLUMNS = {"id": np.int64, "product": np.int32, "day": np.int32, "quantity": np.int32, "total": np.float64}
+# Day number stored for sales whose date could not be parsed; outside every date window
+MISSING_DAY = np.iinfo(np.int32).min
+EPOCH = np.datetime64("1970-01-01", "D")
+
+
+def to_days(dates):
+    # ISO date strings -> days since 1970-01-01
+    parsed = pd.to_datetime(pd.Series(dates, dtype=object).str.slice(0, 10), format="%Y-%m-%d", errors="coerce")
+    return (parsed - pd.Timestamp(0)).dt.days.fillna(MISSING_DAY).to_numpy(np.int32)
+
+
+def from_days(days):
+    return [str(day) for day in EPOCH + np.asarray(days, dtype="timedelta64[D]")]
+
+
+class SalesSnapshot:
+    # A columnar copy of the sales table in memory-mapped NumPy arrays, for vectorized
+    # analytics scans. Product ids are dictionary-encoded to dense codes, so group-bys are
+    # np.bincount calls. refresh() appends sales past the id high-water mark; meta.json
+    # records how many rows of each column file are valid.
+    CHUNK_SIZE = 100000
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def meta(self):
+        try:
+            with open(self._path("meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"rows": 0, "high_water_id": 0, "products": []}
+
+    def _save_meta(self, meta):
+        # Written after the column data, and replaced atomically
+        with open(self._path("meta.json.tmp"), "w") as f:
+            json.dump(meta, f)
+        os.replace(self._path("meta.json.tmp"), self._path("meta.json"))
+
+    def refresh(self, cursor):
+        # Append sales newer than the high-water mark; returns the number of rows added
+        with self._lock:
+            meta = self.meta()
+            codes = {product_id: code for code, product_id in enumerate(meta["products"])}
+            files = {}
+            try:
+                for name, dtype in COLUMNS.items():
+                    files[name] = open(self._path(f"{name}.bin"), "ab")
+                    # Drop anything past the last recorded row, e.g. from an interrupted refresh
+                    files[name].truncate(meta["rows"] * np.dtype(dtype).itemsize)
+                rows = cursor.execute("""SELECT id, product_id, date_of_sale, quantity, total FROM sales
+                                         WHERE id > ? ORDER BY id""", (meta["high_water_id"],))
+                added = 0
+                while True:
+                    chunk = rows.fetchmany(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    ids, product_ids, dates, quantities, totals = zip(*chunk)
+                    columns = {
+                        "id": np.array(ids, dtype=np.int64),
+                        "product": np.fromiter((codes.setdefault(product_id, len(codes)) for product_id in product_ids),
+                                               dtype=np.int32, count=len(chunk)),
+                        "day": to_days(dates),
+                        "quantity": np.array(quantities, dtype=np.int32),
+                        "total": np.array(totals, dtype=np.float64),
+                    }
+                    for name, values in columns.items():
+                        files[name].write(values.tobytes())
+                    added += len(chunk)
+                    meta["high_water_id"] = ids[-1]
+            finally:
+                for f in files.values():
+                    f.close()
+            if added:
+                meta["rows"] += added
+                meta["products"] = list(codes)
+                self._save_meta(meta)
+            return added
+
+    def clear(self):
+        # Drop every row; the next refresh() reloads the whole sales table. Needed whenever
+        # sales are deleted or changed, which the id high-water mark cannot see.
+        with self._lock:
+            for name in [f"{column}.bin" for column in COLUMNS] + ["meta.json"]:
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+
+    def rebuild(self, cursor):
+        with self._lock:
+            self.clear()
+            return self.refresh(cursor)
+
+    def columns(self):
+        # Read-only memory maps of the valid rows, plus the product id for each code
+        meta = self.meta()
+        if not meta["rows"]:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}, np.empty(0, dtype=np.int64)
+        columns = {name: np.memmap(self._path(f"{name}.bin"), dtype=dtype, mode="r", shape=(meta["rows"],))
+                   for name, dtype in COLUMNS.items()}
+        # Sales without a product id are encoded like any other key and reported as -1
+        return columns, np.array([-1 if product_id is None else product_id for product_id in meta["products"]],
+                                 dtype=np.int64)
+
+    @staticmethod
+    def _window(columns, start_date=None, end_date=None):
+        # Boolean mask for the date window, or None when it covers every row
+        if start_date is None and end_date is None:
+            return None
+        day = columns["day"]
+        mask = np.ones(len(day), dtype=bool)
+        if start_date is not None:
+            mask &= day >= to_days([start_date])[0]
+        if end_date is not None:
+            mask &= day <= to_days([end_date])[0]
+        return mask
+
+    def totals(self, start_date=None, end_date=None):
+        # (revenue, number of sales)
+        columns, _ = self.columns()
+        mask = self._window(columns, start_date, end_date)
+        if mask is None:
+            return float(columns["total"].sum()), len(columns["total"])
+        return float(columns["total"][mask].sum()), int(mask.sum())
+
+    def by_product(self, start_date=None, end_date=None):
+        # Per product id: (product ids, quantity, revenue), for products sold in the window
+        columns, product_ids = self.columns()
+        mask = self._window(columns, start_date, end_date)
+        codes = columns["product"] if mask is None else columns["product"][mask]
+        quantity = columns["quantity"] if mask is None else columns["quantity"][mask]
+        total = columns["total"] if mask is None else columns["total"][mask]
+        counts = np.bincount(codes, minlength=len(product_ids))
+        sold = counts > 0
+        return (product_ids[sold], np.bincount(codes, weights=quantity, minlength=len(product_ids))[sold],
+                np.bincount(codes, weights=total, minlength=len(product_ids))[sold])
+
+    def by_day(self, start_date=None, end_date=None):
+        # (days with sales, revenue per day), in date order
+        columns, _ = self.columns()
+        mask = self._window(columns, start_date, end_date)
+        day = columns["day"] if mask is None else columns["day"][mask]
+        total = columns["total"] if mask is None else columns["total"][mask]
+        day, total = day[day != MISSING_DAY], total[day != MISSING_DAY]
+        if not len(day):
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        first = int(day.min())
+        revenue = np.bincount(day - first, weights=total)
+        days = np.flatnonzero(np.bincount(day - first)) + first
+        return days, revenue[days - first]
+
+    def by_period(self, start_date=None, end_date=None, period="day"):
+        # Revenue per day, week (starting Monday) or month: (first day of each period, revenue)
+        days, revenue = self.by_day(start_date, end_date)
+        if period == "week":
+            # 1970-01-01 was a Thursday
+            days = days - (days + 3) % 7
+        elif period == "month":
+            days = ((EPOCH + days.astype("timedelta64[D]")).astype("datetime64[M]").astype("datetime64[D]")
+                    - EPOCH).astype(np.int32)
+        periods, index = np.unique(days, return_inverse=True)
+        return periods, np.bincount(index, weights=revenue, minlength=len(periods))
+
+    def check(self, cursor):
+        # Per product disagreements with SQLite up to the high-water mark:
+        # (product_id, sqlite count, snapshot count, sqlite revenue, snapshot revenue)
+        meta = self.meta()
+        raw = {-1 if product_id is None else product_id: (count, quantity or 0, revenue or 0.0)
+               for product_id, count, quantity, revenue in cursor.execute(
+            """SELECT product_id, COUNT(*), SUM(quantity), SUM(total) FROM sales
+               WHERE id <= ? GROUP BY product_id""", (meta["high_water_id"],))}
+        columns, product_ids = self.columns()
+        counts = np.bincount(columns["product"], minlength=len(product_ids))
+        quantities = np.bincount(columns["product"], weights=columns["quantity"], minlength=len(product_ids))
+        revenues = np.bincount(columns["product"], weights=columns["total"], minlength=len(product_ids))
+        snap = {int(product_id): (int(count), int(quantity), float(revenue))
+                for product_id, count, quantity, revenue in zip(product_ids, counts, quantities, revenues) if count}
+        mismatches = []
+        for product_id in sorted(set(raw) | set(snap)):
+            count, quantity, revenue = raw.get(product_id, (0, 0, 0.0))
+            snap_count, snap_quantity, snap_revenue = snap.get(product_id, (0, 0, 0.0))
+            if count != snap_count or quantity != snap_quantity or abs(revenue - snap_revenue) > 0.005:
+                mismatches.append((product_id, count, snap_count, revenue, snap_revenue))
+        return mismatches
+
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot(db_name='shop_data.db'):
+    path = os.path.abspath(db_name)
+    with _snapshots_lock:
+        snapshot = _snapshots.get(path)
+        if snapshot is None:
+            snapshot = _snapshots[path] = SalesSnapshot(path + ".analytics")
+        return snapshot
+
+
+def snapshot_for(cursor):
+    # The snapshot of whichever database file this cursor is connected to
+    return get_snapshot(cursor.execute("PRAGMA database_list").fetchone()[2])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the columnar sales snapshot used by the dashboard.")
+    parser.add_argument("command", choices=["refresh", "rebuild", "check"])
+    parser.add_argument("--db", default="shop_data.db")
+    args = parser.parse_args()
+
+    from db_manager import DBManager
+
+    db = DBManager(args.db)
+    snapshot = get_snapshot(args.db)
+    try:
+        if args.command == "rebuild":
+            print(f"Rebuilt snapshot: {snapshot.rebuild(db.c):,} rows")
+        elif args.command == "refresh":
+            print(f"Appended {snapshot.refresh(db.c):,} rows")
+        mismatches = snapshot.check(db.c)
+        for row in mismatches[:20]:
+            print("mismatch (product_id, sqlite/snapshot count, revenue):", row)
+        print(f"{len(mismatches)} mismatched products (snapshot holds {snapshot.meta()['rows']:,} rows)")
+        raise SystemExit(1 if mismatches else 0)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
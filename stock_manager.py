@@ -1,8 +1,29 @@
 from datetime import datetime
 
-import pandas as pd
 import streamlit as st
 
+from catalog import get_catalog
+from db_manager import run_in_transaction
+from pagination import paged_table, search_filters
+from query_cache import query_cache
+from reorder import LEAD_TIME_DAYS, SAFETY_DAYS, ReorderLevels
+from services import ShopService
+
+# Unsold units per product by how long ago their lot was restocked, read from the open lots only
+STOCK_AGE_QUERY = """SELECT p.product_name, SUM(s.remaining), SUM(s.remaining * s.unit_cost), MIN(s.date_added),
+                            SUM(CASE WHEN s.age <= 30 THEN s.remaining ELSE 0 END),
+                            SUM(CASE WHEN s.age > 30 AND s.age <= 90 THEN s.remaining ELSE 0 END),
+                            SUM(CASE WHEN s.age > 90 AND s.age <= 180 THEN s.remaining ELSE 0 END),
+                            SUM(CASE WHEN s.age > 180 THEN s.remaining ELSE 0 END)
+                     FROM (SELECT product_id, remaining, unit_cost, date_added,
+                                  julianday(?) - julianday(date_added) AS age
+                           FROM stock WHERE remaining > 0) s
+                     JOIN products p ON s.product_id = p.id
+                     GROUP BY s.product_id
+                     ORDER BY MIN(s.date_added), p.product_name"""
+STOCK_AGE_LABELS = ["Product", "Unsold Units", "Value at Cost", "Oldest Lot", "0-30 Days", "31-90 Days",
+                    "91-180 Days", "Over 180 Days"]
+
 
 class StockManager:
     def __init__(self, cursor):
@@ -11,20 +32,45 @@ class StockManager:
     def view_stock(self):
         st.header("Current Stock")
 
-        query = """SELECT s.date_added, p.product_name, p.price, s.quantity
-                   FROM stock s
-                   JOIN products p ON s.product_id = p.id"""
-
         try:
-            stock_data = self.c.execute(query).fetchall()
-            if stock_data:
-                df = pd.DataFrame(stock_data, columns=["Date Added", "Product", "Price", "Available Stock"])
-                st.table(df)
-            else:
-                st.write("No stock data available.")
+            where, params = search_filters("stock", self.c, "p.product_name", "p.id")
+            paged_table("stock", self.c,
+                        columns=["p.product_name", "p.price", "i.on_hand", "i.last_restock", "i.last_sale"],
+                        labels=["Product", "Price", "Available Stock", "Last Restock", "Last Sale"],
+                        from_clause="inventory i JOIN products p ON i.product_id = p.id",
+                        id_expr="i.product_id",
+                        sort_options={"Product": "p.product_name", "Available Stock": "i.on_hand",
+                                      "Price": "p.price"},
+                        where=where, params=params, tables=("inventory", "products"))
+
+            st.subheader("Restock History")
+            where, params = search_filters("restock", self.c, "p.product_name", "p.id", "s.date_added")
+            paged_table("restock", self.c,
+                        columns=["s.date_added", "p.product_name", "p.price", "s.quantity"],
+                        labels=["Date Added", "Product", "Price", "Quantity Added"],
+                        from_clause="stock s JOIN products p ON s.product_id = p.id",
+                        id_expr="s.id",
+                        sort_options={"Date Added": "s.date_added", "Quantity Added": "s.quantity"},
+                        where=where, params=params, tables=("stock", "products"))
+
+            self.stock_age()
         except Exception as e:
             st.error(f"An error occurred while fetching stock data: {e}")
 
+    def stock_age(self):
+        import pandas as pd
+
+        st.subheader("Stock Age")
+        rows = query_cache.fetchall(self.c, STOCK_AGE_QUERY, (datetime.now().strftime("%Y-%m-%d"),),
+                                    tables=("stock", "products"))
+        if not rows:
+            st.write("No unsold stock lots.")
+            return
+        df = pd.DataFrame(rows, columns=STOCK_AGE_LABELS)
+        st.caption(f"{int(df['Unsold Units'].sum()):,} unsold units worth ${df['Value at Cost'].sum():,.2f} at cost, "
+                   f"consumed oldest lot first. Lots restocked without a unit cost have no value.")
+        st.dataframe(df, hide_index=True, width="stretch")
+
     def add_stock(self):
         st.header("Add or Update Stock Item")
 
@@ -33,30 +79,23 @@ class StockManager:
 
         if is_update:
             # Select an existing product to update
-            existing_products = self.c.execute("SELECT product_name FROM products").fetchall()
-            existing_product_names = [item[0] for item in existing_products]
-            selected_product = st.selectbox("Select Product to Update", existing_product_names)
+            catalog = get_catalog(self.c)
+            search_term = st.text_input("Search Products")
+            selected_product = st.selectbox("Select Product to Update", catalog.search(search_term, k=50))
 
             if selected_product:
                 # Fetch existing details
-                product_details = self.c.execute(
-                    "SELECT price FROM products WHERE product_name=?", (selected_product,)
-                ).fetchone()
+                _, current_price = catalog.by_name[selected_product]
                 product_name = selected_product
-                price = st.number_input("Price", value=product_details[0], min_value=0.0, format="%.2f")
+                price = st.number_input("Price", value=current_price, min_value=0.0, format="%.2f")
                 quantity = st.number_input("Quantity to Add", min_value=0, format="%d")
+                unit_cost = st.number_input("Unit Cost", value=None, min_value=0.0, format="%.2f",
+                                            help="What one unit of this restock cost to buy, for margins")
 
                 if st.button("Update Stock"):
                     try:
-                        product_id = self.c.execute(
-                            "SELECT id FROM products WHERE product_name=?", (product_name,)
-                        ).fetchone()[0]
-
-                        # Update the product details
-                        self.c.execute("UPDATE products SET price=? WHERE id=?", (price, product_id))
-                        self.c.execute("UPDATE stock SET quantity=quantity + ? WHERE product_id=?",
-                                       (quantity, product_id))
-                        self.c.connection.commit()
+                        # Update the product details and append the restock to the ledger
+                        ShopService(self.c).restock([(product_name, quantity, unit_cost, price)], update_prices=True)
                         st.success(f"Stock for '{product_name}' updated successfully!")
                     except Exception as e:
                         st.error(f"An error occurred while updating stock: {e}")
@@ -65,21 +104,67 @@ class StockManager:
             product_name = st.text_input("Product Name")
             price = st.number_input("Price", min_value=0.0, format="%.2f")
             quantity = st.number_input("Quantity", min_value=0, format="%d")
+            unit_cost = st.number_input("Unit Cost", value=None, min_value=0.0, format="%.2f",
+                                        help="What one unit of this stock cost to buy, for margins")
 
             if st.button("Add to Stock"):
                 try:
                     if product_name and price > 0 and quantity > 0:
-                        self.c.execute("INSERT OR IGNORE INTO products (product_name, price) VALUES (?, ?)",
-                                       (product_name, price))
-                        product_id = self.c.execute(
-                            "SELECT id FROM products WHERE product_name=?", (product_name,)
-                        ).fetchone()[0]
-                        date_added = datetime.now().strftime("%Y-%m-%d")
-                        self.c.execute("INSERT INTO stock (product_id, date_added, quantity) VALUES (?, ?, ?)",
-                                       (product_id, date_added, quantity))
-                        self.c.connection.commit()
+                        ShopService(self.c).restock([(product_name, quantity, unit_cost, price)])
                         st.success("New stock item added successfully!")
                     else:
                         st.error("Please fill in all fields correctly.")
                 except Exception as e:
                     st.error(f"An error occurred while adding stock: {e}")
+
+    def low_stock(self):
+        import pandas as pd
+
+        st.header("Low Stock")
+        st.caption(f"Products whose stock will not last through their reorder lead time plus safety days "
+                   f"(by default {LEAD_TIME_DAYS} + {SAFETY_DAYS} days), at their recent rate of sale.")
+        levels = ReorderLevels(self.c)
+        try:
+            # Only the open alerts need a second look as time passes, and only once their figures are out of date
+            stale = levels.stale_alerts()
+            if stale:
+                def refresh():
+                    levels.update_alerts(stale)
+                    query_cache.touch(self.c, "stock_alerts")
+
+                run_in_transaction(self.c.connection, refresh)
+                query_cache.invalidate("stock_alerts")
+            alerts = levels.alerts()
+            if alerts:
+                df = pd.DataFrame([alert[:6] for alert in alerts],
+                                  columns=["Product", "On Hand", "Units per Day", "Days of Cover", "Reorder Point",
+                                           "Alert Raised"])
+                st.dataframe(df.round({"Units per Day": 2, "Days of Cover": 1, "Reorder Point": 1}),
+                             hide_index=True, width="stretch")
+            else:
+                st.success("Every product has enough stock.")
+        except Exception as e:
+            st.error(f"An error occurred while checking stock levels: {e}")
+
+        with st.expander("Reorder policy for a product"):
+            catalog = get_catalog(self.c)
+            search_term = st.text_input("Search Products", key="policy_search")
+            product_name = st.selectbox("Product", catalog.search(search_term, k=50), key="policy_product")
+            lead_col, safety_col = st.columns(2)
+            lead_time_days = lead_col.number_input("Lead time (days)", value=None, min_value=0.0,
+                                                   placeholder=f"Default ({LEAD_TIME_DAYS})")
+            safety_days = safety_col.number_input("Safety days", value=None, min_value=0.0,
+                                                  placeholder=f"Default ({SAFETY_DAYS})")
+            if product_name and st.button("Save policy"):
+                try:
+                    product_id = catalog.by_name[product_name][0]
+
+                    def save():
+                        levels.set_policy(product_id, lead_time_days, safety_days)
+                        query_cache.touch(self.c, "reorder_levels", "stock_alerts")
+
+                    run_in_transaction(self.c.connection, save)
+                    query_cache.invalidate("reorder_levels", "stock_alerts")
+                    st.success(f"Reorder policy for '{product_name}' saved.")
+                except Exception as e:
+                    st.error(f"An error occurred while saving the reorder policy: {e}")
@@ -0,0 +1,56 @@
+import argparse
+import os
+import re
+
+# Every store has its own SQLite database, so stores never wait on each other's writer lock.
+# The first store keeps shop_data.db; the others live in the stores folder as <store id>.db.
+DEFAULT_STORE = "main"
+DEFAULT_DB = "shop_data.db"
+STORES_DIR = os.environ.get("SHOP_STORES_DIR", "stores")
+STORE_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def store_db(store_id=DEFAULT_STORE):
+    if store_id == DEFAULT_STORE:
+        return DEFAULT_DB
+    if not STORE_ID.fullmatch(store_id or ""):
+        raise ValueError(f"Invalid store id {store_id!r}: use letters, digits, '-' and '_'")
+    return os.path.join(STORES_DIR, f"{store_id}.db")
+
+
+def list_stores():
+    stores = [DEFAULT_STORE]
+    if os.path.isdir(STORES_DIR):
+        stores += sorted(name[:-3] for name in os.listdir(STORES_DIR)
+                         if name.endswith(".db") and STORE_ID.fullmatch(name[:-3]) and name[:-3] != DEFAULT_STORE)
+    return stores
+
+
+def create_store(store_id):
+    # Creates the store's database with the current schema; opening an existing store is harmless
+    from db_manager import get_pool
+
+    db_name = store_db(store_id)
+    if os.path.dirname(db_name):
+        os.makedirs(os.path.dirname(db_name), exist_ok=True)
+    get_pool(db_name)
+    return db_name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the stores or create a new one.")
+    parser.add_argument("command", choices=["list", "create"])
+    parser.add_argument("store_id", nargs="?")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        if not args.store_id:
+            parser.error("create needs a store id")
+        print(f"Store {args.store_id} uses {create_store(args.store_id)}")
+    else:
+        for store_id in list_stores():
+            print(f"{store_id:<24} {store_db(store_id)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import pytest
+
+from db_manager import DBManager
+from services import ShopService
+
+PRODUCTS = [("Apple iPhone 14", 10, 600.0, 999.99), ("Samsung Galaxy S23", 10, 500.0, 899.99)]
+
+
+@pytest.fixture
+def shop_dir(tmp_path, monkeypatch):
+    # shop_data.db, the stores folder and job results are all relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def db(shop_dir):
+    db = DBManager("shop_data.db")
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def stocked_db(db):
+    ShopService(db.c).restock(PRODUCTS, date_added="2024-09-01")
+    return db
@@ -0,0 +1,43 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import api
+import services
+from api import ShopAPI
+from sale_queue import SaleQueue
+
+
+def post(db, path, body):
+    async def request():
+        async with TestClient(TestServer(ShopAPI(db.pool.db_name, workers=2).app())) as client:
+            response = await client.post(path, json=body)
+            return response.status, await response.json()
+
+    return asyncio.run(request())
+
+
+def test_orders_with_customer_fields_that_are_not_text_are_refused_on_their_own(stocked_db):
+    status, body = post(stocked_db, "/sales", {"orders": [
+        {"lines": [{"product": "Apple iPhone 14", "quantity": 1}], "customer_name": {"first": "Asha"}},
+        {"lines": [{"product": "Apple iPhone 14", "quantity": 1}], "customer_mobile": [98765]},
+        {"lines": [{"product": "Samsung Galaxy S23", "quantity": 2}], "customer_name": "Ravi"}]})
+
+    assert status == 200 and (body["recorded"], body["refused"]) == (1, 2)
+    assert body["results"][0]["error"].startswith("Invalid order: Customer name must be text")
+    assert body["results"][1]["error"].startswith("Invalid order: Customer mobile must be text")
+    assert body["results"][2]["total"] == 1799.98
+    assert stocked_db.c.execute("SELECT customer_name FROM orders").fetchall() == [("Ravi",)]
+
+
+def test_api_sales_are_committed_directly_while_another_process_holds_the_sale_queue(stocked_db, monkeypatch):
+    monkeypatch.setattr(api, "WRITE_BEHIND", True)
+    monkeypatch.setattr(services, "WRITE_BEHIND", True)
+    queue = SaleQueue(stocked_db.pool.db_name, durable=False)
+    try:
+        status, body = post(stocked_db, "/sales", {"orders": [
+            {"lines": [{"product": "Apple iPhone 14", "quantity": 1}], "customer_name": "Asha"}]})
+        assert status == 200 and body["results"][0]["order_id"] == 1
+        assert queue.pending() == 0 and open(queue.path, "rb").read() == b""
+    finally:
+        queue.close(timeout=10)
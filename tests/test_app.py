@@ -0,0 +1,52 @@
+import os
+
+from streamlit.testing.v1 import AppTest
+
+from services import ShopService
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+def open_page(option, page=None):
+    at = AppTest.from_file(APP, default_timeout=60).run()
+    at.sidebar.selectbox[1].select(option).run()
+    if page:
+        at.sidebar.selectbox[2].select(page).run()
+    return at
+
+
+def test_prepare_sales_export(stocked_db):
+    ShopService(stocked_db.c).record_sales([([("Apple iPhone 14", 2)], "Asha", "", "2024-09-02")])
+    at = open_page("🛒 Shopping", "View Sales")
+    for export_format in ["CSV", "CSV (gzip)"]:
+        [select for select in at.selectbox if select.label == "Export format"][0].select(export_format).run()
+        [button for button in at.button if button.label == "Prepare export"][0].click().run()
+        assert not at.exception and not at.error
+        assert [caption.value for caption in at.caption if "exported" in caption.value] == ["1 sales exported"]
+        assert at.get("download_button")[0].proto.label == f"Download Sales {export_format}"
+
+
+def test_duplicates_need_confirming_before_removal(stocked_db):
+    # The same restock entered twice by hand is indistinguishable from a file imported twice
+    ShopService(stocked_db.c).restock([("Apple iPhone 14", 10, 600.0, None)], date_added="2024-09-01")
+    at = open_page("📈 Import Data")
+    [button for button in at.button if button.label == "Find duplicates"][0].click().run()
+    assert at.dataframe[0].value["ID"].tolist() == [3]
+    remove = [button for button in at.button if button.label == "Remove duplicates"][0]
+    assert remove.disabled
+    [checkbox for checkbox in at.checkbox if checkbox.label.startswith("I have checked")][0].check().run()
+    [button for button in at.button if button.label == "Remove duplicates"][0].click().run()
+    assert not at.exception and not at.error
+    assert stocked_db.c.execute("SELECT COUNT(*) FROM stock").fetchone()[0] == 2
+
+
+def test_dashboards_skip_days_that_are_not_iso_dates(stocked_db):
+    ShopService(stocked_db.c).record_sales([([("Apple iPhone 14", 2)], "Asha", "", "2024-09-02")])
+    # A day written as text by an import from before dates were checked
+    stocked_db.c.execute("INSERT INTO sales_daily (date, product_id, qty, revenue, count, costed_revenue, cogs) "
+                         "VALUES ('03/09/2024', 2, 1, 899.99, 1, 0, 0)")
+    stocked_db.conn.commit()
+    for page in ["Sales Dashboard", "Margins"]:
+        at = open_page("🛒 Shopping", page)
+        assert not at.exception and not at.error
+        assert not [metric for metric in at.metric if metric.label == "Revenue" and metric.value != "$1,999.98"]
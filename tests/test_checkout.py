@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+from checkout import Checkout
+from db_manager import DBManager
+from inventory import InsufficientStock
+
+
+def on_hand(db):
+    return db.c.execute("SELECT on_hand FROM inventory ORDER BY product_id").fetchall()
+
+
+def test_concurrent_checkouts_never_oversell(stocked_db):
+    sold = []
+
+    def till():
+        db = DBManager(stocked_db.pool.db_name)
+        try:
+            while True:
+                try:
+                    Checkout(db.c).place_order([("Apple iPhone 14", 3)])
+                    sold.append(3)
+                except InsufficientStock as e:
+                    if e.available < 3:
+                        return
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=till) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(sold) == 9
+    assert on_hand(stocked_db) == [(1,), (10,)]
+    assert stocked_db.c.execute("SELECT SUM(quantity) FROM sales").fetchone()[0] == 9
+
+
+def test_a_short_line_refuses_the_whole_order(stocked_db):
+    with pytest.raises(InsufficientStock, match="Only 10 of Samsung Galaxy S23 in stock, 11 requested"):
+        Checkout(stocked_db.c).place_order([("Apple iPhone 14", 2), ("Samsung Galaxy S23", 11)])
+    assert on_hand(stocked_db) == [(10,), (10,)]
+    assert stocked_db.c.execute("SELECT COUNT(*) FROM orders").fetchone()[0] == 0
+
+
+def test_a_refused_order_in_a_batch_leaves_the_others_standing(stocked_db):
+    results = Checkout(stocked_db.c).place_orders([
+        ([("Apple iPhone 14", 2), ("Samsung Galaxy S23", 1)], "Asha", "", "2024-09-02"),
+        # Its first line fits, so it is reserved before the second is refused and rolled back
+        ([("Apple iPhone 14", 1), ("Samsung Galaxy S23", 20)], "Ravi", "", "2024-09-02"),
+        ([("Samsung Galaxy S23", 4)], "Meera", "", "2024-09-02")])
+
+    assert isinstance(results[1], InsufficientStock)
+    assert [result[0] for result in (results[0], results[2])] == [1, 2]
+    assert stocked_db.c.execute("SELECT id, customer_name, line_count FROM orders").fetchall() == [
+        (1, "Asha", 2), (2, "Meera", 1)]
+    assert stocked_db.c.execute("SELECT COUNT(*) FROM order_lines").fetchone()[0] == 3
+    assert on_hand(stocked_db) == [(8,), (5,)]
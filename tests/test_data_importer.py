@@ -0,0 +1,65 @@
+from data_importer import DataImporter
+from services import ShopService
+
+SALES_CSV = """date_of_sale,product_name,price,quantity,total
+2024-09-02,Apple iPhone 14,999.99,1,999.99
+2024-09-02,Samsung Galaxy S23,899.99,2,1799.98
+2024-09-03,Apple iPhone 14,999.99,1,999.99
+"""
+
+
+def revenue(db):
+    return db.c.execute("SELECT COUNT(*), ROUND(SUM(total), 2) FROM sales").fetchone()
+
+
+def test_reimporting_a_file_imported_before_rows_were_keyed(stocked_db, shop_dir):
+    path = shop_dir / "sales.csv"
+    path.write_text(SALES_CSV)
+    importer = DataImporter(stocked_db.c)
+    importer.bulk_import(str(path))
+    # As imported before rows carried an import key
+    stocked_db.c.execute("UPDATE sales SET row_hash = NULL")
+    stocked_db.conn.commit()
+    assert revenue(stocked_db) == (3, 3799.96)
+
+    _, inserted, _, _ = importer.bulk_import(str(path))
+    assert inserted == 3 and revenue(stocked_db) == (6, 7599.92)
+    assert importer.count_duplicates("Sales") == 3
+
+    assert importer.remove_duplicates("Sales") == 3
+    assert revenue(stocked_db) == (3, 3799.96)
+    assert stocked_db.c.execute("SELECT ROUND(SUM(revenue), 2) FROM sales_daily").fetchone()[0] == 3799.96
+    assert stocked_db.c.execute("SELECT on_hand FROM inventory ORDER BY product_id").fetchall() == [(8,), (8,)]
+
+    # The legacy rows now carry the keys, so the file is recognised from here on
+    _, inserted, duplicates, _ = importer.bulk_import(str(path))
+    assert (inserted, duplicates) == (0, 3)
+    assert importer.count_duplicates("Sales") == 0
+
+STOCK_CSV = """date_added,product_name,price,quantity,unit_cost
+2024-09-01,Kettle,25.0,5,10.0
+2024-09-01,Toaster,30.0,5,12.0
+"""
+
+
+def test_duplicate_lots_sold_from_or_at_another_cost_are_kept(db, shop_dir):
+    path = shop_dir / "stock.csv"
+    path.write_text(STOCK_CSV)
+    importer = DataImporter(db.c)
+    # The same file imported twice before rows were keyed
+    for _ in range(2):
+        importer.bulk_import(str(path))
+        db.c.execute("UPDATE stock SET row_hash = NULL")
+        db.conn.commit()
+    ShopService(db.c).restock([("Toaster", 5, 15.0, None)], date_added="2024-09-01")
+    # Takes all of the first Kettle lot and two units of its copy
+    ShopService(db.c).record_sales([([("Kettle", 7)], "", "", "2024-09-02")])
+
+    assert importer.remove_duplicates("Stock") == 1
+    assert db.c.execute("""SELECT p.product_name, s.quantity, s.unit_cost, s.remaining
+                           FROM stock s JOIN products p ON p.id = s.product_id ORDER BY s.id""").fetchall() == [
+        ("Kettle", 5, 10.0, 0), ("Toaster", 5, 12.0, 5), ("Kettle", 5, 10.0, 3), ("Toaster", 5, 15.0, 5)]
+    assert db.c.execute("""SELECT i.on_hand, SUM(s.remaining) FROM inventory i JOIN stock s USING (product_id)
+                           GROUP BY i.product_id""").fetchall() == [(3, 3), (10, 10)]
+    assert db.c.execute("SELECT COUNT(*) FROM sale_lots WHERE stock_id NOT IN (SELECT id FROM stock)"
+                        ).fetchone()[0] == 0
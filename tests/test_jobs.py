@@ -0,0 +1,51 @@
+import io
+import os
+import time
+
+from data_importer import import_job
+from jobs import ACTIVE, get_runner
+
+
+def wait_for(runner, job_ids, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        jobs = {job[0]: job for job in runner.jobs() if job[0] in job_ids}
+        if all(job[3] not in ACTIVE for job in jobs.values()) or time.monotonic() > deadline:
+            return jobs
+        time.sleep(0.05)
+
+
+def upload(name, text):
+    file = io.BytesIO(text.encode())
+    file.name = name
+    return file
+
+
+def test_uploads_with_the_same_name_do_not_collide(db):
+    runner = get_runner(db.pool.db_name)
+    paths = [runner.save_upload(upload("stock.csv", "date_added,product_name,price,quantity\n"
+                                                    f"2024-09-01,{product_name},10.0,5\n"))
+             for product_name in ["Kettle", "Toaster"]]
+    assert len(set(paths)) == 2 and all(os.path.basename(path) == "stock.csv" for path in paths)
+
+    jobs = wait_for(runner, [runner.submit("import", "stock.csv", import_job, path) for path in paths])
+    assert [job[3] for job in jobs.values()] == ["done", "done"]
+    assert db.c.execute("SELECT product_name FROM products ORDER BY product_name").fetchall() == [("Kettle",),
+                                                                                                 ("Toaster",)]
+    assert os.listdir(os.path.join(runner.results_dir, "uploads")) == []
+
+
+def test_failed_imports_and_leftover_uploads_are_cleaned_up(db):
+    runner = get_runner(db.pool.db_name)
+    uploads_dir = os.path.join(runner.results_dir, "uploads")
+    # A folder left behind by an earlier process
+    os.makedirs(os.path.join(uploads_dir, "leftover"))
+    path = runner.save_upload(upload("stock.csv", "not,a,known,layout\n1,2,3,4\n"))
+
+    jobs = wait_for(runner, [runner.submit("import", "stock.csv", import_job, path)])
+    assert [job[3] for job in jobs.values()] == ["failed"]
+    assert not os.path.exists(os.path.dirname(path))
+
+    pending = runner.save_upload(upload("stock.csv", "date_added,product_name,price,quantity\n"))
+    runner.clear_finished()
+    assert os.listdir(uploads_dir) == [os.path.basename(os.path.dirname(pending))]
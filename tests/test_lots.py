@@ -0,0 +1,23 @@
+from checkout import Checkout
+from services import ShopService
+
+
+def test_sales_are_costed_from_the_oldest_lots_first(db):
+    service = ShopService(db.c)
+    service.restock([("Kettle", 5, 10.0, 25.0)], date_added="2024-09-01")
+    service.restock([("Kettle", 5, 12.0, None)], date_added="2024-09-02")
+    service.restock([("Kettle", 2, None, None)], date_added="2024-09-03")
+
+    Checkout(db.c).place_order([("Kettle", 7)], date_of_sale="2024-09-04")
+    assert db.c.execute("SELECT cogs FROM sales").fetchall() == [(5 * 10.0 + 2 * 12.0,)]
+    assert db.c.execute("SELECT stock_id, quantity, unit_cost FROM sale_lots ORDER BY stock_id").fetchall() == [
+        (1, 5, 10.0), (2, 2, 12.0)]
+
+    # Reaches the lot without a cost, so this sale's cost is unknown
+    Checkout(db.c).place_order([("Kettle", 4)], date_of_sale="2024-09-04")
+    assert db.c.execute("SELECT cogs FROM sales ORDER BY id").fetchall() == [(74.0,), (None,)]
+    assert db.c.execute("SELECT remaining FROM stock ORDER BY id").fetchall() == [(0,), (0,), (1,)]
+    assert db.c.execute("SELECT on_hand FROM inventory").fetchall() == [(1,)]
+    # Margins only count the sales whose cost is known
+    assert db.c.execute("SELECT revenue, costed_revenue, cogs FROM sales_daily").fetchall() == [
+        (11 * 25.0, 7 * 25.0, 74.0)]
@@ -0,0 +1,17 @@
+import gc
+import weakref
+
+from managers import get_manager
+
+
+def test_managers_go_with_their_connection(db):
+    conn = db.pool._connect()
+    stock = get_manager("stock", conn)
+    assert get_manager("stock", conn) is stock
+    assert get_manager("sales", conn) is not stock
+
+    conn.close()
+    conn = weakref.ref(conn)
+    del stock
+    gc.collect()
+    assert conn() is None
@@ -0,0 +1,39 @@
+import sqlite3
+
+from catalog import get_catalog
+from checkout import Checkout
+from query_cache import query_cache
+from services import ShopService
+
+PRICES = "SELECT product_name, price FROM products ORDER BY id"
+
+
+def test_writes_from_another_connection_are_seen(stocked_db):
+    assert query_cache.fetchall(stocked_db.c, PRICES, tables=("products",))[0] == ("Apple iPhone 14", 999.99)
+    assert "Apple iPhone 14" in get_catalog(stocked_db.c).by_name
+    hits = query_cache.hits
+    assert query_cache.fetchall(stocked_db.c, PRICES, tables=("products",))[0] == ("Apple iPhone 14", 999.99)
+    assert query_cache.hits == hits + 1
+
+    # As another process would: its own connection, and no invalidate() in this one
+    other = sqlite3.connect(stocked_db.pool.db_name)
+    ShopService(other.cursor()).restock([("Apple iPhone 14", 0, None, 949.99), ("Google Pixel 8", 5, 450.0, 699.0)],
+                                        update_prices=True)
+    other.close()
+
+    assert query_cache.fetchall(stocked_db.c, PRICES, tables=("products",))[0] == ("Apple iPhone 14", 949.99)
+    assert get_catalog(stocked_db.c).by_name["Google Pixel 8"][1] == 699.0
+
+
+def test_writes_to_other_tables_keep_cached_products(stocked_db):
+    catalog = get_catalog(stocked_db.c)
+    query_cache.fetchall(stocked_db.c, PRICES, tables=("products",))
+
+    other = sqlite3.connect(stocked_db.pool.db_name)
+    Checkout(other.cursor()).place_order([("Apple iPhone 14", 1)])
+    other.close()
+
+    hits = query_cache.hits
+    query_cache.fetchall(stocked_db.c, PRICES, tables=("products",))
+    assert query_cache.hits == hits + 1
+    assert get_catalog(stocked_db.c) is catalog
@@ -0,0 +1,11 @@
+from query_stats import query_stats
+
+
+def test_slow_executemany_is_explained(stocked_db, monkeypatch):
+    monkeypatch.setattr(query_stats, "slow_query_ms", 0.0)
+    query_stats.reset()
+    stocked_db.c.executemany("UPDATE products SET price = ? WHERE id = ?", [(1.0, 1), (2.0, 2)])
+    entry = [entry for entry in query_stats.slow_log if entry["sql"].startswith("UPDATE products")][-1]
+    assert entry["rows"] == 2
+    assert any("products" in step for step in entry["plan"])
+    query_stats.reset()
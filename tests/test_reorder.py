@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+
+import pytest
+
+from checkout import Checkout
+from reorder import ALPHA, ReorderLevels, fold_sales
+from services import ShopService
+
+
+def test_velocity_is_an_ewma_of_units_per_day():
+    day = date(2024, 9, 1)
+    rate, rate_date = fold_sales(0.0, None, [(day, 10)])
+    assert (rate, rate_date) == (pytest.approx(ALPHA * 10), day)
+    # Two days later: decayed for both days, then the new day's units added
+    rate, rate_date = fold_sales(rate, rate_date, [(day + timedelta(days=2), 4)])
+    assert rate == pytest.approx(ALPHA * 10 * (1 - ALPHA) ** 2 + ALPHA * 4)
+    # A backdated sale is added with the decay it would have had by now
+    backdated, _ = fold_sales(rate, rate_date, [(day + timedelta(days=1), 3)])
+    assert backdated == pytest.approx(rate + ALPHA * 3 * (1 - ALPHA))
+
+
+def test_alerts_follow_sales_restocks_and_time(stocked_db):
+    today = date.today()
+    Checkout(stocked_db.c).place_order([("Apple iPhone 14", 8)], date_of_sale=today.isoformat())
+    # 8 units today give a rate of ALPHA * 8 a day, against a reorder point of 14 days' sales
+    (name, on_hand, rate, days_of_cover, reorder_point, _, _), = ReorderLevels(stocked_db.c).alerts()
+    assert (name, on_hand) == ("Apple iPhone 14", 2)
+    assert (rate, days_of_cover, reorder_point) == pytest.approx((ALPHA * 8, 2 / (ALPHA * 8), ALPHA * 8 * 14))
+
+    ShopService(stocked_db.c).restock([("Apple iPhone 14", 20, 600.0, None)])
+    assert ReorderLevels(stocked_db.c).alerts() == []
+
+    Checkout(stocked_db.c).place_order([("Apple iPhone 14", 20)], date_of_sale=today.isoformat())
+    assert [alert[0] for alert in ReorderLevels(stocked_db.c).alerts()] == ["Apple iPhone 14"]
+    # Nothing to refresh until the rates have decayed, so viewing the alerts writes nothing
+    assert ReorderLevels(stocked_db.c).stale_alerts() == []
+    # A product that stops selling decays below its reorder point and the alert clears
+    later = ReorderLevels(stocked_db.c, today=today + timedelta(days=60))
+    assert later.refresh_alerts() == [1]
+    assert later.alerts() == []
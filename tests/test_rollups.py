@@ -0,0 +1,24 @@
+import sqlite3
+
+from data_importer import DataImporter
+from db_manager import migrate
+from rollups import SalesRollup
+
+
+def test_sales_without_a_date_stay_out_of_the_rollup(shop_dir):
+    conn = sqlite3.connect(shop_dir / "legacy.db")
+    migrate(conn, target_version=4)
+    conn.execute("INSERT INTO products (product_name, price) VALUES ('Kettle', 25.0)")
+    # A blank date cell, as the importer of the time stored it
+    conn.executemany("INSERT INTO sales (product_id, date_of_sale, quantity, total) VALUES (1, ?, 1, 25.0)",
+                     [("2024-09-02",), (None,)])
+    conn.commit()
+    migrate(conn)
+    assert conn.execute("SELECT date, qty FROM sales_daily").fetchall() == [("2024-09-02", 1)]
+
+    (shop_dir / "sales.csv").write_text("date_of_sale,product_name,price,quantity,total\n"
+                                        ",Kettle,25.0,2,50.0\n2024-09-02,Kettle,25.0,1,25.0\n")
+    DataImporter(conn.cursor()).bulk_import(str(shop_dir / "sales.csv"))
+    assert conn.execute("SELECT date, qty FROM sales_daily").fetchall() == [("2024-09-02", 2)]
+    SalesRollup(conn.cursor()).rebuild()
+    assert SalesRollup(conn.cursor()).check() == []
@@ -0,0 +1,55 @@
+import pytest
+
+from sale_queue import JournalBusy, SaleQueue, get_sale_queue
+
+
+def test_a_sale_that_cannot_be_written_does_not_hold_up_the_queue(stocked_db):
+    queue = SaleQueue(stocked_db.pool.db_name, durable=False)
+    try:
+        # JSON keeps the object, but SQLite cannot store it
+        queue.submit([("Apple iPhone 14", 1)], {"name": "Asha"})
+        queue.submit([("Samsung Galaxy S23", 2)], "Ravi")
+        assert queue.flush(timeout=10)
+        assert queue.pending() == 0
+    finally:
+        queue.close(timeout=10)
+
+    assert [(seq, "type 'dict' is not supported" in error) for seq, _, error, _ in queue.rejects()] == [(1, True)]
+    assert stocked_db.c.execute("SELECT customer_name, total FROM orders").fetchall() == [("Ravi", 1799.98)]
+    assert stocked_db.c.execute("SELECT on_hand FROM inventory ORDER BY product_id").fetchall() == [(10,), (8,)]
+
+
+def test_the_journal_is_only_emptied_after_a_synced_commit(stocked_db):
+    queue = SaleQueue(stocked_db.pool.db_name)
+    try:
+        # FULL syncs the WAL on every commit; NORMAL only at checkpoints
+        assert queue._conn.execute("PRAGMA synchronous").fetchone()[0] == 2
+        queue.submit([("Apple iPhone 14", 1)], "Asha")
+        assert queue.flush(timeout=10)
+    finally:
+        queue.close(timeout=10)
+    assert queue._conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+    assert open(queue.path, "rb").read() == b""
+
+
+def test_only_one_queue_at_a_time_holds_the_journal(stocked_db):
+    queue = SaleQueue(stocked_db.pool.db_name, durable=False)
+    try:
+        first = queue.submit([("Apple iPhone 14", 1)], "Asha")[0]
+        with pytest.raises(JournalBusy):
+            SaleQueue(stocked_db.pool.db_name, durable=False)
+        # Sales are then committed directly
+        assert get_sale_queue(stocked_db.pool.db_name) is None
+    finally:
+        queue.close(timeout=10)
+
+    queue = SaleQueue(stocked_db.pool.db_name, durable=False)
+    try:
+        second = queue.submit([("Apple iPhone 14", 1)], "Ravi")[0]
+        assert queue.flush(timeout=10)
+    finally:
+        queue.close(timeout=10)
+    # Numbers come from the database, so a later queue never hands one out again
+    assert second > first
+    assert stocked_db.c.execute("SELECT applied_seq, reserved_seq >= ? FROM sale_queue", (second,)).fetchone() == (
+        second, 1)